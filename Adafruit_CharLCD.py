@@ -7,6 +7,33 @@
 #
 
 from time import sleep
+from clock import monotonic
+
+class HD44780Timing:
+    """ Execution times of a HD44780 panel in microseconds
+
+    Defaults are the datasheet values at 270kHz. Slower clones can be given
+    a scale factor, or individual times can be overridden per panel, eg
+    HD44780Timing(scale=1.5) or HD44780Timing(slow_us=2000)
+    """
+
+    def __init__(self, scale=1.0, **times):
+	self.init_us = 4100		# wait after each 8 bit initialization command
+	self.command_us = 37		# most instructions
+	self.data_us = 41		# data write, 37us plus the address counter update
+	self.slow_us = 1520		# clear display and return home
+	self.enable_pulse_us = 0	# enable pulse must be > 450ns, a GPIO call already takes longer
+	self.spin_us = 200		# waits shorter than this busy-wait instead of sleeping
+	self.busy_timeout_us = 10000	# give up polling the busy flag after this long
+
+	for name, value in times.items():
+	    if not hasattr(self, name):
+		raise AttributeError("unknown HD44780 timing '%s'" % name)
+	    setattr(self, name, value)
+
+	for name in ('init_us', 'command_us', 'data_us', 'slow_us'):
+	    setattr(self, name, getattr(self, name) * scale)
+
 
 class Adafruit_CharLCD:
 
@@ -54,7 +81,7 @@ class Adafruit_CharLCD:
 
 
 
-    def __init__(self, pin_rs=25, pin_e=24, pins_db=[23, 17, 21, 22], GPIO = None):
+    def __init__(self, pin_rs=25, pin_e=24, pins_db=[23, 17, 21, 22], GPIO = None, pin_rw=None, timing=None):
 	# Emulate the old behavior of using RPi.GPIO if we haven't been given
 	# an explicit GPIO interface to use
 	if not GPIO:
@@ -63,17 +90,44 @@ class Adafruit_CharLCD:
         self.pin_rs = pin_rs
         self.pin_e = pin_e
         self.pins_db = pins_db
+	self.pin_rw = pin_rw	# only set when RW is wired, enables busy flag polling
+
+	self.timing = timing or HD44780Timing()
+	self.busyflag = False	# the busy flag can not be read until 4 bit mode is set
+	self.ready_at = 0	# monotonic time the controller is ready for the next write
+	self.waited = 0.0	# seconds spent waiting for the controller, for stats.py
 
         self.GPIO.setmode(GPIO.BCM)
         self.GPIO.setup(self.pin_e, GPIO.OUT)
         self.GPIO.setup(self.pin_rs, GPIO.OUT)
 
+	if self.pin_rw is not None:
+	    self.GPIO.setup(self.pin_rw, GPIO.OUT)
+	    self.GPIO.output(self.pin_rw, False)
+
         for pin in self.pins_db:
             self.GPIO.setup(pin, GPIO.OUT)
 
-	self.write4bits(0x33) # initialization
-	self.write4bits(0x32) # initialization
+	# data pin levels for every nibble value, pins_db[0] carries the lowest bit
+	self.nibble_levels = [tuple([bool(nibble & (1 << i)) for i in range(4)]) for nibble in range(16)]
+
+	self.GPIO.output(self.pin_e, False)
+	self.GPIO.output(self.pin_rs, False)
+	self.rs_level = False
+	self.db_levels = None	# levels currently on the data pins, None if unknown
+	self.batch_output = self.supportsBatchOutput()
+
+	# 8 bit mode: every nibble is an instruction of its own and the first one
+	# needs more than 4.1ms, so each gets the full initialization wait
+	for nibble in (0x3, 0x3, 0x3, 0x2):
+	    self.waitMicroseconds(self.timing.init_us)
+	    self.waitReady()
+	    self.writeNibble(nibble)
+	self.waitMicroseconds(self.timing.init_us)
+
 	self.write4bits(0x28) # 2 line 5x7 matrix
+
+	self.busyflag = self.pin_rw is not None
 	self.write4bits(0x0C) # turn cursor off 0x0E to enable cursor
 	self.write4bits(0x06) # shift cursor right
 
@@ -99,14 +153,12 @@ class Adafruit_CharLCD:
 
     def home(self):
 
-	self.write4bits(self.LCD_RETURNHOME) # set cursor position to zero
-	self.delayMicroseconds(3000) # this command takes a long time!
+	self.write4bits(self.LCD_RETURNHOME) # set cursor position to zero, the next write waits for it
 	
 
     def clear(self):
 
-	self.write4bits(self.LCD_CLEARDISPLAY) # command to clear display
-	self.delayMicroseconds(3000)	# 3000 microsecond sleep, clearing the display takes a long time
+	self.write4bits(self.LCD_CLEARDISPLAY) # command to clear display, the next write waits for it
 
 
     def setCursor(self, col, row):
@@ -203,43 +255,141 @@ class Adafruit_CharLCD:
     def write4bits(self, bits, char_mode=False):
         """ Send command to LCD """
 
-	self.delayMicroseconds(1000) # 1000 microsecond sleep
+	# how long this instruction keeps the controller busy
+	if char_mode:
+	    execution_us = self.timing.data_us
+	elif bits == self.LCD_CLEARDISPLAY or (bits & 0xFE) == self.LCD_RETURNHOME:
+	    execution_us = self.timing.slow_us
+	else:
+	    execution_us = self.timing.command_us
 
-        bits=bin(bits)[2:].zfill(8)
+	self.waitReady()
 
-        self.GPIO.output(self.pin_rs, char_mode)
+	if char_mode != self.rs_level:
+	    self.GPIO.output(self.pin_rs, char_mode)
+	    self.rs_level = char_mode
 
-        for pin in self.pins_db:
-            self.GPIO.output(pin, False)
+	self.writeNibble(bits >> 4)
+	self.writeNibble(bits & 0x0F)
 
-        for i in range(4):
-            if bits[i] == "1":
-                self.GPIO.output(self.pins_db[::-1][i], True)
+	self.waitMicroseconds(execution_us)
 
-	self.pulseEnable()
 
-        for pin in self.pins_db:
-            self.GPIO.output(pin, False)
+    def writeNibble(self, nibble):
+	""" Put a nibble on the data pins, changing only what differs, and clock it in """
 
-        for i in range(4,8):
-            if bits[i] == "1":
-                self.GPIO.output(self.pins_db[::-1][i-4], True)
+	levels = self.nibble_levels[nibble]
+
+	if levels != self.db_levels:
+	    if self.batch_output:
+		self.GPIO.output(self.pins_db, levels)
+	    else:
+		for i in range(4):
+		    if self.db_levels is None or levels[i] != self.db_levels[i]:
+			self.GPIO.output(self.pins_db[i], levels[i])
+
+	    self.db_levels = levels
 
 	self.pulseEnable()
 
 
+    def supportsBatchOutput(self):
+	""" RPi.GPIO 0.5.8 and later can set a list of channels in one call """
+
+	try:
+	    self.GPIO.output(self.pins_db, self.nibble_levels[0])
+	except (TypeError, ValueError):
+	    return False
+
+	self.db_levels = self.nibble_levels[0]
+	return True
+
+
     def delayMicroseconds(self, microseconds):
 	seconds = microseconds / float(1000000)	# divide microseconds by 1 million for seconds
+	self.waited += seconds
 	sleep(seconds)
 
 
+    def waitMicroseconds(self, microseconds):
+	""" Make the next write wait until 'microseconds' from now have passed """
+
+	self.ready_at = monotonic() + microseconds / 1000000.0
+
+
+    def waitReady(self):
+	""" Wait until the controller has finished the previous instruction """
+
+	if self.busyflag:
+	    self.waitBusyFlag()
+	    return
+
+	remaining = self.ready_at - monotonic()
+
+	if remaining <= 0:
+	    return
+
+	self.waited += remaining
+
+	if remaining * 1000000 > self.timing.spin_us:
+	    sleep(remaining)
+	else:
+	    # sleep() overshoots short waits by far more than the wait itself
+	    while monotonic() < self.ready_at:
+		pass
+
+
+    def waitBusyFlag(self):
+	""" Poll the busy flag (DB7) until the controller accepts instructions """
+
+	for pin in self.pins_db:
+	    self.GPIO.setup(pin, self.GPIO.IN)
+
+	self.GPIO.output(self.pin_rs, False)
+	self.GPIO.output(self.pin_rw, True)
+
+	deadline = monotonic() + self.timing.busy_timeout_us / 1000000.0
+
+	while True:
+	    # in 4 bit mode the flag comes with the high nibble, the low nibble still has to be clocked out
+	    self.GPIO.output(self.pin_e, True)
+	    busy = self.GPIO.input(self.pins_db[3])
+	    self.GPIO.output(self.pin_e, False)
+	    self.GPIO.output(self.pin_e, True)
+	    self.GPIO.output(self.pin_e, False)
+
+	    if not busy or monotonic() > deadline:
+		break
+
+	self.GPIO.output(self.pin_rw, False)
+	self.rs_level = False
+
+	for pin in self.pins_db:
+	    self.GPIO.setup(pin, self.GPIO.OUT)
+
+	self.db_levels = None
+
+
     def pulseEnable(self):
-	self.GPIO.output(self.pin_e, False)
-	self.delayMicroseconds(1)		# 1 microsecond pause - enable pulse must be > 450ns 
+	# enable is always left low, so the pulse starts by raising it
 	self.GPIO.output(self.pin_e, True)
-	self.delayMicroseconds(1)		# 1 microsecond pause - enable pulse must be > 450ns 
+	if self.timing.enable_pulse_us:
+	    self.delayMicroseconds(self.timing.enable_pulse_us)
 	self.GPIO.output(self.pin_e, False)
-	self.delayMicroseconds(1)		# commands need > 37us to settle
+
+
+    def createChar(self, location, pattern):
+	""" Fill CGRAM location 0-7 with a custom character, 8 rows of 5 bits
+
+	Character code 'location' shows it. The address counter is left in CGRAM,
+	so call setCursor before writing text again
+	"""
+
+	location &= 0x7
+	self.write4bits(self.LCD_SETCGRAMADDR | (location << 3))
+
+	for row in pattern:
+	    self.write4bits(row & 0x1F, True)
 
 
     def message(self, text):
@@ -1,33 +1,87 @@
 #!/usr/bin/python
 
-import smbus
+from time import sleep
 
 # ===========================================================================
 # Adafruit_I2C Base Class
 # ===========================================================================
+#
+# Buses are opened the first time a device uses them and shared by every
+# device on the same bus, so importing this module touches no hardware.
+# Failed transactions are retried with a growing delay and then raise
+# I2CError, instead of returning -1, which could just as well be data.
+
+# attempts per transaction and the delay before the first retry, doubled every retry
+RETRIES = 3
+BACKOFF = .01
+
+# most bytes a single SMBus block transaction can carry
+BLOCK_SIZE = 32
+
+class I2CError(IOError):
+  pass
+
+def getPiRevision():
+  "Gets the version number of the Raspberry Pi board"
+  # Courtesy quick2wire-python-api
+  # https://github.com/quick2wire/quick2wire-python-api
+  try:
+    with open('/proc/cpuinfo','r') as f:
+      for line in f:
+        if line.startswith('Revision'):
+          return 1 if line.rstrip()[-1] in ['1','2'] else 2
+  except:
+    return 0
+
+def defaultBusNumber():
+  "I2C0 on early 256MB Pi's, I2C1 on everything since"
+  return 1 if getPiRevision() > 1 else 0
+
+# open buses by bus number
+buses = {}
+
+def getBus(number=None):
+  "Returns the shared bus for 'number', opening it on first use"
+  if (number == None):
+    number = defaultBusNumber()
+  if (number not in buses):
+    import smbus
+    buses[number] = smbus.SMBus(number)
+  return buses[number]
 
 class Adafruit_I2C :
 
-  def getPiRevision():
-    "Gets the version number of the Raspberry Pi board"
-    # Courtesy quick2wire-python-api
-    # https://github.com/quick2wire/quick2wire-python-api
-    try:
-      with open('/proc/cpuinfo','r') as f:
-        for line in f:
-          if line.startswith('Revision'):
-            return 1 if line.rstrip()[-1] in ['1','2'] else 2
-    except:
-      return 0
- 
-  def __init__(self, address, bus=smbus.SMBus(1 if getPiRevision() > 1 else 0), debug=False):
+  getPiRevision = staticmethod(getPiRevision)
+
+  def __init__(self, address, bus=None, debug=False, busnum=None, retries=RETRIES):
     self.address = address
-	# By default, the correct I2C bus is auto-detected using /proc/cpuinfo
-    self.bus = bus
-	# Alternatively, you can hard-code the bus version below:
-	# self.bus = smbus.SMBus(0); # Force I2C0 (early 256MB Pi's)
-    # self.bus = smbus.SMBus(1); # Force I2C1 (512MB Pi's)
+    # By default the bus is auto-detected using /proc/cpuinfo and opened on first use.
+    # Alternatively, an open bus can be passed in or the bus number hard-coded:
+    # busnum=0 forces I2C0 (early 256MB Pi's), busnum=1 I2C1 (512MB Pi's)
+    if (bus != None):
+      self.bus = bus
+    self.busnum = busnum
     self.debug = debug
+    self.retries = retries
+
+  def __getattr__(self, name):
+    # only reached while self.bus is not set yet
+    if (name == 'bus'):
+      self.bus = getBus(self.busnum)
+      return self.bus
+    raise AttributeError(name)
+
+  def transaction(self, function, *args):
+    "Runs a bus transaction, retrying with backoff before giving up"
+    delay = BACKOFF
+    for attempt in range(self.retries):
+      try:
+        return function(self.address, *args)
+      except IOError, err:
+        if (attempt == self.retries - 1):
+          raise I2CError("Error accessing 0x%02X: Check your I2C address (%s)" % (self.address, err))
+        sleep(delay)
+        delay *= 2
 
   def reverseByteOrder(self, data):
     "Reverses the byte order of an int (16-bit) or long (32-bit) value"
@@ -41,87 +95,70 @@ class Adafruit_I2C :
       data >>= 8
     return val
 
+  def writeRaw8(self, value):
+    "Writes an 8-bit value on the bus, for devices without registers"
+    self.transaction(self.bus.write_byte, value)
+    if (self.debug):
+      print "I2C: Wrote 0x%02X" % value
+
   def write8(self, reg, value):
     "Writes an 8-bit value to the specified register/address"
-    try:
-      self.bus.write_byte_data(self.address, reg, value)
-      if (self.debug):
-        print "I2C: Wrote 0x%02X to register 0x%02X" % (value, reg)
-    except IOError, err:
-      print "Error accessing 0x%02X: Check your I2C address" % self.address
-      return -1
+    self.transaction(self.bus.write_byte_data, reg, value)
+    if (self.debug):
+      print "I2C: Wrote 0x%02X to register 0x%02X" % (value, reg)
 
   def writeList(self, reg, list):
     "Writes an array of bytes using I2C format"
-    try:
-      if (self.debug):
-        print "I2C: Writing list to register 0x%02X:" % reg
-        print list
-      self.bus.write_i2c_block_data(self.address, reg, list)
-    except IOError, err:
-      print "Error accessing 0x%02X: Check your I2C address" % self.address
-      return -1
+    if (self.debug):
+      print "I2C: Writing list to register 0x%02X:" % reg
+      print list
+    self.transaction(self.bus.write_i2c_block_data, reg, list)
 
   def readList(self, reg, length):
     "Read a list of bytes from the I2C device"
-    results = []
-    try:
-      results = self.bus.read_i2c_block_data(self.address, reg, length)
-      if (self.debug):
-        print "I2C: Device 0x%02X returned the following from reg 0x%02X" % (self.address, reg)
-        print results
-      return results
-    except IOError, err:
-      print "Error accessing 0x%02X: Check your I2C address" % self.address
-      return -1
+    results = self.transaction(self.bus.read_i2c_block_data, reg, length)
+    if (self.debug):
+      print "I2C: Device 0x%02X returned the following from reg 0x%02X" % (self.address, reg)
+      print results
+    return results
+
+  def readRegisterMap(self, reg, length):
+    "Reads 'length' consecutive registers with as few block reads as possible, as a dict of register to value"
+    # the device has to advance its register pointer on reads, most sensors do
+    registers = {}
+    for start in range(reg, reg + length, BLOCK_SIZE):
+      count = min(BLOCK_SIZE, reg + length - start)
+      for offset, value in enumerate(self.readList(start, count)):
+        registers[start + offset] = value
+    return registers
 
   def readU8(self, reg):
     "Read an unsigned byte from the I2C device"
-    try:
-      result = self.bus.read_byte_data(self.address, reg)
-      if (self.debug):
-        print "I2C: Device 0x%02X returned 0x%02X from reg 0x%02X" % (self.address, result & 0xFF, reg)
-      return result
-    except IOError, err:
-      print "Error accessing 0x%02X: Check your I2C address" % self.address
-      return -1
+    result = self.transaction(self.bus.read_byte_data, reg)
+    if (self.debug):
+      print "I2C: Device 0x%02X returned 0x%02X from reg 0x%02X" % (self.address, result & 0xFF, reg)
+    return result
 
   def readS8(self, reg):
     "Reads a signed byte from the I2C device"
-    try:
-      result = self.bus.read_byte_data(self.address, reg)
-      if (self.debug):
-        print "I2C: Device 0x%02X returned 0x%02X from reg 0x%02X" % (self.address, result & 0xFF, reg)
-      if (result > 127):
-        return result - 256
-      else:
-        return result
-    except IOError, err:
-      print "Error accessing 0x%02X: Check your I2C address" % self.address
-      return -1
+    result = self.readU8(reg)
+    if (result > 127):
+      return result - 256
+    else:
+      return result
 
   def readU16(self, reg):
-    "Reads an unsigned 16-bit value from the I2C device"
-    try:
-      hibyte = self.bus.read_byte_data(self.address, reg)
-      result = (hibyte << 8) + self.bus.read_byte_data(self.address, reg+1)
-      if (self.debug):
-        print "I2C: Device 0x%02X returned 0x%04X from reg 0x%02X" % (self.address, result & 0xFFFF, reg)
-      return result
-    except IOError, err:
-      print "Error accessing 0x%02X: Check your I2C address" % self.address
-      return -1
+    "Reads an unsigned 16-bit value from the I2C device, high byte first, in one block read"
+    hibyte, lobyte = self.transaction(self.bus.read_i2c_block_data, reg, 2)
+    result = (hibyte << 8) + lobyte
+    if (self.debug):
+      print "I2C: Device 0x%02X returned 0x%04X from reg 0x%02X" % (self.address, result & 0xFFFF, reg)
+    return result
 
   def readS16(self, reg):
-    "Reads a signed 16-bit value from the I2C device"
-    try:
-      hibyte = self.bus.read_byte_data(self.address, reg)
-      if (hibyte > 127):
-        hibyte -= 256
-      result = (hibyte << 8) + self.bus.read_byte_data(self.address, reg+1)
-      if (self.debug):
-        print "I2C: Device 0x%02X returned 0x%04X from reg 0x%02X" % (self.address, result & 0xFFFF, reg)
+    "Reads a signed 16-bit value from the I2C device, high byte first, in one block read"
+    result = self.readU16(reg)
+    if (result > 32767):
+      return result - 65536
+    else:
       return result
-    except IOError, err:
-      print "Error accessing 0x%02X: Check your I2C address" % self.address
-      return -1
@@ -0,0 +1,230 @@
+#!/usr/bin/python
+
+#
+# HD44780 character lcd on an I2C backpack (PCF8574 or MCP23017 port expander)
+#
+# Same API as Adafruit_CharLCD. Every pin change is a byte written to the
+# expander, so instead of one bus transaction per change the nibbles and
+# enable strobes of a whole string are queued as port states and sent with
+# block writes, up to 32 states per transaction. A 32 character frame takes
+# a handful of transactions. At 100kHz one byte takes longer than the lcd
+# needs for an instruction, so only clear, home and the initialization
+# sequence have to be waited for.
+#
+
+from Adafruit_I2C import Adafruit_I2C
+from Adafruit_CharLCD import Adafruit_CharLCD, HD44780Timing
+
+# most states an SMBus block write can carry
+BLOCK_SIZE = 32
+
+
+class PCF8574:
+    """ The common blue backpack: P0 RS, P1 RW, P2 E, P3 backlight, P4-P7 D4-D7
+
+    The PCF8574 has no registers, every byte written becomes the port state,
+    so a block write is the first state as the 'register' and the rest as data
+    """
+
+    address = 0x27
+    rs = 0x01
+    rw = 0x02
+    e = 0x04
+    backlight = 0x08
+    data = (0x10, 0x20, 0x40, 0x80)
+
+    def __init__(self, i2c):
+	self.i2c = i2c
+
+    def begin(self):
+	pass
+
+    def send(self, states):
+	if len(states) == 1:
+	    self.i2c.writeRaw8(states[0])
+	else:
+	    self.i2c.writeList(states[0], states[1:])
+
+
+class MCP23017:
+    """ Adafruit's RGB lcd plate: port B, B7 RS, B6 RW, B5 E, B4-B1 D4-D7
+
+    Sequential addressing is turned off so a block write to GPIOB writes
+    every byte to the port instead of walking through the registers
+    """
+
+    address = 0x20
+    rs = 0x80
+    rw = 0x40
+    e = 0x20
+    backlight = 0x00	# the plate's backlight is on other pins
+    data = (0x10, 0x08, 0x04, 0x02)
+
+    IODIRB = 0x01
+    IOCON = 0x0A
+    GPIOB = 0x13
+
+    IOCON_SEQOP = 0x20
+
+    def __init__(self, i2c):
+	self.i2c = i2c
+
+    def begin(self):
+	self.i2c.write8(self.IOCON, self.IOCON_SEQOP)
+	self.i2c.write8(self.IODIRB, 0x00)
+
+    def send(self, states):
+	self.i2c.writeList(self.GPIOB, states)
+
+
+EXPANDERS = {
+    'pcf8574': PCF8574,
+    'mcp23017': MCP23017,
+}
+
+
+class Adafruit_I2C_CharLCD(Adafruit_CharLCD):
+
+    def __init__(self, address=None, expander='pcf8574', bus=None, timing=None, backlight=True):
+	expander = EXPANDERS[expander]
+
+	if address is None:
+	    address = expander.address
+
+	self.expander = expander(Adafruit_I2C(address, bus))
+	self.GPIO = None		# no GPIO pins, see transactions
+	self.timing = timing or HD44780Timing()
+	self.busyflag = False		# RW is held low, the busy flag is never read
+	self.ready_at = 0
+	self.waited = 0.0
+	self.transactions = 0		# bus transactions so far, for stats.py
+
+	# expander port bits for every nibble value
+	self.nibble_bits = []
+	for nibble in range(16):
+	    bits = 0
+	    for i in range(4):
+		if nibble & (1 << i):
+		    bits |= self.expander.data[i]
+	    self.nibble_bits.append(bits)
+
+	self.backlight_bits = self.expander.backlight if backlight else 0
+	self.rs_level = False
+	self.pending = []		# port states waiting to be sent
+
+	self.expander.begin()
+
+	# 8 bit mode: every nibble is an instruction of its own
+	for nibble in (0x3, 0x3, 0x3, 0x2):
+	    self.waitMicroseconds(self.timing.init_us)
+	    self.queueNibble(nibble)
+	    self.flush()
+	self.waitMicroseconds(self.timing.init_us)
+
+	self.queue(0x28) # 2 line 5x7 matrix
+	self.queue(0x0C) # turn cursor off 0x0E to enable cursor
+	self.queue(0x06) # shift cursor right
+
+	self.displaycontrol = self.LCD_DISPLAYON | self.LCD_CURSOROFF | self.LCD_BLINKOFF
+
+	self.displayfunction = self.LCD_4BITMODE | self.LCD_1LINE | self.LCD_5x8DOTS
+	self.displayfunction |= self.LCD_2LINE
+
+	""" Initialize to default text direction (for romance languages) """
+	self.displaymode =  self.LCD_ENTRYLEFT | self.LCD_ENTRYSHIFTDECREMENT
+	self.queue(self.LCD_ENTRYMODESET | self.displaymode) #  set the entry mode
+
+	self.clear()
+
+
+    def write4bits(self, bits, char_mode=False):
+	""" Send command to LCD """
+
+	self.queue(bits, char_mode)
+	self.flush()
+
+
+    def queue(self, bits, char_mode=False):
+	""" Queue the port states for one instruction or character """
+
+	if char_mode != self.rs_level:
+	    # RS settles before the first enable strobe
+	    self.rs_level = char_mode
+	    self.pending.append(self.portBits())
+
+	self.queueNibble(bits >> 4)
+	self.queueNibble(bits & 0x0F)
+
+	if not char_mode and (bits == self.LCD_CLEARDISPLAY or (bits & 0xFE) == self.LCD_RETURNHOME):
+	    self.flush()
+	    self.waitMicroseconds(self.timing.slow_us)
+
+
+    def queueNibble(self, nibble):
+	""" Queue a nibble with enable high and then low, it is latched on the falling edge """
+
+	state = self.portBits() | self.nibble_bits[nibble]
+
+	self.pending.append(state | self.expander.e)
+	self.pending.append(state)
+
+
+    def portBits(self):
+	if self.rs_level:
+	    return self.expander.rs | self.backlight_bits
+
+	return self.backlight_bits
+
+
+    def flush(self):
+	""" Send the queued port states with as few block writes as possible """
+
+	if not self.pending:
+	    return
+
+	self.waitReady()
+
+	for start in range(0, len(self.pending), BLOCK_SIZE):
+	    self.expander.send(self.pending[start:start + BLOCK_SIZE])
+	    self.transactions += 1
+
+	self.pending = []
+
+
+    def setBacklight(self, on):
+	""" Switch the backlight, on backpacks that wire it to the expander """
+
+	self.backlight_bits = self.expander.backlight if on else 0
+	self.pending.append(self.portBits())
+	self.flush()
+
+
+    def createChar(self, location, pattern):
+	""" Fill CGRAM location 0-7 with a custom character in one block write """
+
+	self.queue(self.LCD_SETCGRAMADDR | ((location & 0x7) << 3))
+
+	for row in pattern:
+	    self.queue(row & 0x1F, True)
+
+	self.flush()
+
+
+    def message(self, text):
+	""" Send string to LCD. Newline wraps to second line"""
+
+	for char in text:
+	    if char == '\n':
+		self.queue(0xC0) # next line
+	    else:
+		self.queue(ord(char), True)
+
+	self.flush()
+
+
+if __name__ == '__main__':
+
+    lcd = Adafruit_I2C_CharLCD()
+
+    lcd.clear()
+    lcd.message("  Adafruit 16x2\n  I2C Backpack")
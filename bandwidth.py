@@ -0,0 +1,265 @@
+#!/usr/bin/python
+#
+# TCP bandwidth test
+#
+# A client connects to a server running the same code, asks it to receive
+# (upload) or send (download) and the data flows for a fixed time. Both sides
+# stream from one preallocated buffer, sends go out of a memoryview and
+# receives land in it with recv_into, so moving the data costs no allocations
+# or copies in python and the pi's cpu does not limit the result. The first
+# byte the client sends picks the direction, everything after is filler.
+#
+# send() returns once the kernel has the data, which on a slow link can be
+# megabytes before the peer does. Uploads count only what has left the send
+# queue while they run, and when the client is done sending the server
+# answers with the number of bytes it received, which the result is
+# computed from.
+
+import fcntl, socket, select, struct, termios
+from clock import monotonic
+
+PORT = 5001
+
+UPLOAD = 'U'
+DOWNLOAD = 'D'
+
+# seconds a client run takes, bytes per send or receive, seconds between rate
+# reports and between checks for cancel while the socket blocks
+DURATION = 10
+BUFFER_SIZE = 128 * 1024
+REPORT_INTERVAL = .5
+POLL_TIME = .25
+
+# seconds an upload waits for the server's byte count, the send queue drains first
+RESULT_TIMEOUT = 30
+
+# the server's byte count after an upload
+RESULT = struct.Struct('!Q')
+
+class Meter:
+
+	# count bytes moved and report the rate every interval. report(bps, total,
+	# elapsed) gets the rate over the last interval
+	def __init__(self, report=None, interval=REPORT_INTERVAL):
+		self.report = report
+		self.interval = interval
+		self.start = monotonic()
+		self.end = None
+		self.total = 0
+		self.mark = (self.start, 0)
+
+	# 'count' more bytes moved, 'queued' of all bytes so far are still waiting in
+	# the send queue and do not count for the rate yet
+	def add(self, count, queued=0):
+		self.total += count
+		now = monotonic()
+		then, total = self.mark
+
+		if ((now - then) >= self.interval):
+			delivered = self.total - queued
+			self.mark = (now, delivered)
+
+			if (self.report != None):
+				self.report((delivered - total) * 8 / (now - then), delivered, now - self.start)
+
+	def stop(self):
+		self.end = monotonic()
+
+	def elapsed(self):
+		return (self.end or monotonic()) - self.start
+
+	# average bits per second over the whole run
+	def average(self):
+		if (self.elapsed() <= 0):
+			return 0.0
+
+		return self.total * 8 / self.elapsed()
+
+# a buffer to stream from and into, filled with something other than zeros in
+# case a link compresses
+def makeBuffer(size=BUFFER_SIZE):
+	return bytearray(''.join([chr(i & 0xFF) for i in range(size)]))
+
+# bytes in a socket's send queue that the peer has not acknowledged yet, 0 when
+# the kernel can not tell
+def unsent(sock):
+	try:
+		return struct.unpack('i', fcntl.ioctl(sock.fileno(), termios.TIOCOUTQ, '\0' * 4))[0]
+	except (IOError, AttributeError):
+		return 0
+
+# send the buffer over and over until 'duration' is up, the peer goes away or
+# cancelled() returns True
+def sendLoop(sock, meter, duration=None, cancelled=None, buffer=None):
+	view = memoryview(buffer or makeBuffer())
+	deadline = None
+
+	if (duration != None):
+		deadline = monotonic() + duration
+
+	sock.settimeout(POLL_TIME)
+
+	while True:
+		if ((deadline != None) and (monotonic() >= deadline)):
+			break
+
+		if ((cancelled != None) and cancelled()):
+			break
+
+		try:
+			meter.add(sock.send(view), unsent(sock))
+		except socket.timeout:
+			continue
+		except socket.error:
+			break
+
+# receive into the buffer until the peer closes, 'duration' is up or cancelled()
+# returns True
+def receiveLoop(sock, meter, duration=None, cancelled=None, buffer=None):
+	buffer = buffer or makeBuffer()
+	deadline = None
+
+	if (duration != None):
+		deadline = monotonic() + duration
+
+	sock.settimeout(POLL_TIME)
+
+	while True:
+		if ((deadline != None) and (monotonic() >= deadline)):
+			break
+
+		if ((cancelled != None) and cancelled()):
+			break
+
+		try:
+			count = sock.recv_into(buffer)
+		except socket.timeout:
+			continue
+		except socket.error:
+			break
+
+		if (count == 0):
+			break
+
+		meter.add(count)
+
+# test against a server for 'duration' seconds, uploading or downloading.
+# returns the Meter of the run
+def client(host, port=PORT, direction=UPLOAD, duration=DURATION, report=None, cancelled=None):
+	sock = socket.create_connection((host, port), 5)
+
+	try:
+		sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		sock.sendall(direction)
+
+		meter = Meter(report)
+
+		if (direction == UPLOAD):
+			sendLoop(sock, meter, duration, cancelled)
+
+			# the server answers with what it received once it has it all
+			sock.shutdown(socket.SHUT_WR)
+			received = receivedCount(sock, cancelled)
+
+			if (received == None):
+				received = meter.total - unsent(sock)
+
+			meter.total = received
+		else:
+			receiveLoop(sock, meter, duration, cancelled)
+
+		meter.stop()
+	finally:
+		sock.close()
+
+	return meter
+
+# the byte count the server sends at the end of an upload, None if it does not
+# come or the wait is cancelled
+def receivedCount(sock, cancelled=None):
+	sock.settimeout(POLL_TIME)
+	deadline = monotonic() + RESULT_TIMEOUT
+	data = ''
+
+	while ((len(data) < RESULT.size) and (monotonic() < deadline)):
+		if ((cancelled != None) and cancelled()):
+			return None
+
+		try:
+			chunk = sock.recv(RESULT.size - len(data))
+		except socket.timeout:
+			continue
+		except socket.error:
+			return None
+
+		if (chunk == ''):
+			return None
+
+		data += chunk
+
+	if (len(data) < RESULT.size):
+		return None
+
+	return RESULT.unpack(data)[0]
+
+# serve clients one at a time until cancelled() returns True
+#
+# connected(address, direction) is called as a client starts and finished(address,
+# direction, meter) when it is done, report(bps, total, elapsed) while it runs
+def serve(port=PORT, report=None, cancelled=None, connected=None, finished=None, address=''):
+	listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	listener.bind((address, port))
+	listener.listen(1)
+
+	buffer = makeBuffer()
+
+	try:
+		while True:
+			if ((cancelled != None) and cancelled()):
+				break
+
+			if (not select.select([listener], [], [], POLL_TIME)[0]):
+				continue
+
+			sock, peer = listener.accept()
+
+			try:
+				sock.settimeout(5)
+				direction = sock.recv(1)
+
+				if (direction not in (UPLOAD, DOWNLOAD)):
+					continue
+
+				if (connected != None):
+					connected(peer[0], direction)
+
+				meter = Meter(report)
+
+				# the client's upload is our download, it ends when the client shuts
+				# down its side and then gets told how much arrived
+				if (direction == UPLOAD):
+					receiveLoop(sock, meter, cancelled=cancelled, buffer=buffer)
+					sock.sendall(RESULT.pack(meter.total))
+				else:
+					sendLoop(sock, meter, cancelled=cancelled, buffer=buffer)
+
+				meter.stop()
+
+				if (finished != None):
+					finished(peer[0], direction, meter)
+			except socket.error:
+				pass
+			finally:
+				sock.close()
+	finally:
+		listener.close()
+
+# a rate in Mbit/s as text, eg 94.3
+def formatMbps(bps):
+	mbps = bps / 1e6
+
+	if (mbps < 999.95):
+		return '%.1f' % mbps
+
+	return '%.0f' % mbps
@@ -0,0 +1,249 @@
+#!/usr/bin/python
+#
+# Benchmarks
+#
+# usage: bench.py [-n runs] [benchmark ...]
+#
+# Every measurement is printed as one 'name value unit' line in a fixed order,
+# so the output of two versions can be compared with diff. The display and
+# navigation benchmarks run the real driver, framebuffer and menu engine on
+# the simulated GPIO and lcd, so they need no pi and count every bus cycle.
+
+import os, sys, threading
+from subprocess import Popen, PIPE
+from time import sleep
+from clock import monotonic
+from simgpio import SimGPIO
+from hd44780sim import HD44780
+from Adafruit_CharLCD import Adafruit_CharLCD
+from lcdframe import LCDFrameBuffer
+from buttonevents import ButtonEvents, PRESS, DEBOUNCE_TIME
+from menutree import Menu, MenuItem, MenuEngine
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# min, median and max of a list of numbers
+def summary(values):
+	values = sorted(values)
+
+	return (values[0], values[len(values) / 2], values[-1])
+
+def report(name, values, unit):
+	low, median, high = summary(values)
+
+	print '%s.min %.1f %s' % (name, low, unit)
+	print '%s.median %.1f %s' % (name, median, unit)
+	print '%s.max %.1f %s' % (name, high, unit)
+
+# a value that is the same on every run, like a call count
+def count(name, value, unit):
+	print '%s %.1f %s' % (name, value, unit)
+
+# start the menu 'runs' times and time how long it takes to draw the first frame
+def benchStartup(runs):
+	results = {'process': []}
+	env = dict(os.environ, PORTABLEPI_BENCH='1')
+
+	# off the pi, start it on the simulated GPIO and lcd
+	try:
+		import RPi.GPIO
+	except (ImportError, RuntimeError):
+		env['PORTABLEPI_SIM'] = '1'
+
+	for run in range(runs):
+		start = monotonic()
+
+		p = Popen([sys.executable, os.path.join(HERE, 'startmenu.py')], stdout=PIPE, env=env)
+		output = p.communicate()[0]
+
+		results['process'].append((monotonic() - start) * 1000)
+
+		if (p.returncode != 0):
+			raise RuntimeError('startmenu.py exited with %d' % p.returncode)
+
+		# 'name value unit' lines from startmenu.py itself
+		for line in output.splitlines():
+			name, value, unit = line.split()
+			results.setdefault(name, []).append(float(value))
+
+	for name in sorted(results):
+		report('startup.' + name, results[name], 'ms')
+
+# an lcd driver on a simulated GPIO with an emulated controller behind it
+def simulatedLCD():
+	gpio = SimGPIO(log=False)
+	display = HD44780(gpio)
+	lcd = Adafruit_CharLCD(GPIO=gpio)
+	lcd.begin(16, 2)
+
+	return (gpio, display, lcd)
+
+# run operation() 'repeat' times, returns operations per second, GPIO calls and
+# bus cycles per operation and the number of busy violations
+def measure(gpio, display, operation, repeat):
+	outputs = gpio.outputs
+	display.resetCounters()
+	start = monotonic()
+
+	for i in range(repeat):
+		operation(i)
+
+	elapsed = monotonic() - start
+
+	return (repeat / elapsed, float(gpio.outputs - outputs) / repeat, float(display.cycles) / repeat, display.violations)
+
+# character writes, clears, full screen redraws and menu cursor moves and page flips
+def benchDisplay(runs):
+	gpio, display, lcd = simulatedLCD()
+	screen = LCDFrameBuffer(lcd)
+	engine = MenuEngine(screen, None, None)
+	menu = Menu('bench', [MenuItem('Item %d' % i) for i in range(4)])
+	items = menu.resolveItems()
+
+	frames = [['Frame one line 1', 'Frame one line 2'], ['FRAME TWO LINE 1', 'FRAME TWO LINE 2']]
+	text = 'x' * 32
+
+	def message(i):
+		lcd.setCursor(0, 0)
+		lcd.message(text)
+
+	def redraw(i):
+		screen.render(frames[i % 2])
+		screen.flush()
+
+	# the cursor moves between the two items on the first page
+	def cursorMove(i):
+		engine.draw(menu, items, i % 2)
+		screen.flush()
+
+	# the selection moves between the last item of the first page and the first of the second
+	def pageFlip(i):
+		engine.draw(menu, items, 1 + i % 2)
+		screen.flush()
+
+	operations = [
+		('message', message, 20, len(text)),
+		('clear', lambda i: lcd.clear(), 50, 1),
+		('redraw', redraw, 50, 1),
+		('cursor_move', cursorMove, 200, 1),
+		('page_flip', pageFlip, 200, 1),
+	]
+
+	for name, operation, repeat, per in operations:
+		rates = []
+		violations = 0
+
+		for run in range(runs):
+			screen.invalidate()
+			rate, calls, cycles, busy = measure(gpio, display, operation, repeat)
+
+			rates.append(rate * per)
+			violations += busy
+
+		report('display.' + name, rates, 'ops/s' if per == 1 else 'chars/s')
+		count('display.' + name + '.gpio_calls', calls / per, 'calls')
+		count('display.' + name + '.bus_cycles', cycles / per, 'cycles')
+		count('display.' + name + '.violations', violations, 'writes')
+
+# raised through the menu engine to stop it at the end of a benchmark
+class Stop(Exception):
+	pass
+
+# time from a button edge to the change reaching the emulated DDRAM, through
+# the button events, the menu engine and the threaded framebuffer
+def benchNavigation(runs):
+	gpio, display, lcd = simulatedLCD()
+	pins = {'btnUp': 14, 'btnDown': 15, 'btnBack': 8, 'btnSelect': 18}
+
+	for pin in pins.values():
+		gpio.setup(pin, gpio.IN)
+
+	screen = LCDFrameBuffer(lcd, threaded=True)
+	events = ButtonEvents(gpio, pins)
+	changes = {'last': 0}
+
+	def changed(display):
+		changes['last'] = monotonic()
+
+	display.changed = changed
+
+	def readInput():
+		event = events.wait()
+
+		if (event == None):
+			raise Stop()
+
+		if (event.kind == PRESS):
+			return (event.button, event)
+
+		return (None, event)
+
+	engine = MenuEngine(screen, readInput, None)
+	menu = Menu('bench', [MenuItem('Item %d' % i) for i in range(10)])
+
+	def run():
+		try:
+			engine.run(menu, True)
+		except Stop:
+			pass
+
+	thread = threading.Thread(target=run, name='menu')
+	thread.start()
+
+	# let the first frame go out
+	sleep(.1)
+	screen.sync()
+
+	latencies = []
+	buttons = (['btnDown'] * 9 + ['btnUp'] * 9) * runs
+
+	for button in buttons:
+		before = display.lines()
+		pressed = monotonic()
+		gpio.press(pins[button])
+
+		deadline = pressed + 1
+		while ((display.lines() == before) and (monotonic() < deadline)):
+			sleep(.0005)
+
+		screen.sync()
+		latencies.append((changes['last'] - pressed) * 1000)
+
+		# let both edges settle before the next press
+		sleep(DEBOUNCE_TIME * 2)
+		gpio.release(pins[button])
+		sleep(DEBOUNCE_TIME * 2)
+
+	events.queue.put(None)
+	thread.join()
+	events.close()
+
+	report('navigation.press_to_pixel', latencies, 'ms')
+
+BENCHMARKS = {
+	'startup': benchStartup,
+	'display': benchDisplay,
+	'navigation': benchNavigation,
+}
+
+def main(args):
+	runs = 5
+
+	if ((len(args) >= 2) and (args[0] == '-n')):
+		runs = int(args[1])
+		args = args[2:]
+
+	names = args or sorted(BENCHMARKS)
+
+	for name in names:
+		if (name not in BENCHMARKS):
+			print >> sys.stderr, 'unknown benchmark %s, choose from %s' % (name, ', '.join(sorted(BENCHMARKS)))
+			return 1
+
+	for name in names:
+		BENCHMARKS[name](runs)
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,155 @@
+#!/usr/bin/python
+#
+# Edge triggered, debounced button events
+#
+# Buttons are wired active low (False is pressed). Instead of polling every
+# pin, GPIO edge detection calls us when a pin changes, the change is
+# debounced in software and turned into press, release, long press and
+# repeat events on a thread safe queue that menus block on.
+
+import threading
+from Queue import Queue, Empty
+from clock import monotonic
+
+PRESS = 'press'
+RELEASE = 'release'
+LONGPRESS = 'longpress'
+REPEAT = 'repeat'
+
+# a pin has to stay at a new level this long before the change is accepted
+DEBOUNCE_TIME = .03
+
+# held this long a press becomes a long press, then repeats while held
+LONGPRESS_TIME = 1.0
+REPEAT_TIME = .25
+
+class ButtonEvent:
+
+	def __init__(self, button, kind, time, duration=0):
+		self.button = button
+		self.kind = kind
+		self.time = time
+
+		# how long the button has been held, for release, long press and repeat
+		self.duration = duration
+
+	def __repr__(self):
+		return '<ButtonEvent %s %s %.3f>' % (self.button, self.kind, self.duration)
+
+class ButtonEvents:
+
+	# pins is a dict of button name to GPIO pin
+	def __init__(self, GPIO, pins, debounce=DEBOUNCE_TIME, longPress=LONGPRESS_TIME, repeat=REPEAT_TIME):
+		self.GPIO = GPIO
+		self.pins = pins
+		self.debounce = debounce
+		self.longPress = longPress
+		self.repeat = repeat
+
+		self.queue = Queue()
+		self.lock = threading.Lock()
+		self.names = {}
+		self.levels = {}
+		self.changed = {}
+		self.pressed = {}
+		self.timers = {}
+		self.lastEvent = monotonic()
+
+		for name, pin in pins.items():
+			self.names[pin] = name
+			self.levels[name] = GPIO.input(pin)
+			self.changed[name] = 0
+
+			GPIO.add_event_detect(pin, GPIO.BOTH, callback=self.edge)
+
+	# stop listening for edges
+	def close(self):
+		for pin in self.names:
+			self.GPIO.remove_event_detect(pin)
+
+		with self.lock:
+			for timer in self.timers.values():
+				timer.cancel()
+
+			self.timers = {}
+
+	# GPIO edge callback, runs on the GPIO library's event thread
+	def edge(self, pin):
+		name = self.names[pin]
+		level = self.GPIO.input(pin)
+		now = monotonic()
+
+		with self.lock:
+			if (level == self.levels[name]):
+				return
+
+			# still bouncing, look again once the pin had time to settle
+			if ((now - self.changed[name]) < self.debounce):
+				self.startTimer((name, 'settle'), self.debounce, self.settle, pin)
+				return
+
+			self.levels[name] = level
+			self.changed[name] = now
+
+			if (level == False):
+				self.pressed[name] = now
+				self.post(ButtonEvent(name, PRESS, now))
+				self.startTimer(name, self.longPress, self.held, (LONGPRESS, now))
+			else:
+				self.cancelTimer(name)
+				self.post(ButtonEvent(name, RELEASE, now, now - self.pressed.get(name, now)))
+
+	# re-read a pin whose last edge was ignored as a bounce
+	def settle(self, key, pin):
+		with self.lock:
+			self.timers.pop(key, None)
+
+		self.edge(pin)
+
+	# timer callback while a button stays pressed
+	def held(self, name, arg):
+		kind, pressTime = arg
+		now = monotonic()
+
+		with self.lock:
+			# released, or released and pressed again, since the timer started
+			if ((self.levels[name] != False) or (self.pressed[name] != pressTime)):
+				return
+
+			self.post(ButtonEvent(name, kind, now, now - pressTime))
+			self.startTimer(name, self.repeat, self.held, (REPEAT, pressTime))
+
+	# call function(key, arg) after delay seconds, replacing any timer for key
+	def startTimer(self, key, delay, function, arg):
+		self.cancelTimer(key)
+
+		timer = threading.Timer(delay, function, (key, arg))
+		timer.daemon = True
+		self.timers[key] = timer
+		timer.start()
+
+	def cancelTimer(self, key):
+		timer = self.timers.pop(key, None)
+
+		if (timer != None):
+			timer.cancel()
+
+	def post(self, event):
+		self.lastEvent = event.time
+		self.queue.put(event)
+
+	# block until the next event, returns None after 'timeout' seconds
+	def wait(self, timeout=None):
+		try:
+			return self.queue.get(True, timeout)
+		except Empty:
+			return None
+
+	# drop events that piled up, eg while a long job was running
+	def flush(self):
+		while (self.wait(0) != None):
+			pass
+
+	# seconds since the last button event
+	def idleTime(self):
+		return monotonic() - self.lastEvent
@@ -0,0 +1,38 @@
+#!/usr/bin/python
+#
+# Monotonic clock helpers
+#
+# time.time() jumps whenever ntp or dhclient sets the clock, which is common on
+# a pi without an rtc. python 2 has no time.monotonic() so read
+# CLOCK_MONOTONIC through ctypes and only fall back to time.time() when that
+# is not available either.
+
+import time
+
+CLOCK_MONOTONIC = 1
+
+try:
+	monotonic = time.monotonic
+except AttributeError:
+	import ctypes, ctypes.util
+
+	class timespec(ctypes.Structure):
+		_fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+	try:
+		librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1', use_errno=True)
+		clock_gettime = librt.clock_gettime
+		clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+		# seconds from an arbitrary fixed point as a float
+		def monotonic():
+			t = timespec()
+			clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t))
+
+			return t.tv_sec + t.tv_nsec * 1e-9
+	except (OSError, AttributeError):
+		monotonic = time.time
+
+# monotonic clock in integer nanoseconds
+def monotonicNs():
+	return int(monotonic() * 1000000000)
@@ -0,0 +1,197 @@
+#!/usr/bin/python
+#
+# Host discovery on the attached subnet
+#
+# Addresses are handled as integers and host ranges are generated lazily, so
+# sweeping a large prefix never builds a per host list. Hosts are probed
+# concurrently, with an ICMP echo sweep when we are allowed to open a raw
+# socket and TCP connects to common ports for whatever did not answer that.
+# A refused connection counts as up, only a live host sends a reset.
+
+import os, select, socket, struct
+from clock import monotonic
+import portscan
+
+# ports that most hosts answer on, either open or with a reset
+PROBE_PORTS = [80, 443, 22, 445, 139, 53, 8080, 23]
+
+# probes in flight at once and how long a host gets to answer
+WINDOW = 128
+TIMEOUT = .5
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+# dotted quad to integer
+def ipToInt(ip):
+	return struct.unpack('!L', socket.inet_aton(ip))[0]
+
+# integer to dotted quad
+def intToIP(value):
+	return socket.inet_ntoa(struct.pack('!L', value))
+
+# number of hosts in the subnet of ip/netmask that subnetHosts() generates
+def hostCount(ip, netmask, skip=()):
+	first, last = hostBounds(ip, netmask)
+	skipped = len([host for host in set(skip) if first <= ipToInt(host) <= last])
+
+	return max(last - first + 1 - skipped, 0)
+
+# first and last usable host address of the subnet of ip/netmask as integers
+def hostBounds(ip, netmask):
+	mask = ipToInt(netmask)
+	network = ipToInt(ip) & mask
+	broadcast = network | (~mask & 0xFFFFFFFF)
+
+	# /31 and /32 have no network and broadcast address to leave out
+	if ((broadcast - network) < 2):
+		return (network, broadcast)
+
+	return (network + 1, broadcast - 1)
+
+# generate the host addresses of the subnet of ip/netmask as dotted quads
+def subnetHosts(ip, netmask, skip=()):
+	first, last = hostBounds(ip, netmask)
+	address = first
+
+	# xrange can not count past 2^31 on a 32 bit pi
+	while (address <= last):
+		host = intToIP(address)
+
+		if (host not in skip):
+			yield host
+
+		address += 1
+
+# internet checksum
+def checksum(data):
+	if (len(data) % 2):
+		data += '\0'
+
+	total = sum(struct.unpack('!%dH' % (len(data) / 2), data))
+	total = (total >> 16) + (total & 0xFFFF)
+	total += total >> 16
+
+	return ~total & 0xFFFF
+
+# build an ICMP echo request
+def echoRequest(ident, sequence):
+	header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, sequence)
+	payload = 'portablepi'
+
+	return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum(header + payload), ident, sequence) + payload
+
+# open a raw ICMP socket, None if we are not allowed to
+def icmpSocket():
+	try:
+		sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.getprotobyname('icmp'))
+	except socket.error:
+		return None
+
+	sock.setblocking(0)
+
+	return sock
+
+# send an echo request to every host and collect the replies, calling found(host)
+# for each host that answers. returns the set of hosts that answered
+def icmpSweep(sock, hosts, timeout=TIMEOUT, found=None, cancelled=None):
+	ident = os.getpid() & 0xFFFF
+	alive = set()
+
+	def receive(wait):
+		ready = select.select([sock], [], [], wait)[0]
+
+		while ready:
+			try:
+				packet, address = sock.recvfrom(1024)
+			except socket.error:
+				break
+
+			# skip the ip header, its length is in the low nibble of the first byte
+			offset = (ord(packet[0]) & 0x0F) * 4
+			kind, code, check, replyIdent, sequence = struct.unpack('!BBHHH', packet[offset:offset + 8])
+
+			if ((kind == ICMP_ECHO_REPLY) and (replyIdent == ident) and (address[0] not in alive)):
+				alive.add(address[0])
+
+				if (found != None):
+					found(address[0])
+
+			ready = select.select([sock], [], [], 0)[0]
+
+	for sequence, host in enumerate(hosts):
+		if ((cancelled != None) and cancelled()):
+			return alive
+
+		try:
+			sock.sendto(echoRequest(ident, sequence & 0xFFFF), (host, 0))
+		except socket.error:
+			pass
+
+		# pick up replies as we go so the socket buffer does not overflow
+		receive(0)
+
+	deadline = monotonic() + timeout
+
+	while (monotonic() < deadline):
+		if ((cancelled != None) and cancelled()):
+			break
+
+		receive(deadline - monotonic())
+
+	return alive
+
+# find the hosts that are up in the subnet of ip/netmask
+#
+# found(host) is called for every live host as it is found, progress(done, total)
+# after every probe. a probe a host did not need because it was already up counts
+# as done. returns the live hosts as a sorted list
+def discover(ip, netmask, ports=PROBE_PORTS, window=WINDOW, timeout=TIMEOUT, found=None, progress=None, cancelled=None):
+	alive = set()
+	total = hostCount(ip, netmask, (ip,)) * len(ports)
+	counts = {'done': 0, 'reported': 0}
+
+	def report():
+		if ((progress != None) and (counts['done'] != counts['reported'])):
+			counts['reported'] = counts['done']
+			progress(counts['done'], total)
+
+	def hostUp(host):
+		if (host not in alive):
+			alive.add(host)
+
+			if (found != None):
+				found(host)
+
+	sock = icmpSocket()
+
+	if (sock != None):
+		try:
+			icmpSweep(sock, subnetHosts(ip, netmask, (ip,)), timeout, hostUp, cancelled)
+		finally:
+			sock.close()
+
+	# tcp probes for hosts that are not known to be up yet, one port at a time
+	# across the subnet so a host found on the first port is skipped for the rest
+	def targets():
+		for port in ports:
+			for host in subnetHosts(ip, netmask, (ip,)):
+				if (host in alive):
+					counts['done'] += 1
+				else:
+					yield (host, port)
+
+	def finished(host, port, state):
+		if (state in (portscan.OPEN, portscan.CLOSED)):
+			hostUp(host)
+
+		counts['done'] += 1
+		report()
+
+	portscan.connectMany(targets(), window, timeout, finished, cancelled)
+
+	# hosts skipped after the last probe finished
+	if ((cancelled == None) or (cancelled() == False)):
+		report()
+
+	return sorted(alive, key=ipToInt)
@@ -0,0 +1,309 @@
+#!/usr/bin/python
+#
+# DNS server benchmark
+#
+# Sends A queries for a list of names to one server from a single UDP socket,
+# keeping a window of them in flight and matching the replies by their id.
+# Queries are encoded and replies decoded here, so neither dig nor a resolver
+# library is needed. Round trips go into a latency.LatencyStats, which gives
+# the percentiles, and the response codes are counted so SERVFAIL and friends
+# show up next to the timeouts.
+
+import errno, random, select, socket, struct
+from clock import monotonic, monotonicNs
+from latency import LatencyStats
+
+PORT = 53
+
+# queries per run, queries in flight at once and how long each gets to answer
+QUERIES = 200
+WINDOW = 16
+TIMEOUT = 2.0
+
+TYPE_A = 1
+CLASS_IN = 1
+
+FLAG_QR = 0x8000
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+
+NOERROR = 0
+FORMERR = 1
+SERVFAIL = 2
+NXDOMAIN = 3
+NOTIMP = 4
+REFUSED = 5
+
+RCODES = {
+	NOERROR: 'NOERROR',
+	FORMERR: 'FORMERR',
+	SERVFAIL: 'SERVFAIL',
+	NXDOMAIN: 'NXDOMAIN',
+	NOTIMP: 'NOTIMP',
+	REFUSED: 'REFUSED',
+}
+
+# names to look up, queried in turn
+NAMES = [
+	'google.com', 'youtube.com', 'facebook.com', 'wikipedia.org', 'amazon.com',
+	'twitter.com', 'yahoo.com', 'bing.com', 'github.com', 'apple.com',
+	'microsoft.com', 'cloudflare.com', 'raspberrypi.org', 'debian.org',
+	'netflix.com', 'reddit.com',
+]
+
+# a reply that can not be decoded
+class DNSError(ValueError):
+	pass
+
+# a name as length prefixed labels
+def encodeName(name):
+	encoded = ''
+
+	for label in name.rstrip('.').split('.'):
+		if ((len(label) == 0) or (len(label) > 63)):
+			raise ValueError('bad name %s' % name)
+
+		encoded += chr(len(label)) + label
+
+	return encoded + '\0'
+
+# a query for one name, asking the server to recurse
+def encodeQuery(ident, name, qtype=TYPE_A, recursion=True):
+	flags = 0
+
+	if (recursion):
+		flags |= FLAG_RD
+
+	return struct.pack('!HHHHHH', ident, flags, 1, 0, 0, 0) + encodeName(name) + struct.pack('!HH', qtype, CLASS_IN)
+
+# the name at offset, following compression pointers. returns the name and the
+# offset just past it where it started
+def decodeName(data, offset):
+	labels = []
+	end = None
+	jumps = 0
+
+	while True:
+		if (offset >= len(data)):
+			raise DNSError('name runs past the end')
+
+		length = ord(data[offset])
+
+		if ((length & 0xC0) == 0xC0):
+			if ((offset + 2) > len(data)):
+				raise DNSError('name runs past the end')
+
+			# a pointer to the rest of the name somewhere earlier
+			if (end == None):
+				end = offset + 2
+
+			jumps += 1
+			if (jumps > 16):
+				raise DNSError('name pointer loop')
+
+			offset = struct.unpack('!H', data[offset:offset + 2])[0] & 0x3FFF
+			continue
+
+		offset += 1
+
+		if (length == 0):
+			break
+
+		if ((offset + length) > len(data)):
+			raise DNSError('name runs past the end')
+
+		labels.append(data[offset:offset + length])
+		offset += length
+
+	if (end == None):
+		end = offset
+
+	return ('.'.join(labels), end)
+
+# decode a reply into a dict with its id, flags, rcode, questions and answers.
+# answers are (name, type, ttl, data) with A records as dotted quads
+def decodeResponse(data):
+	if (len(data) < 12):
+		raise DNSError('reply too short')
+
+	ident, flags, qdcount, ancount, nscount, arcount = struct.unpack('!HHHHHH', data[:12])
+	offset = 12
+
+	questions = []
+	for i in range(qdcount):
+		name, offset = decodeName(data, offset)
+
+		if ((offset + 4) > len(data)):
+			raise DNSError('question runs past the end')
+
+		qtype, qclass = struct.unpack('!HH', data[offset:offset + 4])
+		offset += 4
+
+		questions.append((name, qtype))
+
+	answers = []
+	for i in range(ancount):
+		name, offset = decodeName(data, offset)
+
+		if ((offset + 10) > len(data)):
+			raise DNSError('answer runs past the end')
+
+		rtype, rclass, ttl, length = struct.unpack('!HHLH', data[offset:offset + 10])
+		offset += 10
+
+		if ((offset + length) > len(data)):
+			raise DNSError('answer runs past the end')
+
+		value = data[offset:offset + length]
+		offset += length
+
+		if ((rtype == TYPE_A) and (length == 4)):
+			value = socket.inet_ntoa(value)
+
+		answers.append((name, rtype, ttl, value))
+
+	return {
+		'id': ident,
+		'flags': flags,
+		'rcode': flags & 0x0F,
+		'truncated': ((flags & FLAG_TC) != 0),
+		'questions': questions,
+		'answers': answers,
+	}
+
+class Benchmark:
+
+	# the results of a run against one server
+	def __init__(self, server):
+		self.server = server
+		self.sent = 0
+		self.latency = LatencyStats()
+		self.rcodes = {}
+
+		# replies that could not be decoded and queries that could not be sent
+		self.errors = 0
+
+		# seconds the run took, and into it when the last answer came
+		self.elapsed = 0.0
+		self.answering = 0.0
+
+	# queries that got an answer, timed out or failed
+	def finished(self):
+		return self.latency.received + self.latency.lost + self.errors
+
+	# answers per second, not counting the wait for queries that never got one
+	def qps(self):
+		if (self.answering <= 0):
+			return 0.0
+
+		return self.latency.received / self.answering
+
+	# share of the finished queries that got 'rcode' back, 0 to 1
+	def rate(self, rcode):
+		if (self.finished() == 0):
+			return 0.0
+
+		return float(self.rcodes.get(rcode, 0)) / self.finished()
+
+	def timeoutRate(self):
+		if (self.finished() == 0):
+			return 0.0
+
+		return float(self.latency.lost) / self.finished()
+
+# query 'server' 'count' times, going round 'names', with up to 'window' queries
+# in flight. returns a Benchmark
+#
+# callback(benchmark) is called as each query finishes and cancelled() is
+# checked between polls, a cancelled run returns what it has
+def run(server, names=NAMES, count=QUERIES, window=WINDOW, timeout=TIMEOUT, port=PORT, callback=None, cancelled=None):
+	bench = Benchmark(server)
+	pending = {}
+	ident = random.randint(0, 0xFFFF)
+
+	def finished():
+		if (callback != None):
+			callback(bench)
+
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	sock.setblocking(0)
+
+	# connected, so only the server's replies come in
+	sock.connect((server, port))
+
+	start = monotonic()
+
+	try:
+		while True:
+			if ((cancelled != None) and cancelled()):
+				break
+
+			# keep the window full
+			while ((len(pending) < window) and (bench.sent < count)):
+				while (ident in pending):
+					ident = (ident + 1) & 0xFFFF
+
+				query = encodeQuery(ident, names[bench.sent % len(names)])
+				bench.sent += 1
+
+				try:
+					sock.send(query)
+				except socket.error:
+					bench.errors += 1
+					finished()
+					continue
+
+				pending[ident] = (monotonicNs(), monotonic() + timeout)
+				ident = (ident + 1) & 0xFFFF
+
+			if (len(pending) == 0):
+				break
+
+			wait = min([deadline for sent, deadline in pending.values()]) - monotonic()
+
+			if (select.select([sock], [], [], max(wait, 0))[0]):
+				# take everything that came in
+				while True:
+					try:
+						data = sock.recv(4096)
+					except socket.error, e:
+						# a port unreachable for an earlier query, the rest is still there
+						if (e.errno == errno.ECONNREFUSED):
+							continue
+
+						break
+
+					received = monotonicNs()
+
+					if (len(data) < 2):
+						continue
+
+					entry = pending.pop(struct.unpack('!H', data[:2])[0], None)
+
+					# a reply to a query that already timed out
+					if (entry == None):
+						continue
+
+					try:
+						reply = decodeResponse(data)
+					except DNSError:
+						bench.errors += 1
+						finished()
+						continue
+
+					bench.latency.reply((received - entry[0]) / 1e6)
+					bench.answering = monotonic() - start
+					bench.rcodes[reply['rcode']] = bench.rcodes.get(reply['rcode'], 0) + 1
+					finished()
+
+			now = monotonic()
+
+			for expired in [key for key, (sent, deadline) in pending.items() if deadline <= now]:
+				del pending[expired]
+				bench.latency.timeout()
+				finished()
+	finally:
+		bench.elapsed = monotonic() - start
+		sock.close()
+
+	return bench
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+#
+# Custom character manager
+#
+# The HD44780 has 8 CGRAM slots for custom characters. Glyphs are registered
+# by name as 8 rows of 5 bits and get a slot the first time a screen asks for
+# them. A glyph that is already in a slot is not uploaded again, and when all
+# slots are taken the least recently used glyph that is not on screen gives
+# up its slot.
+
+from collections import OrderedDict
+
+SLOTS = 8
+
+# bar heights top to bottom for the signal icons, one bar every other column
+SIGNAL_BARS = [(0x10, 2), (0x04, 4), (0x01, 7)]
+
+# the glyphs every manager knows about, more can be added with define()
+GLYPHS = {}
+
+# vertical bars 1 to 8 rows high, for bar graphs and sparklines
+for height in range(1, 9):
+	GLYPHS['bar%d' % height] = [0x00] * (8 - height) + [0x1F] * height
+
+# a line turning a quarter per frame. the ROM has no backslash, it shows a yen sign
+GLYPHS['spin0'] = [0x04, 0x04, 0x04, 0x04, 0x04, 0x04, 0x04, 0x00]
+GLYPHS['spin1'] = [0x01, 0x01, 0x02, 0x04, 0x08, 0x10, 0x10, 0x00]
+GLYPHS['spin2'] = [0x00, 0x00, 0x00, 0x1F, 0x00, 0x00, 0x00, 0x00]
+GLYPHS['spin3'] = [0x10, 0x10, 0x08, 0x04, 0x02, 0x01, 0x01, 0x00]
+
+# signal strength, 0 to 3 bars
+for level in range(4):
+	rows = [0x00] * 8
+
+	for bit, height in SIGNAL_BARS[:level]:
+		for row in range(8 - height, 8):
+			rows[row] |= bit
+
+	GLYPHS['signal%d' % level] = rows
+
+class GlyphManager:
+
+	# glyphs are uploaded through the framebuffer, see LCDFrameBuffer.createChar
+	def __init__(self, screen, slots=SLOTS):
+		self.screen = screen
+		self.slots = slots
+		self.bitmaps = dict(GLYPHS)
+
+		# name to slot of the glyphs in CGRAM, least recently used first
+		self.resident = OrderedDict()
+
+		self.uploads = 0
+
+	# register a glyph, 8 rows of 5 bits top to bottom
+	def define(self, name, rows):
+		rows = [row & 0x1F for row in rows]
+
+		if (len(rows) != 8):
+			raise ValueError('glyph %s has %d rows, not 8' % (name, len(rows)))
+
+		changed = (self.bitmaps.get(name) != rows)
+		self.bitmaps[name] = rows
+
+		# already in a slot, the characters on screen change with it
+		if (changed and (name in self.resident)):
+			self.upload(self.resident[name], rows)
+
+	# the character that shows a glyph, uploading it if it is not in CGRAM
+	def char(self, name):
+		slot = self.resident.pop(name, None)
+
+		if (slot == None):
+			bitmap = self.bitmaps[name]
+			slot = self.allocate()
+			self.upload(slot, bitmap)
+
+		self.resident[name] = slot
+
+		return chr(slot)
+
+	# characters for a list of glyph names
+	def text(self, names):
+		return ''.join([self.char(name) for name in names])
+
+	# a free slot, or the slot of the least recently used glyph not on screen
+	def allocate(self):
+		used = set(self.resident.values())
+
+		for slot in range(self.slots):
+			if (slot not in used):
+				return slot
+
+		shown = set(''.join(self.screen.lines()))
+		victim = None
+
+		for name, slot in self.resident.items():
+			if (chr(slot) not in shown):
+				victim = name
+				break
+
+		# every slot is on screen, one of them is going to change
+		if (victim == None):
+			victim = self.resident.keys()[0]
+
+		return self.resident.pop(victim)
+
+	def upload(self, slot, rows):
+		self.uploads += 1
+		self.screen.createChar(slot, rows)
+
+	# forget what is in CGRAM, eg when the lcd has been reset
+	def forget(self):
+		self.resident.clear()
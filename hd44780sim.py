@@ -0,0 +1,291 @@
+#!/usr/bin/python
+#
+# HD44780 controller emulator
+#
+# Watches the lcd pins on a SimGPIO and decodes what the driver clocks in,
+# the 8 bit initialization sequence and then nibble pairs in 4 bit mode,
+# into DDRAM and CGRAM contents, cursor and display state. It keeps count of
+# bus cycles and instructions, and of instructions sent while the controller
+# was still busy with the previous one, so tests can check what is on the
+# screen and benchmarks can see what an operation costs on the bus.
+
+import sys, threading
+from time import sleep
+from Adafruit_CharLCD import HD44780Timing
+
+# characters per DDRAM line in 2 line mode
+LINE_LENGTH = 40
+
+class HD44780:
+
+	# pins default to the ones Adafruit_CharLCD uses
+	def __init__(self, gpio, pin_rs=25, pin_e=24, pins_db=[23, 17, 21, 22], pin_rw=None, cols=16, rows=2, timing=None):
+		self.gpio = gpio
+		self.pin_rs = pin_rs
+		self.pin_e = pin_e
+		self.pins_db = pins_db
+		self.pin_rw = pin_rw
+		self.cols = cols
+		self.rows = rows
+		self.timing = timing or HD44780Timing()
+
+		self.ddram = [0x20] * (2 * LINE_LENGTH)
+		self.cgram = [0] * 64
+
+		# interface and entry mode state after power on
+		self.eightbit = True
+		self.initialized = False
+		self.pending = None
+		self.twoline = False
+		self.address = 0
+		self.cgramMode = False
+		self.increment = True
+		self.shiftMode = False
+		self.offset = 0
+		self.displayOn = False
+		self.cursorOn = False
+		self.blinkOn = False
+		self.busyUntil = 0
+
+		# called as changed(self) after every instruction
+		self.changed = None
+
+		self.resetCounters()
+
+		gpio.watch(self.pin)
+
+	def resetCounters(self):
+		self.cycles = 0		# enable pulses
+		self.instructions = 0	# commands
+		self.writes = 0		# data writes
+		self.violations = 0	# instructions sent while the controller was busy
+		self.slack = 0.0	# seconds the controller sat ready between instructions
+
+	def counters(self):
+		return {
+			'cycles': self.cycles,
+			'instructions': self.instructions,
+			'writes': self.writes,
+			'violations': self.violations,
+			'slack_us': self.slack * 1000000,
+		}
+
+	# pin watcher, instructions are latched on the falling edge of enable
+	def pin(self, pin, level, now):
+		if (pin != self.pin_e):
+			return
+
+		reading = (self.pin_rw != None) and self.gpio.levels.get(self.pin_rw)
+
+		if (reading):
+			# the busy flag goes out on DB7 while enable is high
+			if (level):
+				self.gpio.drive(self.pins_db[3], now < self.busyUntil)
+			return
+
+		if (level):
+			return
+
+		self.cycles += 1
+
+		nibble = 0
+		for i in range(4):
+			if (self.gpio.levels.get(self.pins_db[i])):
+				nibble |= 1 << i
+
+		rs = self.gpio.levels.get(self.pin_rs)
+
+		# only DB4-DB7 are wired, in 8 bit mode the low nibble reads as 0
+		if (self.eightbit):
+			self.execute(rs, nibble << 4, now)
+		elif (self.pending == None):
+			self.pending = nibble
+		else:
+			value = (self.pending << 4) | nibble
+			self.pending = None
+			self.execute(rs, value, now)
+
+	def execute(self, rs, value, now):
+		# during the initialization sequence the busy time can not be checked
+		if (self.initialized):
+			if (now < self.busyUntil):
+				self.violations += 1
+			else:
+				self.slack += now - self.busyUntil
+
+		if (rs):
+			self.writes += 1
+			self.writeData(value)
+			duration = self.timing.data_us
+		else:
+			self.instructions += 1
+			duration = self.command(value)
+
+		self.busyUntil = now + duration / 1000000.0
+
+		if (self.changed != None):
+			self.changed(self)
+
+	# run a command, returns its execution time in microseconds
+	def command(self, value):
+		if (value & 0x80):
+			self.address = value & 0x7F
+			self.cgramMode = False
+
+		elif (value & 0x40):
+			self.address = value & 0x3F
+			self.cgramMode = True
+
+		elif (value & 0x20):
+			wasEightbit = self.eightbit
+			self.eightbit = bool(value & 0x10)
+			self.twoline = bool(value & 0x08)
+
+			if (wasEightbit):
+				self.initialized = not self.eightbit
+				return self.timing.init_us
+
+		elif (value & 0x10):
+			right = bool(value & 0x04)
+
+			if (value & 0x08):
+				self.shiftDisplay(right)
+			else:
+				self.address = self.step(self.address, right)
+
+		elif (value & 0x08):
+			self.displayOn = bool(value & 0x04)
+			self.cursorOn = bool(value & 0x02)
+			self.blinkOn = bool(value & 0x01)
+
+		elif (value & 0x04):
+			self.increment = bool(value & 0x02)
+			self.shiftMode = bool(value & 0x01)
+
+		elif (value & 0x02):
+			self.address = 0
+			self.cgramMode = False
+			self.offset = 0
+			return self.timing.slow_us
+
+		elif (value & 0x01):
+			self.ddram = [0x20] * (2 * LINE_LENGTH)
+			self.address = 0
+			self.cgramMode = False
+			self.increment = True
+			self.offset = 0
+			return self.timing.slow_us
+
+		return self.timing.command_us
+
+	def writeData(self, value):
+		if (self.cgramMode):
+			self.cgram[self.address] = value & 0x1F
+			self.address = (self.address + (1 if self.increment else -1)) & 0x3F
+			return
+
+		self.ddram[self.index(self.address)] = value
+		self.address = self.step(self.address, self.increment)
+
+		if (self.shiftMode):
+			self.shiftDisplay(not self.increment)
+
+	# position of a DDRAM address in self.ddram
+	def index(self, address):
+		if (self.twoline):
+			return (address >> 6) * LINE_LENGTH + (address & 0x3F) % LINE_LENGTH
+
+		return address % (2 * LINE_LENGTH)
+
+	# the address after 'address' moving forward or back, lines wrap into each other
+	def step(self, address, forward):
+		if (self.twoline):
+			position = (self.index(address) + (1 if forward else -1)) % (2 * LINE_LENGTH)
+
+			return (position / LINE_LENGTH) * 0x40 + position % LINE_LENGTH
+
+		return (address + (1 if forward else -1)) % (2 * LINE_LENGTH)
+
+	# moving the display right shows what is left of the first column
+	def shiftDisplay(self, right):
+		self.offset = (self.offset + (-1 if right else 1)) % LINE_LENGTH
+
+	# the visible characters of every row, as their character codes
+	def codes(self):
+		rows = []
+
+		for row in range(self.rows):
+			if ((row > 0) and (self.twoline == False)):
+				rows.append([0x20] * self.cols)
+				continue
+
+			start = row * LINE_LENGTH
+			rows.append([self.ddram[start + (self.offset + col) % LINE_LENGTH] for col in range(self.cols)])
+
+		return rows
+
+	# the visible text of every row. CGRAM characters come out as chr(0) to chr(7)
+	def lines(self):
+		return [''.join([chr(code) for code in row]) for row in self.codes()]
+
+	# the 8 rows of 5 dots of a custom character
+	def glyph(self, code):
+		return self.cgram[(code & 0x07) * 8:(code & 0x07) * 8 + 8]
+
+# run a simulated lcd in the terminal: draw the display whenever it changes and
+# turn key presses into button presses. keys maps characters to button pins
+def console(gpio, display, keys, hold=.1):
+	import tty, termios
+
+	def draw():
+		shown = None
+
+		while True:
+			state = (display.lines(), display.displayOn)
+
+			if (state != shown):
+				if (display.displayOn):
+					text = [line.translate(CONSOLE_CHARS) for line in state[0]]
+				else:
+					text = [' ' * display.cols] * display.rows
+
+				sys.stdout.write('\x1b[H\x1b[2J+' + '-' * display.cols + '+\n')
+				for line in text:
+					sys.stdout.write('|' + line + '|\n')
+				sys.stdout.write('+' + '-' * display.cols + '+\n')
+				sys.stdout.write(' '.join(['%s=%s' % (key, name) for key, (name, pin) in sorted(keys.items())]) + '\n')
+				sys.stdout.flush()
+
+				shown = state
+
+			sleep(.05)
+
+	def read():
+		while True:
+			key = sys.stdin.read(1)
+
+			if (key == ''):
+				return
+
+			if (key in keys):
+				name, pin = keys[key]
+
+				# held past the button debounce time
+				gpio.press(pin)
+				sleep(hold)
+				gpio.release(pin)
+
+	if (sys.stdin.isatty()):
+		saved = termios.tcgetattr(sys.stdin)
+		tty.setcbreak(sys.stdin)
+
+		import atexit
+		atexit.register(termios.tcsetattr, sys.stdin, termios.TCSADRAIN, saved)
+
+	for function in (draw, read):
+		thread = threading.Thread(target=function, name='console ' + function.__name__)
+		thread.daemon = True
+		thread.start()
+
+# custom characters and the ROM's katakana have no terminal equivalent
+CONSOLE_CHARS = ''.join(['#' if code < 8 else '?' if code > 0x7E else chr(code) for code in range(256)])
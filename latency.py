@@ -0,0 +1,330 @@
+#!/usr/bin/python
+#
+# Round trip time probes
+#
+# Every target gets a probe per interval, all of them in flight at once and
+# waited for with poll(). A TCP probe times the connect handshake, a refused
+# connection counts as an answer since only a live host sends the reset. A
+# UDP probe sends a datagram to an echo service and times the reply. Send and
+# receive are stamped with the monotonic clock in nanoseconds.
+#
+# The summary per target is kept in constant memory however long it runs:
+# running min, max and mean, RFC 3550 style jitter and P2 estimates of the
+# percentiles, which keep 5 markers instead of every sample.
+
+import errno, os, select, socket, struct
+from clock import monotonic, monotonicNs
+
+TCP = 'tcp'
+UDP = 'udp'
+
+# seconds between probes to a target and how long a probe gets to answer
+INTERVAL = 1.0
+TIMEOUT = 1.0
+
+# percentiles every target keeps an estimate of
+QUANTILES = (.5, .9, .99)
+
+class P2Quantile:
+
+	# estimate the p quantile of a stream without keeping it, Jain and Chlamtac's
+	# P2 algorithm. 5 markers track the minimum, p/2, p, (1+p)/2 and the maximum
+	def __init__(self, p):
+		self.p = p
+		self.heights = []
+		self.positions = [1, 2, 3, 4, 5]
+		self.desired = [1.0, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.0]
+		self.increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+	def add(self, value):
+		heights = self.heights
+		positions = self.positions
+
+		# the first 5 values are the markers
+		if (len(heights) < 5):
+			heights.append(float(value))
+			heights.sort()
+			return
+
+		if (value < heights[0]):
+			heights[0] = float(value)
+			cell = 0
+		elif (value >= heights[4]):
+			heights[4] = float(value)
+			cell = 3
+		else:
+			cell = 0
+			while (value >= heights[cell + 1]):
+				cell += 1
+
+		for i in range(cell + 1, 5):
+			positions[i] += 1
+
+		for i in range(5):
+			self.desired[i] += self.increments[i]
+
+		# move the middle markers that are off their desired position by a whole step
+		for i in range(1, 4):
+			offset = self.desired[i] - positions[i]
+
+			if (((offset >= 1) and ((positions[i + 1] - positions[i]) > 1)) or ((offset <= -1) and ((positions[i - 1] - positions[i]) < -1))):
+				step = 1 if (offset > 0) else -1
+				height = self.parabolic(i, step)
+
+				if ((heights[i - 1] < height) and (height < heights[i + 1])):
+					heights[i] = height
+				else:
+					heights[i] = self.linear(i, step)
+
+				positions[i] += step
+
+	def parabolic(self, i, step):
+		q = self.heights
+		n = self.positions
+
+		return q[i] + float(step) / (n[i + 1] - n[i - 1]) * (
+			(n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+			(n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+	def linear(self, i, step):
+		q = self.heights
+		n = self.positions
+
+		return q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+
+	# the current estimate, None before the first value
+	def value(self):
+		if (len(self.heights) == 0):
+			return None
+
+		# too few values for the markers to mean anything, take the nearest rank
+		if (len(self.heights) < 5):
+			return self.heights[int(round(self.p * (len(self.heights) - 1)))]
+
+		return self.heights[2]
+
+class LatencyStats:
+
+	# running summary of round trip times in milliseconds
+	def __init__(self, quantiles=QUANTILES):
+		self.received = 0
+		self.lost = 0
+		self.minimum = None
+		self.maximum = None
+		self.total = 0.0
+		self.jitter = 0.0
+		self.last = None
+		self.quantiles = dict([(p, P2Quantile(p)) for p in quantiles])
+
+	def reply(self, rtt):
+		self.received += 1
+		self.total += rtt
+
+		if ((self.minimum == None) or (rtt < self.minimum)):
+			self.minimum = rtt
+
+		if ((self.maximum == None) or (rtt > self.maximum)):
+			self.maximum = rtt
+
+		# mean deviation of consecutive round trips, smoothed like RFC 3550 does
+		if (self.last != None):
+			self.jitter += (abs(rtt - self.last) - self.jitter) / 16
+
+		self.last = rtt
+
+		for estimate in self.quantiles.values():
+			estimate.add(rtt)
+
+	def timeout(self):
+		self.lost += 1
+
+	def average(self):
+		if (self.received == 0):
+			return None
+
+		return self.total / self.received
+
+	# share of the finished probes that got no answer, 0 to 1
+	def loss(self):
+		if ((self.received + self.lost) == 0):
+			return 0.0
+
+		return float(self.lost) / (self.received + self.lost)
+
+	def quantile(self, p):
+		return self.quantiles[p].value()
+
+class Target:
+
+	# something to probe, and the summary of its round trips so far
+	def __init__(self, label, host, port, protocol=TCP):
+		self.label = label
+		self.host = host
+		self.port = port
+		self.protocol = protocol
+		self.stats = LatencyStats()
+
+# the payload of a UDP probe, echoed back unchanged
+def echoPayload(ident, sequence, sent):
+	return struct.pack('!HLQ', ident, sequence, sent)
+
+# probe every target once per interval until cancelled or 'count' rounds are done
+#
+# callback(target, rtt) is called as each probe finishes, rtt is in milliseconds
+# or None when the probe got no answer in time
+def probe(targets, interval=INTERVAL, timeout=TIMEOUT, count=None, callback=None, cancelled=None):
+	ident = os.getpid() & 0xFFFF
+	poller = select.poll()
+	active = {}
+	busy = set()
+	counts = {'sequence': 0}
+
+	def close(fd):
+		sock, target, sent, deadline, payload = active.pop(fd)
+		poller.unregister(fd)
+		sock.close()
+		busy.discard(target)
+
+		return target
+
+	def finish(target, rtt):
+		if (rtt == None):
+			target.stats.timeout()
+		else:
+			target.stats.reply(rtt)
+
+		if (callback != None):
+			callback(target, rtt)
+
+	def start(target):
+		counts['sequence'] += 1
+
+		if (target.protocol == UDP):
+			sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		else:
+			sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+		sock.setblocking(0)
+		payload = None
+		sent = monotonicNs()
+
+		if (target.protocol == UDP):
+			err = sock.connect_ex((target.host, target.port))
+
+			if (err == 0):
+				payload = echoPayload(ident, counts['sequence'] & 0xFFFFFFFF, sent)
+
+				try:
+					sock.send(payload)
+				except socket.error, e:
+					err = e.errno
+
+			flags = select.POLLIN
+		else:
+			err = sock.connect_ex((target.host, target.port))
+
+			if (err in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY)):
+				err = 0
+
+			flags = select.POLLOUT
+
+		if (err not in (0, errno.ECONNREFUSED)):
+			sock.close()
+			finish(target, None)
+			return
+
+		# loopback can refuse straight away
+		if (err == errno.ECONNREFUSED):
+			sock.close()
+			finish(target, (monotonicNs() - sent) / 1e6)
+			return
+
+		active[sock.fileno()] = (sock, target, sent, monotonic() + timeout, payload)
+		busy.add(target)
+		poller.register(sock, flags)
+
+	# a socket is ready, returns whether the probe is over and its round trip,
+	# None if it failed
+	def receive(fd, received):
+		sock, target, sent, deadline, payload = active[fd]
+		rtt = (received - sent) / 1e6
+
+		if (target.protocol == TCP):
+			err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+
+			if (err in (0, errno.ECONNREFUSED)):
+				return (True, rtt)
+
+			return (True, None)
+
+		try:
+			data = sock.recv(64)
+		except socket.error, e:
+			# port unreachable came back, the host is there
+			if (e.errno == errno.ECONNREFUSED):
+				return (True, rtt)
+
+			return (True, None)
+
+		# anything but our payload is a stray datagram, keep waiting
+		return ((data == payload), rtt)
+
+	rounds = 0
+	due = monotonic()
+
+	try:
+		while True:
+			if ((cancelled != None) and cancelled()):
+				break
+
+			now = monotonic()
+
+			if ((due <= now) and ((count == None) or (rounds < count))):
+				# a target whose last probe has not finished yet sits this round out
+				for target in targets:
+					if (target not in busy):
+						start(target)
+
+				rounds += 1
+				due = max(due + interval, now)
+
+			done = ((count != None) and (rounds >= count))
+
+			if (done and (len(active) == 0)):
+				break
+
+			deadlines = [deadline for sock, target, sent, deadline, payload in active.values()]
+
+			if (done == False):
+				deadlines.append(due)
+
+			wait = min(deadlines) - monotonic()
+
+			for fd, flags in poller.poll(max(wait, 0) * 1000):
+				finished, rtt = receive(fd, monotonicNs())
+
+				if (finished):
+					finish(close(fd), rtt)
+
+			now = monotonic()
+
+			for fd in [fd for fd, (sock, target, sent, deadline, payload) in active.items() if deadline <= now]:
+				finish(close(fd), None)
+	finally:
+		for fd in active.keys():
+			close(fd)
+
+	return targets
+
+# a round trip in at most 4 characters, eg 0.35, 12.4, 250
+def formatMs(ms):
+	if (ms == None):
+		return '-'
+
+	if (ms < 9.995):
+		return '%.2f' % ms
+
+	if (ms < 99.95):
+		return '%.1f' % ms
+
+	return '%.0f' % min(ms, 9999)
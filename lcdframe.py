@@ -0,0 +1,421 @@
+#!/usr/bin/python
+#
+# Shadow framebuffer for a HD44780 character lcd
+#
+# Keeps a copy of what is currently shown on the display. Callers hand over
+# whole frames (or partial writes) and only the cells that differ from the
+# shadow copy are sent to the lcd, with neighbouring changes merged into a
+# single setCursor followed by one run of character writes.
+#
+# In threaded mode a writer thread does the transfers. render() and write()
+# only update the frame and return, and when several frames pile up while the
+# writer is busy only the latest one is drawn. Anything else that talks to the
+# lcd has to go through command() so it stays in order with the frames: a
+# frame that is still waiting when a command comes in is queued ahead of it.
+#
+# The frame and the shadow cover the whole 40 column DDRAM line of each row,
+# the display shows a window of it that hardware display shifts move. A line
+# longer than the display scrolls as a marquee: it is written into DDRAM once
+# and a step is a single shift command plus at most one new character. The
+# shift moves every row though, so the other rows have to be put back at the
+# new window position. When that costs more than rewriting the scrolling line
+# in place, the step is done that way instead. In threaded mode the writer
+# thread runs the steps, otherwise step() does.
+#
+# Every frame and command is timed, with the GPIO writes (when the lcd's GPIO
+# counts them, see stats.CountingGPIO) or I2C transactions and the controller
+# waits it took.
+
+import threading
+from clock import monotonic
+import stats
+
+# unchanged cells between two changed runs that are cheaper to resend than to
+# skip with another setCursor (a setCursor costs the same as one character)
+MERGE_GAP = 1
+
+# characters per row in the controller's display RAM
+DDRAM_COLS = 40
+
+# marquee pause before the first step, time per step and blanks between the end
+# of the text and its start coming round again
+MARQUEE_PAUSE = 1.5
+MARQUEE_STEP = .4
+MARQUEE_GAP = 4
+
+class LCDFrameBuffer:
+
+	def __init__(self, lcd, cols=16, rows=2, threaded=False):
+		self.lcd = lcd
+		self.cols = cols
+		self.rows = rows
+		self.threaded = threaded
+
+		# what we want in DDRAM and the visible part of it
+		self.frame = [[' '] * DDRAM_COLS for row in range(rows)]
+		self.visible = [' ' * cols for row in range(rows)]
+
+		# what we believe is in DDRAM, None for unknown cells
+		self.shadow = [[' '] * DDRAM_COLS for row in range(rows)]
+
+		# (DDRAM column, row) the lcd address counter points at, None if unknown
+		self.address = None
+
+		# DDRAM column shown in the first display column, wanted and on the lcd
+		self.target = 0
+		self.offset = 0
+
+		# the scrolling line, None when nothing scrolls
+		self.marquee = None
+
+		# writer thread state, frame and commands are shared under the lock.
+		# commands are (name, function, args) and include the frames they follow
+		self.lock = threading.Condition()
+		self.dirty = False
+		self.busy = False
+		self.commands = []
+
+		# custom characters waiting to be uploaded, by CGRAM slot
+		self.glyphs = {}
+
+		if (threaded == True):
+			self.writer = threading.Thread(target=self.writerLoop, name='lcdwriter')
+			self.writer.daemon = True
+			self.writer.start()
+
+	# replace the whole screen with a list of lines. the first line that is
+	# longer than the display scrolls, the others are cut off
+	def render(self, lines):
+		with self.lock:
+			scrolling = None
+
+			for row in range(self.rows):
+				if (row < len(lines)):
+					text = lines[row]
+				else:
+					text = ''
+
+				if ((scrolling == None) and (len(text) > self.cols)):
+					scrolling = row
+					self.startMarquee(row, text)
+					text = self.marqueeText()
+
+				self.visible[row] = text[:self.cols].ljust(self.cols)
+
+			if (scrolling == None):
+				self.marquee = None
+
+			self.place()
+
+		self.flush()
+
+	# write text at a position, leaving the rest of the frame alone
+	def write(self, column, row, text):
+		if (row >= self.rows):
+			row = self.rows - 1
+
+		with self.lock:
+			# writing over the scrolling line stops it where it is
+			if ((self.marquee != None) and (self.marquee['row'] == row)):
+				self.marquee = None
+
+			line = self.visible[row]
+			text = text[:max(self.cols - column, 0)]
+
+			self.visible[row] = line[:column] + text + line[column + len(text):]
+			self.place()
+
+		self.flush()
+
+	# blank the frame, only cells that are not already blank are sent
+	def clear(self):
+		self.render([])
+
+	# blank the frame with the lcd's clear command, eg before turning it off
+	def clearDisplay(self):
+		with self.lock:
+			self.marquee = None
+			self.visible = [' ' * self.cols for row in range(self.rows)]
+			self.frame = [[' '] * DDRAM_COLS for row in range(self.rows)]
+			self.target = 0
+
+			# the clear supersedes a frame that has not been drawn yet
+			self.dirty = False
+
+		self.command(self.cleared)
+
+	# clear the lcd, which blanks DDRAM, homes the address counter and undoes shifts
+	def cleared(self):
+		self.lcd.clear()
+
+		self.shadow = [[' '] * DDRAM_COLS for row in range(self.rows)]
+		self.address = (0, 0)
+		self.offset = 0
+
+	# forget what is on the display, eg after something else wrote to the lcd
+	def invalidate(self):
+		self.command(self.forget)
+
+	def forget(self):
+		self.shadow = [[None] * DDRAM_COLS for row in range(self.rows)]
+		self.address = None
+		self.offset = None
+
+	# put the visible lines into the frame at the window position. the scrolling
+	# line goes in whole unless 'full' is False
+	def place(self, frame=None, target=None, full=True):
+		if (frame == None):
+			frame = self.frame
+
+		if (target == None):
+			target = self.target
+
+		for row in range(self.rows):
+			if (full and (self.marquee != None) and (self.marquee['row'] == row)):
+				text = self.marqueeText()
+			else:
+				text = self.visible[row]
+
+			for i in range(len(text)):
+				frame[row][(target + i) % DDRAM_COLS] = text[i]
+
+	# keep a line that is already scrolling going, or start scrolling a new one
+	def startMarquee(self, row, text):
+		if ((self.marquee != None) and (self.marquee['row'] == row) and (self.marquee['text'] == text)):
+			return
+
+		self.marquee = {
+			'row': row,
+			'text': text,
+			'loop': text + ' ' * MARQUEE_GAP,
+			'position': 0,
+			'due': monotonic() + MARQUEE_PAUSE,
+		}
+
+	# a DDRAM line of the scrolling text from its current position
+	def marqueeText(self):
+		loop = self.marquee['loop']
+		position = self.marquee['position']
+
+		return (loop * (DDRAM_COLS / len(loop) + 2))[position:position + DDRAM_COLS]
+
+	# scroll the marquee one character, the other rows stay where they are
+	def step(self):
+		with self.lock:
+			self.advance()
+
+		self.flush()
+
+	def advance(self):
+		if (self.marquee == None):
+			return
+
+		self.marquee['position'] = (self.marquee['position'] + 1) % len(self.marquee['loop'])
+		self.marquee['due'] = monotonic() + MARQUEE_STEP
+		self.visible[self.marquee['row']] = self.marqueeText()[:self.cols]
+
+		# shift the display, or rewrite the scrolling line where it is
+		shifted = [row[:] for row in self.frame]
+		self.place(shifted, (self.target + 1) % DDRAM_COLS)
+
+		rewritten = [row[:] for row in self.frame]
+		self.place(rewritten, self.target, False)
+
+		if ((self.cost(shifted) + 1) <= self.cost(rewritten)):
+			self.frame = shifted
+			self.target = (self.target + 1) % DDRAM_COLS
+		else:
+			self.frame = rewritten
+
+		self.dirty = True
+
+	# instructions it takes to get from the current frame to 'frame', a write per
+	# changed cell and a setCursor per run
+	def cost(self, frame):
+		instructions = 0
+
+		for row in range(self.rows):
+			for start, end in self.changedRuns(frame, row, self.frame):
+				instructions += end - start + 1
+
+		return instructions
+
+	# upload the 8 rows of a custom character to CGRAM slot 0-7. it goes out
+	# ahead of the next frame, so a frame never shows a glyph that is not there yet
+	def createChar(self, slot, rows):
+		with self.lock:
+			self.glyphs[slot] = rows
+
+		self.flush()
+
+	# move the lcd cursor to a display position and remember where the address counter points
+	def setCursor(self, column, row):
+		self.command(self.moveCursor, column, row)
+
+	def moveCursor(self, column, row):
+		if (self.offset == None):
+			self.shiftTo(self.target)
+
+		self.moveAddress((self.offset + column) % DDRAM_COLS, row)
+
+	def moveAddress(self, column, row):
+		self.lcd.setCursor(column, row)
+		self.address = (column, row)
+
+	# move the display window with shift commands, whichever way round is shorter
+	def shiftTo(self, target):
+		# not known after forget(), home puts it back to 0
+		if (self.offset == None):
+			self.lcd.home()
+			self.offset = 0
+			self.address = None
+
+		distance = (target - self.offset) % DDRAM_COLS
+
+		if (distance <= DDRAM_COLS / 2):
+			for i in range(distance):
+				self.lcd.DisplayLeft()
+		else:
+			for i in range(DDRAM_COLS - distance):
+				self.lcd.scrollDisplayRight()
+
+		self.offset = target
+
+	# call function(*args) on the lcd, after the frames drawn so far
+	def command(self, function, *args):
+		if (self.threaded == False):
+			self.measure('lcd.' + function.__name__, function, *args)
+			return
+
+		with self.lock:
+			if (self.dirty == True):
+				self.commands.append(('lcd.frame', self.transfer, ([row[:] for row in self.frame], self.target)))
+				self.dirty = False
+
+			self.commands.append(('lcd.' + function.__name__, function, args))
+			self.lock.notifyAll()
+
+	# wait until the writer thread has sent everything queued so far
+	def sync(self):
+		if (self.threaded == False):
+			return
+
+		with self.lock:
+			while (self.dirty or self.commands or self.busy):
+				self.lock.wait()
+
+	# return a list of (start, end) runs of cells of a frame that need to be sent for a row,
+	# compared to the shadow or to another frame
+	def changedRuns(self, frame, row, shadow=None):
+		if (shadow == None):
+			shadow = self.shadow
+
+		frame = frame[row]
+		shadow = shadow[row]
+		runs = []
+
+		for column in range(DDRAM_COLS):
+			if (frame[column] == shadow[column]):
+				continue
+
+			if (runs and (column - runs[-1][1]) <= MERGE_GAP):
+				runs[-1][1] = column + 1
+			else:
+				runs.append([column, column + 1])
+
+		return runs
+
+	# send every changed cell to the lcd, or hand the frame to the writer thread
+	def flush(self):
+		if (self.threaded == False):
+			self.measure('lcd.frame', self.transfer, self.frame, self.target)
+			return
+
+		with self.lock:
+			self.dirty = True
+			self.lock.notifyAll()
+
+	def transfer(self, frame, target):
+		if (target != self.offset):
+			self.shiftTo(target)
+
+		with self.lock:
+			glyphs = self.glyphs
+			self.glyphs = {}
+
+		for slot in sorted(glyphs):
+			self.lcd.createChar(slot, glyphs[slot])
+
+			# the address counter now points into CGRAM
+			self.address = None
+
+		for row in range(self.rows):
+			for start, end in self.changedRuns(frame, row):
+				if (self.address != (start, row)):
+					self.moveAddress(start, row)
+
+				self.lcd.message(''.join(frame[row][start:end]))
+
+				self.shadow[row][start:end] = frame[row][start:end]
+				self.address = (end, row)
+
+	# writer thread, frames that were replaced before it got to them are never
+	# drawn. the queued commands go first, the current frame came after them
+	def writerLoop(self):
+		while True:
+			with self.lock:
+				while ((self.dirty == False) and (len(self.commands) == 0)):
+					self.busy = False
+					self.lock.notifyAll()
+
+					if (self.marquee == None):
+						self.lock.wait()
+						continue
+
+					timeout = self.marquee['due'] - monotonic()
+
+					if (timeout > 0):
+						self.lock.wait(timeout)
+					else:
+						self.advance()
+
+				self.busy = True
+
+				frame = None
+				if (self.dirty == True):
+					frame = [row[:] for row in self.frame]
+					target = self.target
+					self.dirty = False
+
+				commands = self.commands
+				self.commands = []
+
+			for name, function, args in commands:
+				self.measure(name, function, *args)
+
+			if (frame != None):
+				self.measure('lcd.frame', self.transfer, frame, target)
+
+	# run an lcd operation, recording how long it took, its GPIO writes and lcd waits
+	def measure(self, name, function, *args):
+		writes = self.busWrites()
+		waited = self.lcd.waited
+		start = monotonic()
+
+		function(*args)
+
+		stats.observe(name, monotonic() - start)
+		stats.add(name + '.writes', self.busWrites() - writes, 'calls')
+		stats.add(name + '.wait', (self.lcd.waited - waited) * 1000, 'ms')
+
+	# GPIO writes so far, or bus transactions for an lcd on an I2C backpack
+	def busWrites(self):
+		if (hasattr(self.lcd, 'transactions')):
+			return self.lcd.transactions
+
+		return getattr(self.lcd.GPIO, 'outputs', 0)
+
+	# return what the display shows as a list of strings
+	def lines(self):
+		with self.lock:
+			return self.visible[:]
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+#
+# Raspberry Pi menu daemon
+#
+# Runs the menu in a long lived process. Reload in the system menu reloads
+# the menu and diagnostic modules in place, keeping the initialised lcd,
+# GPIO, button events and task runtime, so the display never goes blank.
+# If the menu itself crashes it is restarted without restarting the process.
+
+import sys, traceback
+from time import sleep
+from clock import monotonic
+import startmenu
+
+# modules reloaded by Reload, in dependency order. the lcd driver, framebuffer, glyphs,
+# GPIO, button events and runtime hold the hardware state and are never reloaded
+RELOAD_MODULES = ['sysinfo', 'statuscache', 'portscan', 'discovery', 'throughput', 'latency', 'dnsbench', 'bandwidth', 'menutree', 'startmenu']
+
+# seconds the reload time stays on the display
+REPORT_DELAY = 1
+
+# reload the menu code and hand it the hardware, returns how long it took in ms
+def reloadMenu():
+	start = monotonic()
+
+	hardware = startmenu.hardware()
+	startmenu.suspend()
+
+	for name in RELOAD_MODULES:
+		if (name in sys.modules):
+			reload(sys.modules[name])
+
+	startmenu.setup(hardware)
+
+	return (monotonic() - start) * 1000
+
+def main():
+	startmenu.setup()
+
+	while True:
+		try:
+			startmenu.mainMenu()
+		except startmenu.Reload:
+			try:
+				elapsed = reloadMenu()
+			except Exception:
+				# a module that no longer imports, let menuloop.sh start over
+				traceback.print_exc()
+				sys.exit(1)
+
+			print >> sys.stderr, 'menu reloaded in %.1f ms' % elapsed
+
+			startmenu.lcdPrint(0, 0, 'Reloaded in', True)
+			startmenu.lcdPrint(0, 1, '%d ms' % elapsed)
+			sleep(REPORT_DELAY)
+		except Exception, err:
+			traceback.print_exc()
+
+			startmenu.lcdPrint(0, 0, 'Menu crashed', True)
+			startmenu.lcdPrint(0, 1, err.__class__.__name__[:16])
+			sleep(REPORT_DELAY)
+
+if __name__ == '__main__':
+	main()
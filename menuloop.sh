@@ -1,7 +1,8 @@
 #!/bin/bash
 
+# menud.py reloads the menu in place, this loop only restarts it if it dies
 while /bin/true; do
-	/rpi/startmenu.py
+	/rpi/menud.py
 
 	sleep 5
 done
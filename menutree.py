@@ -0,0 +1,131 @@
+#!/usr/bin/python
+#
+# Declarative menus
+#
+# Screens are described as data: a Menu is a list of MenuItems and an item
+# either opens a submenu, runs an action or just shows a value. One
+# MenuEngine drives all of them. The page shown is worked out from the
+# selected index alone, and every menu remembers its position, so going back
+# to a menu shows it the way it was left.
+
+UP = 'btnUp'
+DOWN = 'btnDown'
+BACK = 'btnBack'
+SELECT = 'btnSelect'
+
+# resolve something that may be given as a value or as a function returning it
+def resolve(value):
+	if (callable(value)):
+		return value()
+
+	return value
+
+class MenuItem:
+
+	# action is a Menu to open or a function to run on select, value is the text
+	# (or a function returning it) shown under the label on pages style menus
+	def __init__(self, label, action=None, value=None):
+		self.label = label
+		self.action = action
+		self.value = value
+
+class Menu:
+
+	# items is a list of MenuItems or a function returning one. prompt menus show
+	# two items per page with a cursor, pages menus show one item per page with
+	# its value on the second line. refresh(event) returns True when an event
+	# means the items have to be fetched again
+	def __init__(self, label, items, prompt=True, refresh=None):
+		self.label = label
+		self.items = items
+		self.prompt = prompt
+		self.refresh = refresh
+
+	def resolveItems(self):
+		return resolve(self.items) or []
+
+class MenuEngine:
+
+	# readInput() blocks and returns (button, event), button is None when the
+	# event was not a press. runAction(function) runs an item's action.
+	# idle() is called when readInput() returned nothing, eg to start the
+	# screen saver. the page is redrawn after every input, the framebuffer
+	# only sends what changed
+	def __init__(self, screen, readInput, runAction, idle=None):
+		self.screen = screen
+		self.readInput = readInput
+		self.runAction = runAction
+		self.idle = idle
+
+		# selected index of every menu that has been opened
+		self.positions = {}
+
+	# lines for the page holding 'index'
+	def page(self, menu, items, index):
+		if (menu.prompt == False):
+			if (index >= len(items)):
+				return []
+
+			item = items[index]
+
+			return [resolve(item.label), resolve(item.value) or '']
+
+		first = index - (index % 2)
+		lines = []
+
+		for row in range(2):
+			if ((first + row) >= len(items)):
+				lines.append('')
+				continue
+
+			label = resolve(items[first + row].label)
+
+			if ((first + row) == index):
+				lines.append('> ' + label)
+			else:
+				lines.append('  ' + label)
+
+		return lines
+
+	def draw(self, menu, items, index):
+		self.screen.render(self.page(menu, items, index))
+
+	# run a menu until Back is pressed. 'root' menus ignore Back
+	def run(self, menu, root=False):
+		items = menu.resolveItems()
+		index = min(self.positions.get(menu, 0), max(len(items) - 1, 0))
+
+		self.draw(menu, items, index)
+
+		while True:
+			button, event = self.readInput()
+
+			if (button == UP):
+				index = max(index - 1, 0)
+
+			elif (button == DOWN):
+				index = min(index + 1, max(len(items) - 1, 0))
+
+			elif ((button == BACK) and (root == False)):
+				self.positions[menu] = index
+				return
+
+			elif ((button == SELECT) and (index < len(items))):
+				self.positions[menu] = index
+				action = items[index].action
+
+				if (isinstance(action, Menu)):
+					self.run(action)
+				elif (action != None):
+					self.runAction(action)
+
+				items = menu.resolveItems()
+
+			elif ((event != None) and (menu.refresh != None) and menu.refresh(event)):
+				items = menu.resolveItems()
+
+			elif ((event == None) and (self.idle != None)):
+				self.idle()
+
+			index = min(index, max(len(items) - 1, 0))
+			self.draw(menu, items, index)
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+#
+# TCP connect port scanner
+#
+# Opens non-blocking connections to a window of ports at a time and waits
+# for them with poll(), so a hundred ports take about as long as the slowest
+# few instead of the sum of all of them. Results are handed to a callback as
+# they come in.
+
+import errno, select, socket
+from clock import monotonic
+
+OPEN = 'open'
+CLOSED = 'closed'
+FILTERED = 'filtered'
+
+# connections in flight at once and how long each port gets to answer
+WINDOW = 64
+TIMEOUT = 1.0
+
+# most common tcp ports, most common first
+TOP_PORTS = [
+	80, 23, 443, 21, 22, 25, 3389, 110, 445, 139, 143, 53, 135, 3306, 8080,
+	1723, 111, 995, 993, 5900, 1025, 587, 8888, 199, 1720, 465, 548, 113, 81,
+	6001, 10000, 514, 5060, 179, 1026, 2000, 8443, 8000, 32768, 554, 26, 1433,
+	49152, 2001, 515, 8008, 49154, 1027, 5666, 646, 5000, 5631, 631, 49153,
+	8081, 2049, 88, 79, 5800, 106, 2121, 1110, 49155, 6000, 513, 990, 5357,
+	427, 49156, 543, 544, 5101, 144, 7, 389, 8009, 3128, 444, 9999, 5009,
+	7070, 5190, 3000, 5432, 1900, 3986, 13, 1029, 9, 5051, 6646, 49157, 1028,
+	873, 1755, 2717, 4899, 9100, 119, 37,
+]
+
+# the 'count' most common tcp ports
+def topPorts(count=100):
+	return TOP_PORTS[:count]
+
+# parse a port list like '22,80,8000-8080' into a list of ports
+def parsePorts(text):
+	ports = []
+
+	for part in text.split(','):
+		part = part.strip()
+
+		if (part == ''):
+			continue
+
+		if ('-' in part):
+			first, last = [int(port) for port in part.split('-', 1)]
+
+			if (last < first):
+				raise ValueError('port range %s is reversed' % part)
+
+			ports.extend(range(first, last + 1))
+		else:
+			ports.append(int(part))
+
+	for port in ports:
+		if ((port < 1) or (port > 65535)):
+			raise ValueError('port %d out of range' % port)
+
+	return ports
+
+# state of a finished connect from its error number
+def connectState(err):
+	if (err == 0):
+		return OPEN
+
+	if (err == errno.ECONNREFUSED):
+		return CLOSED
+
+	return FILTERED
+
+# connect to every (host, port) in targets, which may be a generator, keeping
+# up to 'window' connections in flight
+#
+# callback(host, port, state) is called as each connection finishes and
+# cancelled() is checked between polls, a cancelled run stops early
+def connectMany(targets, window=WINDOW, timeout=TIMEOUT, callback=None, cancelled=None):
+	pending = iter(targets)
+	active = {}
+	poller = select.poll()
+
+	def close(fd):
+		sock, target, deadline = active.pop(fd)
+		poller.unregister(fd)
+		sock.close()
+
+		return target
+
+	def finish(target, state):
+		if (callback != None):
+			callback(target[0], target[1], state)
+
+	try:
+		while True:
+			# keep the window full, connects that fail straight away finish here
+			while ((len(active) < window) and ((cancelled == None) or (cancelled() == False))):
+				try:
+					target = pending.next()
+				except StopIteration:
+					break
+
+				sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+				sock.setblocking(0)
+				err = sock.connect_ex(target)
+
+				if (err in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY)):
+					active[sock.fileno()] = (sock, target, monotonic() + timeout)
+					poller.register(sock, select.POLLOUT)
+				else:
+					sock.close()
+					finish(target, connectState(err))
+
+			if (len(active) == 0):
+				break
+
+			if ((cancelled != None) and cancelled()):
+				break
+
+			now = monotonic()
+			wait = min([deadline for sock, target, deadline in active.values()]) - now
+
+			for fd, flags in poller.poll(max(wait, 0) * 1000):
+				sock = active[fd][0]
+				err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+				finish(close(fd), connectState(err))
+
+			# connections that did not get an answer in time
+			now = monotonic()
+
+			for fd in [fd for fd, (sock, target, deadline) in active.items() if deadline <= now]:
+				finish(close(fd), FILTERED)
+	finally:
+		for fd in active.keys():
+			close(fd)
+
+# scan ports on host and return a dict of port to OPEN, CLOSED or FILTERED
+#
+# callback(port, state, done, total) is called as each port finishes and
+# cancelled() is checked between polls, a cancelled scan returns what it has
+def scan(host, ports, window=WINDOW, timeout=TIMEOUT, callback=None, cancelled=None):
+	results = {}
+	total = len(ports)
+
+	def finish(host, port, state):
+		results[port] = state
+
+		if (callback != None):
+			callback(port, state, len(results), total)
+
+	connectMany([(host, port) for port in ports], window, timeout, finish, cancelled)
+
+	return results
+
+# sorted list of open ports from a scan result
+def openPorts(results):
+	return sorted([port for port, state in results.items() if state == OPEN])
@@ -0,0 +1,255 @@
+#!/usr/bin/python
+#
+# Menu runtime
+#
+# The menu thread blocks on one event queue. Button events, task progress
+# and task completion all arrive on it, so a screen can keep drawing and
+# reacting to buttons while slow work (shell commands, led patterns, scans)
+# runs as a Task on its own thread. Tasks can be cancelled, shell commands
+# are killed along with their children, and can be given a hard timeout.
+# Their output is posted as progress line by line as it comes.
+
+import os, select, signal, threading, time
+from clock import monotonic
+import stats
+
+PROGRESS = 'progress'
+DONE = 'done'
+
+# how often a shell task checks on its command while there is no output, and
+# once the output has closed
+POLL_TIME = .25
+EXIT_POLL_TIME = .05
+
+class TaskEvent:
+
+	def __init__(self, task, kind, text=None):
+		self.task = task
+		self.kind = kind
+		self.text = text
+
+	def __repr__(self):
+		return '<TaskEvent %s %s %r>' % (self.task.name, self.kind, self.text)
+
+class Task:
+
+	# function is called as function(task, *args) on a new thread
+	def __init__(self, queue, function, args=(), name=None):
+		self.queue = queue
+		self.function = function
+		self.args = args
+		self.name = name or function.__name__
+
+		self.result = None
+		self.error = None
+
+		self.stopping = threading.Event()
+		self.finished = threading.Event()
+
+		self.thread = threading.Thread(target=self.run, name=self.name)
+		self.thread.daemon = True
+
+	def start(self):
+		self.thread.start()
+		return self
+
+	def run(self):
+		try:
+			self.result = self.function(self, *self.args)
+		except Exception, err:
+			self.error = err
+
+		self.finished.set()
+		self.post(DONE)
+
+	def post(self, kind, text=None):
+		if (self.queue != None):
+			self.queue.put(TaskEvent(self, kind, text))
+
+	# report progress to whoever is waiting on the queue
+	def progress(self, text):
+		self.post(PROGRESS, text)
+
+	# ask the task to stop, the task function has to check cancelled()
+	def cancel(self):
+		self.stopping.set()
+
+	def cancelled(self):
+		return self.stopping.isSet()
+
+	def running(self):
+		return not self.finished.isSet()
+
+	# sleep that wakes up early on cancel, returns True if cancelled
+	def sleep(self, seconds):
+		self.stopping.wait(seconds)
+
+		return self.cancelled()
+
+	# wait for the task to finish, returns False on timeout
+	def join(self, timeout=None):
+		self.finished.wait(timeout)
+
+		return not self.running()
+
+class ShellTask(Task):
+
+	# run shell commands one after another, stopping at the first failure. all of
+	# them together get 'timeout' seconds before they are killed
+	def __init__(self, queue, commands, name=None, timeout=None):
+		Task.__init__(self, queue, self.runCommands, (commands,), name or commands[0])
+
+		self.lock = threading.Lock()
+		self.process = None
+		self.reaped = False
+		self.returncode = None
+		self.timeout = timeout
+		self.timedOut = False
+		self.lastLine = ''
+
+	def runCommands(self, task, commands):
+		from subprocess import Popen, PIPE, STDOUT
+
+		output = []
+		deadline = None
+
+		if (self.timeout != None):
+			deadline = monotonic() + self.timeout
+
+		for cmd in commands:
+			self.progress(cmd)
+
+			with self.lock:
+				if (self.cancelled() or self.timedOut):
+					break
+
+				# own process group so cancel() also kills whatever the shell started
+				self.process = Popen(cmd, shell=True, stdout=PIPE, stderr=STDOUT, preexec_fn=os.setsid)
+				self.reaped = False
+
+			timer = None
+
+			if (deadline != None):
+				timer = threading.Timer(max(deadline - monotonic(), 0), self.expire)
+				timer.daemon = True
+				timer.start()
+
+			start = monotonic()
+			output.append(self.readOutput(self.process))
+			self.returncode = self.process.returncode
+
+			stats.observe('shell', monotonic() - start)
+
+			if (timer != None):
+				timer.cancel()
+
+			if ((self.returncode != 0) or self.timedOut):
+				break
+
+		return ''.join(output).rstrip()
+
+	# read a command's output until it exits, posting every line. a daemon it
+	# started may keep the pipe open, so we stop once the command itself is gone,
+	# and a command can close its output before it exits, so we wait for both
+	def readOutput(self, process):
+		fd = process.stdout.fileno()
+		output = []
+		pending = ''
+		closed = False
+
+		while True:
+			if ((closed == False) and select.select([fd], [], [], POLL_TIME)[0]):
+				data = os.read(fd, 4096)
+
+				if (data != ''):
+					output.append(data)
+
+					# progress bars redraw their line with a carriage return
+					lines = (pending + data.replace('\r', '\n')).split('\n')
+					pending = lines.pop()
+
+					for line in lines:
+						self.line(line)
+
+					continue
+
+				closed = True
+
+			if (self.reap(process)):
+				break
+
+			if (closed):
+				time.sleep(EXIT_POLL_TIME)
+
+		self.line(pending)
+		process.stdout.close()
+
+		return ''.join(output)
+
+	def line(self, text):
+		text = text.strip()
+
+		if (text != ''):
+			self.lastLine = text
+			self.progress(text)
+
+	# collect the command's exit status if it has one. only the task's own thread
+	# reaps, under the lock so kill() never signals a pid that is already gone
+	def reap(self, process):
+		with self.lock:
+			if (process.poll() != None):
+				self.reaped = True
+
+			return self.reaped
+
+	# the timeout ran out, kill the command
+	def expire(self):
+		with self.lock:
+			self.timedOut = True
+			self.kill()
+
+	def cancel(self):
+		with self.lock:
+			Task.cancel(self)
+			self.kill()
+
+	# called with the lock held
+	def kill(self):
+		if ((self.process != None) and (self.reaped == False)):
+			try:
+				os.killpg(self.process.pid, signal.SIGTERM)
+			except OSError:
+				pass
+
+class Runtime:
+
+	# queue is shared with the button events so one wait() sees everything
+	def __init__(self, queue):
+		self.queue = queue
+		self.tasks = []
+
+	# start function(task, *args) in the background
+	def spawn(self, function, *args):
+		return self.track(Task(self.queue, function, args))
+
+	# start shell commands in the background, shell(cmd, ..., timeout=seconds)
+	def shell(self, *commands, **options):
+		return self.track(ShellTask(self.queue, list(commands), timeout=options.get('timeout')))
+
+	def track(self, task):
+		self.tasks = [t for t in self.tasks if t.running()]
+		self.tasks.append(task)
+
+		return task.start()
+
+	# cancel everything still running, eg on exit
+	def cancelAll(self):
+		for task in self.tasks:
+			task.cancel()
+
+	# cancel everything and give the tasks up to 'timeout' seconds each to finish
+	def shutdown(self, timeout=1.0):
+		self.cancelAll()
+
+		for task in self.tasks:
+			task.join(timeout)
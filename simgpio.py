@@ -0,0 +1,159 @@
+#!/usr/bin/python
+#
+# Simulated GPIO
+#
+# A stand in for RPi.GPIO so the menu, the lcd driver and the button handling
+# can run on any Linux box. Pin levels are kept in memory and every level
+# change is logged with a timestamp. Watchers see each change as it happens,
+# which is how hd44780sim.py follows the lcd bus, and inputs can be driven
+# from outside, eg to press a button.
+#
+# PORTABLEPI_SIM=1 startmenu.py runs the whole menu on it.
+
+import threading
+from clock import monotonic
+
+class SimGPIO:
+
+	# constants as RPi.GPIO has them
+	BCM = 11
+	BOARD = 10
+	OUT = 0
+	IN = 1
+	LOW = 0
+	HIGH = 1
+	RISING = 31
+	FALLING = 32
+	BOTH = 33
+	PUD_OFF = 20
+	PUD_DOWN = 21
+	PUD_UP = 22
+
+	# log=False stops recording transitions, eg for long benchmark runs
+	def __init__(self, log=True, clock=monotonic):
+		self.clock = clock
+		self.logging = log
+		self.lock = threading.Lock()
+
+		self.mode = None
+		self.directions = {}
+		self.levels = {}
+		self.detects = {}
+
+		# (time, pin, level) for every level change, and functions called as watcher(pin, level, time)
+		self.log = []
+		self.watchers = []
+
+		# calls made by the code under test
+		self.outputs = 0
+		self.inputs = 0
+
+	def setwarnings(self, flag):
+		pass
+
+	def setmode(self, mode):
+		self.mode = mode
+
+	def setup(self, channel, direction, pull_up_down=PUD_OFF, initial=None):
+		for pin in self.channels(channel):
+			self.directions[pin] = direction
+
+			if ((direction == self.OUT) and (initial != None)):
+				self.set(pin, initial)
+			elif ((direction == self.IN) and (pin not in self.levels)):
+				# buttons are wired active low with pull ups, so an input reads high until driven
+				self.levels[pin] = int(pull_up_down != self.PUD_DOWN)
+
+	# set one pin or, like RPi.GPIO 0.5.8 and later, a list of pins to one level or a list of levels
+	def output(self, channel, value):
+		pins = self.channels(channel)
+
+		if (isinstance(value, (list, tuple))):
+			if (len(value) != len(pins)):
+				raise RuntimeError('Number of channels != number of values')
+			values = value
+		else:
+			values = [value] * len(pins)
+
+		self.outputs += 1
+
+		for pin, level in zip(pins, values):
+			if (self.directions.get(pin) != self.OUT):
+				raise RuntimeError('The GPIO channel has not been set up as an OUTPUT')
+
+			self.set(pin, level)
+
+	def input(self, channel):
+		self.inputs += 1
+
+		if (channel not in self.directions):
+			raise RuntimeError('You must setup() the GPIO channel first')
+
+		return self.levels.get(channel, self.LOW)
+
+	def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+		self.detects[channel] = (edge, [])
+
+		if (callback != None):
+			self.add_event_callback(channel, callback)
+
+	def add_event_callback(self, channel, callback):
+		self.detects[channel][1].append(callback)
+
+	def remove_event_detect(self, channel):
+		self.detects.pop(channel, None)
+
+	def cleanup(self, channel=None):
+		for pin in self.channels(channel or self.directions.keys()):
+			self.directions.pop(pin, None)
+			self.detects.pop(pin, None)
+
+	def channels(self, channel):
+		if (isinstance(channel, (list, tuple))):
+			return list(channel)
+
+		return [channel]
+
+	# change a pin level, logging it and telling watchers and edge callbacks
+	def set(self, pin, level):
+		level = int(bool(level))
+
+		with self.lock:
+			if (self.levels.get(pin) == level):
+				return
+
+			self.levels[pin] = level
+			now = self.clock()
+
+			if (self.logging):
+				self.log.append((now, pin, level))
+
+		for watcher in self.watchers:
+			watcher(pin, level, now)
+
+		detect = self.detects.get(pin)
+
+		if (detect != None):
+			edge, callbacks = detect
+
+			if ((edge == self.BOTH) or (edge == (self.RISING if level else self.FALLING))):
+				for callback in callbacks:
+					callback(pin)
+
+	# drive an input from outside, eg a button or the lcd busy flag
+	def drive(self, pin, level):
+		self.set(pin, level)
+
+	# buttons pull their pin low while pressed
+	def press(self, pin):
+		self.drive(pin, self.LOW)
+
+	def release(self, pin):
+		self.drive(pin, self.HIGH)
+
+	def watch(self, watcher):
+		self.watchers.append(watcher)
+
+	def clearLog(self):
+		with self.lock:
+			self.log = []
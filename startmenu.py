@@ -5,15 +5,40 @@
 #
 # Designed to work with a raspberry pi that has a 16x2 character lcd and 4 push buttons
 # connected to various GPIO pins
+#
+# Only what the main menu needs is imported up front. Modules used by a single
+# screen (netifaces, subprocess, the scanners) are imported when that screen
+# first runs, to keep the time from start to the first menu frame short.
+# bench.py startup measures it.
+
+from clock import monotonic
+
+# when we started, for the startup benchmark
+STARTED = monotonic()
 
 from Adafruit_CharLCD import Adafruit_CharLCD
-from subprocess import * 
-from time import sleep, strftime
-from datetime import datetime
-import thread, signal, sys, os, gc, statvfs
-import netifaces as ni
-import nmap
-import RPi.GPIO as GPIO
+from lcdframe import LCDFrameBuffer
+from buttonevents import ButtonEvents, PRESS, RELEASE, REPEAT, LONGPRESS
+from runtime import Runtime, PROGRESS
+from statuscache import StatusCache
+from menutree import Menu, MenuItem, MenuEngine
+from glyphs import GlyphManager
+import stats
+import sysinfo
+from time import sleep
+import signal, sys, os, traceback
+
+# PORTABLEPI_SIM=1 runs the menu without a pi, on a simulated GPIO with an emulated
+# lcd drawn in the terminal. w/s/a/d press up, down, back and select
+SIMULATED = (os.environ.get('PORTABLEPI_SIM') != None)
+
+if (SIMULATED):
+	from simgpio import SimGPIO
+	GPIO = SimGPIO(log=False)
+else:
+	import RPi.GPIO as GPIO
+
+IMPORTED = monotonic()
 
 GPIO.setwarnings(False)
 
@@ -22,8 +47,6 @@ MEDIUM_DELAY = .5
 SHORT_DELAY = .25
 MICRO_DELAY = .10
 
-PROMPT = '>'
-
 # GPIO pins for different functions
 btnUp = 14
 btnDown = 15
@@ -33,17 +56,46 @@ ledBacklight = 7
 ledStatus1 = 1
 lesStatus2 = 11
 
-CursorPosition = 0
-CurrentPage = 0
-CurrentMenuItem = 0
-ssaverTime = 0
 ssaverTimeout = 600
 
+# seconds a network job gets before it is killed, and between spinner frames
+jobTimeout = 45
+spinnerDelay = .25
+
+# I2C address of the lcd backpack and its port expander ('pcf8574' or 'mcp23017'),
+# None for an lcd wired straight to the GPIO pins
+lcdI2CAddress = None
+lcdExpander = 'pcf8574'
+
 # default button states to True (not pressed)
 buttons = {'btnUp': True, 'btnDown': True, 'btnBack': True, 'btnSelect': True}
 
-# create lcd object
-lcd = Adafruit_CharLCD()
+# debounced button events and the background task runtime, created in setup()
+events = None
+runtime = None
+
+# cached system status for the info page and the task keeping it fresh
+status = StatusCache()
+statusTask = None
+
+# lcd object and the framebuffer all menu drawing goes through, created in setup().
+# the framebuffer's writer thread does the transfers so drawing never holds up button handling
+lcd = None
+screen = None
+
+# drives every menu below, created in setup()
+engine = None
+
+# custom characters in the lcd's CGRAM, created in setup()
+glyphs = None
+
+# the press menuInput last returned, for the button handling latency
+handling = None
+
+# raised by the Reload menu item, menud.py reloads the menu code in place when it
+# catches it and a standalone startmenu.py exits so menuloop.sh starts it again
+class Reload(Exception):
+	pass
 
 # convert an IP address string into an array of octets
 def IPToArray(ip):
@@ -55,27 +107,34 @@ def IPToArray(ip):
 def ArrayToIP(iparray):
 	return str(iparray[0]) + '.' + str(iparray[1]) + '.' + str(iparray[2]) + '.' + str(iparray[3])
 
-# start a background thread to blink LED 'delay' number of times
+# start a background task to blink LED 'delay' number of times
 def ledBlink(ledpin, number, delay=SHORT_DELAY):
-	thread.start_new_thread(ledBlinkThread, (ledpin, number, delay))
+	return runtime.spawn(ledBlinkTask, ledpin, number, delay)
 
-# blink led
-def ledBlinkThread(ledpin, number, delay=SHORT_DELAY):
+# blink led until done or cancelled
+def ledBlinkTask(task, ledpin, number, delay=SHORT_DELAY):
 	GPIO.output(ledpin, GPIO.LOW)
 	
 	for num in range(0,number):
 		GPIO.output(ledpin, GPIO.HIGH)
 		
-		sleep(delay)
+		if (task.sleep(delay)):
+			break
+			
 		GPIO.output(ledpin, GPIO.LOW)
-		sleep(delay)
+		
+		if (task.sleep(delay)):
+			break
 		
 	GPIO.output(ledpin, GPIO.LOW)
 
 # handle SIGINT
 def signal_handler(signal, frame):
-	lcd.clear()
-        lcd.noDisplay()
+	runtime.cancelAll()
+	
+	screen.clearDisplay()
+        screen.command(lcd.noDisplay)
+        screen.sync()
         
 	GPIO.output(ledBacklight, True)
         sleep(MICRO_DELAY)
@@ -90,11 +149,11 @@ def signal_handler(signal, frame):
 	
 def free_bytes(path): 
 	stats = os.statvfs(path) 
-	return stats[statvfs.F_BSIZE] * stats[statvfs.F_BFREE] 
+	return stats.f_bsize * stats.f_bfree
 
 def avail_bytes(path): 
 	stats = os.statvfs(path) 
-	return stats[statvfs.F_BSIZE] * stats[statvfs.F_BAVAIL]
+	return stats.f_bsize * stats.f_bavail
 
 # present a method to input an IP address
 # if isNetmask == False then you cant select 255 for any given octet
@@ -108,17 +167,22 @@ def ipInput(ip, label, isNetmask=False):
 	if (isNetmask == True):
 		netMaskMax = 255
 		
-	lcdPrint(0, 0, label, True)
-	lcdPrint(0, 1, str(iparray[0]).zfill(3) + '.' +  str(iparray[1]).zfill(3) + '.' +  str(iparray[2]).zfill(3) + '.' +  str(iparray[3]).zfill(3))
-	
-	lcd.setCursor(2, 1)
-	lcd.cursor()
-	lcd.blink()
+	def show():
+		lcdPrint(0, 0, label, True)
+		lcdPrint(0, 1, str(iparray[0]).zfill(3) + '.' +  str(iparray[1]).zfill(3) + '.' +  str(iparray[2]).zfill(3) + '.' +  str(iparray[3]).zfill(3))
+		
+		screen.setCursor(octetPos+2*(octetPos+1)+octetPos, 1)
 	
-	sleep(MICRO_DELAY)
+	show()
+	screen.command(lcd.cursor)
+	screen.command(lcd.blink)
 	
 	while 1:
-		readButtons()
+		# the screen saver blanked the display, put the address back
+		if (readButtons() == None):
+			checkScreenSaver()
+			show()
+			continue
 		
 		if (buttons['btnUp'] == False):
 			if (iparray[octetPos] < netMaskMax):
@@ -130,8 +194,7 @@ def ipInput(ip, label, isNetmask=False):
 					iparray[octetPos] = 0
 			
 			lcdPrint((octetPos+2*(octetPos+1)+octetPos)-2, 1, str(iparray[octetPos]).zfill(3))
-			
-			sleep(MICRO_DELAY)
+			screen.setCursor(octetPos+2*(octetPos+1)+octetPos, 1)
 			
 		if (buttons['btnDown'] == False):
 			if (octetPos == 0):
@@ -145,13 +208,12 @@ def ipInput(ip, label, isNetmask=False):
 				iparray[octetPos] = netMaskMax
 			
 			lcdPrint((octetPos+2*(octetPos+1)+octetPos)-2, 1, str(iparray[octetPos]).zfill(3))
-			
-			sleep(MICRO_DELAY)
+			screen.setCursor(octetPos+2*(octetPos+1)+octetPos, 1)
 			
 		if (buttons['btnSelect'] == False):
 			if (octetPos == 3):
-				lcd.noBlink()
-				lcd.noCursor()
+				screen.command(lcd.noBlink)
+				screen.command(lcd.noCursor)
 				
 				return ArrayToIP(iparray)
 				
@@ -159,465 +221,839 @@ def ipInput(ip, label, isNetmask=False):
 				if (octetPos != 3):
 					octetPos += 1
 					
-				lcd.setCursor(octetPos+2*(octetPos+1)+octetPos, 1)
-				sleep(SHORT_DELAY)
+				screen.setCursor(octetPos+2*(octetPos+1)+octetPos, 1)
 				
 		if (buttons['btnBack'] == False):
 			if (octetPos == 0):
 				iparray[0] = 0
 				
-				lcd.noBlink()
-				lcd.noCursor()
+				screen.command(lcd.noBlink)
+				screen.command(lcd.noCursor)
 				
 				return 0
 			
 			octetPos -= 1
 			
-			lcd.setCursor(octetPos+2*(octetPos+1)+octetPos, 1)
+			screen.setCursor(octetPos+2*(octetPos+1)+octetPos, 1)
+
+# join as many items as fit on one lcd line
+def fitItems(items, width=16):
+	line = ''
+	
+	for item in items:
+		if (line == ''):
+			candidate = str(item)
+		else:
+			candidate = line + ' ' + str(item)
+		
+		if (len(candidate) > width):
+			break
+			
+		line = candidate
+	
+	return line
+
+# scan ports in the background, reporting the count and the latest open ports
+def portScanTask(task, ip, ports):
+	import portscan
+	
+	found = []
+	
+	def progress(port, state, done, total):
+		if (state == portscan.OPEN):
+			found.insert(0, port)
 			
-			sleep(SHORT_DELAY)
+		task.progress(['Scanning ' + str(done) + '/' + str(total), fitItems(found)])
+	
+	return portscan.scan(ip, ports, callback=progress, cancelled=task.cancelled)
 
+# ask for an address and scan its most common ports
 def portScanner():
-	addr = 0
-	portCount = 0
+	import portscan
 	
-	ip = ipInput("192.168.187.84", "IP Address")
+	ip = ipInput(status.get('gateway') or "192.168.187.84", "IP Address")
 	if (ip == 0):
 		return
+	
+	task = runTask(runtime.spawn(portScanTask, ip, portscan.topPorts(100)), 'Scanning')
+	
+	if (task.error != None):
+		lcdPrint(0, 0, 'Scan failed', True)
+		lcdPrint(0, 1, str(task.error)[:16])
 	else:
-		print IPToArray(ip)
-
-# wrapper to move lcd PROMPT and print a string
-def lcdPrint(column, row, message, clear=False):
-	if ( clear == True ):
-		lcd.clear()
+		found = portscan.openPorts(task.result)
 		
-	lcd.setCursor(column, row)
-	lcd.message(message)
+		lcdPrint(0, 0, str(len(found)) + ' open', True)
+		lcdPrint(0, 1, fitItems(found))
+	
+	waitForButton()
 
-# run a shell command and return output
-def runShell(cmd):
-        p = Popen(cmd, shell=True, stdout=PIPE)
-        output = p.communicate()[0]
-        
-        return output.rstrip()
-        
-def checkScreenSaver(menuName):
-	global ssaverTime
+# find live hosts in the background, reporting the count as they turn up
+def discoveryTask(task, ip, netmask):
+	import discovery
 	
-	# increment idle delay
-	ssaverTime += MICRO_DELAY
-		
-	# if weve been idle for 10 minutes, start screen saver
-	if (ssaverTime > ssaverTimeout):
-		ssaverTime = 0
-		screenSaver()
-		printMenu(menuName)
+	found = []
+	
+	def hostFound(host):
+		found.append(host)
+	
+	def progress(done, total):
+		task.progress([str(len(found)) + ' hosts up', 'Probing ' + str(done * 100 / total) + '%'])
+	
+	return discovery.discover(ip, netmask, found=hostFound, progress=progress, cancelled=task.cancelled)
 
-# clear lcd and turn off ledBacklight then wait for input to "wake up"
-def screenSaver():
-	global ssaverTime
+# sweep the subnet of the first configured interface and list the live hosts
+def hostDiscovery():
+	addresses = status.get('interfaces')
 	
-	lcd.clear()
-	lcd.noDisplay()
-	GPIO.output(ledBacklight, True)
+	if (not addresses):
+		lcdPrint(0, 0, 'No network', True)
+		waitForButton()
+		return
 	
-	collected = gc.collect()
+	nic, ip, netmask = addresses[0]
 	
-	while 1:
-		readButtons()
-		
-		if ((buttons['btnUp'] == False) or (buttons['btnDown'] == False) or (buttons['btnBack'] == False) or (buttons['btnSelect'] == False)):
-			lcd.display()
-			GPIO.output(ledBacklight, False)
+	task = runTask(runtime.spawn(discoveryTask, ip, netmask), 'Discovering')
+	
+	if (task.error != None):
+		lcdPrint(0, 0, 'Discovery failed', True)
+		lcdPrint(0, 1, str(task.error)[:16])
+		waitForButton()
+		return
+	
+	showList('Hosts', [str(len(task.result)) + ' hosts up'] + task.result)
+
+# sample an interface's counters until cancelled, posting the rates and the recent history
+def throughputTask(task, nic, rate, width=8):
+	from throughput import RateMonitor
+	
+	monitor = RateMonitor(nic)
+	
+	try:
+		while True:
+			rates = monitor.sample()
+			task.progress((dict(rates), monitor.history['rx'].values(width), monitor.history['tx'].values(width)))
 			
-			ssaverTime = 0
-			return
+			if (task.sleep(1.0 / rate)):
+				return
+	finally:
+		monitor.close()
+
+# a throughput line, label, rate and a sparkline of the recent rates
+def throughputLine(label, rate, history, width=8):
+	import throughput
+	
+	spark = ''
+	for level in throughput.levels(history):
+		if (level == 0):
+			spark += ' '
+		else:
+			spark += glyphs.char('bar%d' % level)
+	
+	return label + throughput.formatRate(rate).rjust(5) + ' ' + spark.rjust(width)
+
+# show the live rx and tx rates of an interface until back is pressed
+def throughputMonitor(nic):
+	import throughput
+	
+	task = runtime.spawn(throughputTask, nic, throughput.SAMPLE_RATE)
+	
+	lcdPrint(0, 0, nic, True)
+	
+	while task.running():
+		event = events.wait()
 		
-		sleep(MICRO_DELAY)
+		if ((event.kind == PRESS) and (event.button == 'btnBack')):
+			task.cancel()
+			
+		elif ((event.kind == PROGRESS) and (event.task == task) and (task.cancelled() == False)):
+			rates, rx, tx = event.text
+			
+			screen.render([throughputLine('rx', rates['rx'], rx), throughputLine('tx', rates['tx'], tx)])
+	
+	if (task.error != None):
+		lcdPrint(0, 0, 'Monitor failed', True)
+		lcdPrint(0, 1, str(task.error)[:16])
+		waitForButton()
 
-# read button states. False is pressed, True is not pressed
-def readButtons():
-	buttons['btnUp'] = GPIO.input(btnUp)
-	buttons['btnDown'] = GPIO.input(btnDown)
-	buttons['btnBack'] = GPIO.input(btnBack)
-	buttons['btnSelect'] = GPIO.input(btnSelect)
+# pick an interface to watch the traffic of
+def throughputMenu():
+	import throughput
+	
+	nics = throughput.rateInterfaces()
+	
+	engine.run(Menu('Throughput', [MenuItem(nic, lambda nic=nic: throughputMonitor(nic)) for nic in nics]))
 
-# print an array of menu items
-def printMenu(menu, noPrompt=False):
-	global CursorPosition
-	global CurrentPage
-	global CurrentMenuItem
+# probe targets in the background until cancelled, posting every result
+def latencyTask(task, targets):
+	import latency
 	
-	MenuItems = len(menu)
+	def result(target, rtt):
+		task.progress(target)
 	
-	CursorPosition = 0
-	CurrentPage = 0
-	CurrentMenuItem = 0
+	return latency.probe(targets, callback=result, cancelled=task.cancelled)
+
+# a target's label and loss, and the figure of its summary picked by 'view'
+def latencyLines(target, view):
+	summary = target.stats
+	loss = '%d%%' % round(summary.loss() * 100)
 	
-	itemOffset = 2
-	if (noPrompt == True):
-		itemOffset = 0
+	figures = [
+		('average', summary.average()),
+		('jitter', summary.jitter),
+		('minimum', summary.minimum),
+		('maximum', summary.maximum),
+		('median', summary.quantile(.5)),
+		('90th pct', summary.quantile(.9)),
+		('99th pct', summary.quantile(.99)),
+	]
 	
-	lcd.clear()
+	name, value = figures[view % len(figures)]
 	
-	if (noPrompt == False):
-		lcdPrint(0, CursorPosition, PROMPT)
-		
-	lcdPrint(itemOffset, 0, menu[CurrentMenuItem])
+	return [target.label[:11].ljust(11) + loss.rjust(5), name.ljust(10) + msText(value).rjust(6)]
+
+# a round trip in milliseconds with its unit, - when there is none
+def msText(ms):
+	from latency import formatMs
 	
-	if ((CurrentMenuItem + 1) < MenuItems):
-		lcdPrint(itemOffset, 1, menu[CurrentMenuItem + 1])
-		
-	sleep(MICRO_DELAY)
+	if (ms == None):
+		return '-'
+	
+	return formatMs(ms) + 'ms'
 
-# determine how many pages any given menu is
-def PageCount(MenuItems):
-	pages = 1
+# show live round trips until back is pressed. up and down pick the target,
+# select the figures
+def latencyMonitor(targets):
+	task = runtime.spawn(latencyTask, targets)
+	index = 0
+	view = 0
 	
-	if (MenuItems > 2):
-		pages = (MenuItems / 2)
+	while task.running():
+		screen.render(latencyLines(targets[index], view))
+		
+		event = events.wait()
 		
-		if (MenuItems % 2 != 0):
-			pages += 1
+		if (event.kind != PRESS):
+			continue
+		
+		if (event.button == 'btnBack'):
+			task.cancel()
+		elif (event.button == 'btnUp'):
+			index = (index - 1) % len(targets)
+		elif (event.button == 'btnDown'):
+			index = (index + 1) % len(targets)
+		elif (event.button == 'btnSelect'):
+			view += 1
 	
-	return pages
+	if (task.error != None):
+		lcdPrint(0, 0, 'Probe failed', True)
+		lcdPrint(0, 1, str(task.error)[:16])
+		waitForButton()
 
-# move PROMPT to the next menu item or page
-def CursorNext(menu, noPrompt=False, noDelay=False):
-	global CursorPosition
-	global CurrentPage
-	global CurrentMenuItem
-	global ssaverTime
+# the gateway and nameserver from the status cache. routers mostly have a web
+# page, nameservers answer on tcp 53, and a reset times just as well
+def latencyTargets():
+	from latency import Target
 	
-	ssaverTime = 0
+	targets = []
 	
-	itemOffset = 2
-	if (noPrompt == True):
-		itemOffset = 0
+	if (status.get('gateway')):
+		targets.append(Target('Gateway', status.get('gateway'), 80))
 	
-	MenuItems = len(menu)
+	if (status.get('dns')):
+		targets.append(Target('DNS', status.get('dns'), 53))
 	
-	if (CursorPosition == 0):
-		if ((CurrentMenuItem + 1) < MenuItems):
-			if (noPrompt == False):
-				lcdPrint(0, 0, " ")
-				lcdPrint(0, 1, PROMPT)
-			
-			CursorPosition += 1
-			CurrentMenuItem += 1
-	else:
-		if (CurrentPage < (PageCount(MenuItems) - 1)):
-			lcd.clear()
-			
-			CurrentPage += 1
-			CurrentMenuItem += 1
-			
-			CursorPosition = 0
-			
-			if (noPrompt == False):
-				lcdPrint(0, CursorPosition, PROMPT)
-			
-			lcdPrint(itemOffset, 0, menu[CurrentMenuItem])
-			
-			if ((CurrentMenuItem + 1) < MenuItems):
-				lcdPrint(itemOffset, 1, menu[CurrentMenuItem + 1])
+	return targets
+
+def latencyDefaults():
+	targets = latencyTargets()
+	
+	if (not targets):
+		lcdPrint(0, 0, 'No network', True)
+		waitForButton()
+		return
 	
-	if (noDelay == False):
-		sleep(SHORT_DELAY)
+	latencyMonitor(targets)
 
-# move PROMPT to rpevious menu item or page
-def CursorPrevious(menu, noPrompt=False, noDelay=False):
-	global CursorPosition
-	global CurrentPage
-	global CurrentMenuItem
-	global ssaverTime
+# ask for an address and probe it along with the gateway and nameserver
+def latencyHost():
+	from latency import Target
 	
-	ssaverTime = 0
+	ip = ipInput(status.get('gateway') or "192.168.187.84", "IP Address")
+	if (ip == 0):
+		return
 	
-	itemOffset = 2
-	if (noPrompt == True):
-		itemOffset = 0
+	# the address does not fit next to the loss, it was just entered anyway
+	latencyMonitor([Target('Host', ip, 80)] + latencyTargets())
+
+# benchmark a nameserver in the background, reporting the count and median as it goes
+def dnsTask(task, server):
+	import dnsbench
 	
-	MenuItems = len(menu)
+	def progress(bench):
+		task.progress([str(bench.finished()) + '/' + str(dnsbench.QUERIES) + ' queries', 'median ' + msText(bench.latency.quantile(.5))])
 	
-	if (CursorPosition == 1):
-		if (CurrentMenuItem > 0):
-			if (noPrompt == False):
-				lcdPrint(0, 1, " ")
-				lcdPrint(0, 0, PROMPT)
-			
-			
-			CursorPosition -= 1
-			CurrentMenuItem -= 1
+	return dnsbench.run(server, callback=progress, cancelled=task.cancelled)
+
+# query the configured nameserver and page through the results
+def dnsBenchmark():
+	import dnsbench
+	
+	server = status.get('dns')
+	
+	if (not server):
+		lcdPrint(0, 0, 'No nameserver', True)
+		waitForButton()
+		return
+	
+	task = runTask(runtime.spawn(dnsTask, server), 'DNS ' + server)
+	
+	if (task.error != None):
+		lcdPrint(0, 0, 'Benchmark failed', True)
+		lcdPrint(0, 1, str(task.error)[:16])
+		waitForButton()
+		return
+	
+	bench = task.result
+	
+	def share(count, rate):
+		return str(count) + ' (' + str(int(round(rate * 100))) + '%)'
+	
+	engine.run(Menu('DNS', [
+		MenuItem('Queries/sec', value='%.0f' % bench.qps()),
+		MenuItem('Median', value=msText(bench.latency.quantile(.5))),
+		MenuItem('90th pct', value=msText(bench.latency.quantile(.9))),
+		MenuItem('99th pct', value=msText(bench.latency.quantile(.99))),
+		MenuItem('Timeouts', value=share(bench.latency.lost, bench.timeoutRate())),
+		MenuItem('SERVFAIL', value=share(bench.rcodes.get(dnsbench.SERVFAIL, 0), bench.rate(dnsbench.SERVFAIL))),
+		MenuItem('Answered', value=str(bench.latency.received) + '/' + str(bench.sent)),
+		MenuItem('Server', value=server),
+	], prompt=False))
+
+# test against a bandwidth server in the background, posting the live rate
+def bandwidthTask(task, host, direction, label):
+	import bandwidth
+	
+	def report(bps, total, elapsed):
+		task.progress([label.ljust(12) + ('%ds' % elapsed).rjust(4), bandwidth.formatMbps(bps).rjust(7) + ' Mbit/s'])
+	
+	return bandwidth.client(host, direction=direction, report=report, cancelled=task.cancelled)
+
+# ask for a server and run an upload or download test against it
+def bandwidthClient(direction, label):
+	import bandwidth
+	
+	ip = ipInput(status.get('gateway') or "192.168.187.84", "Server Address")
+	if (ip == 0):
+		return
+	
+	task = runTask(runtime.spawn(bandwidthTask, ip, direction, label), 'Connecting')
+	
+	if (task.error != None):
+		lcdPrint(0, 0, 'Test failed', True)
+		lcdPrint(0, 1, str(task.error)[:16])
 	else:
-		if (CurrentPage > 0):
-			lcd.clear()
-			
-			CurrentPage -= 1
-			CurrentMenuItem -= 1
-			
-			CursorPosition = 1
-			
-			lcdPrint(itemOffset, 0, menu[CurrentMenuItem - 1])
-			lcdPrint(itemOffset, 1, menu[CurrentMenuItem])
-			
-			if (noPrompt == False):
-				lcdPrint(0, 1, PROMPT)
+		meter = task.result
+		
+		screen.render(['avg ' + bandwidth.formatMbps(meter.average()) + ' Mbit/s', str(meter.total / 1000000) + 'MB in ' + ('%ds' % meter.elapsed())])
 	
-	if (noDelay == False):
-		sleep(SHORT_DELAY)
+	waitForButton()
 
-# display information and cycle through pages
-def infoMenu():
-	global ssaverTime
+def bandwidthUpload():
+	import bandwidth
 	
-	ssaverTime = 0
+	bandwidthClient(bandwidth.UPLOAD, 'Upload')
+
+def bandwidthDownload():
+	import bandwidth
 	
-	gateway = runShell("route -n | grep 'UG[ \t]' | awk '{print $2}'")
-	dns_server = runShell("grep nameserver /etc/resolv.conf|head -n1|awk '{print $2}'")
-	total_mem = int(runShell("grep MemTotal /proc/meminfo|awk '{print $2}'")) / 1024
-	free_mem = int(runShell("grep MemFree /proc/meminfo|awk '{print $2}'")) / 1024
+	bandwidthClient(bandwidth.DOWNLOAD, 'Download')
+
+# serve bandwidth tests until cancelled, posting who is testing and the live rate
+def bandwidthServerTask(task, address):
+	import bandwidth
 	
-	InfoMenu = []
+	peer = {'address': address}
 	
-	for nic in ni.interfaces():
-		if (nic != "lo"):
-			item = ni.ifaddresses(nic).get(2, 0)
-			
-			if (item != 0):
-				InfoMenu.append(nic)
-				InfoMenu.append(item[0]['addr'])
-			
-				InfoMenu.append('Subnet Mask')
-				InfoMenu.append(item[0]['netmask'])
+	def connected(address, direction):
+		peer['address'] = address
+		task.progress([address, 'Connected'])
 	
-	InfoMenu.append('Gateway')
-	InfoMenu.append(gateway)
+	def report(bps, total, elapsed):
+		task.progress([peer['address'], bandwidth.formatMbps(bps).rjust(7) + ' Mbit/s'])
 	
-	InfoMenu.append('DNS')
-	InfoMenu.append(dns_server)
+	def finished(address, direction, meter):
+		task.progress([address, 'avg ' + bandwidth.formatMbps(meter.average()) + ' Mbit/s'])
 	
-	InfoMenu.append('Free Memory')
-	InfoMenu.append(str(free_mem)+'/'+str(total_mem)+' MB')
+	task.progress([address, 'Port ' + str(bandwidth.PORT) + ' ready'])
 	
-	InfoMenu.append('Free Space on /')
-	InfoMenu.append(str(format(avail_bytes('/') / 1024, ',d'))+' MB')
+	bandwidth.serve(report=report, cancelled=task.cancelled, connected=connected, finished=finished)
+
+# let other devices test against us until back is pressed
+def bandwidthServer():
+	addresses = status.get('interfaces')
 	
-	printMenu(InfoMenu, True)
+	if (addresses):
+		address = addresses[0][1]
+	else:
+		address = 'No network'
 	
-	sleep(MICRO_DELAY)
+	task = runTask(runtime.spawn(bandwidthServerTask, address), 'Starting server')
 	
-	while 1:
-		readButtons()
+	if (task.error != None):
+		lcdPrint(0, 0, 'Server failed', True)
+		lcdPrint(0, 1, str(task.error)[:16])
+		waitForButton()
 
-		# up button
-		if ( buttons['btnUp'] == False ):
-			CursorPrevious(InfoMenu, True, True)
-			CursorPrevious(InfoMenu, True)
-			
+# show a list, up and down scroll and back returns
+def showList(label, items):
+	engine.run(Menu(label, [MenuItem(item) for item in items]))
+
+# wrapper to print a string at a position through the framebuffer
+def lcdPrint(column, row, message, clear=False):
+	if ( clear == True ):
+		lines = [''] * screen.rows
+		lines[row] = ' ' * column + message
+		
+		screen.render(lines)
+		return
+		
+	screen.write(column, row, message)
+
+# show 'label' while a background task runs, its progress goes on the second line
+# and Back cancels it. returns the task once it has finished
+def runTask(task, label):
+	lcdPrint(0, 0, label, True)
 	
-		# down button
-		if ( buttons['btnDown'] == False ):
-			CursorNext(InfoMenu, True, True)
-			CursorNext(InfoMenu, True)
+	while task.running():
+		event = events.wait()
 		
-		# back button (unused in main menu)
-		if ( buttons['btnBack'] == False ):
-			return
+		if ((event.kind == PRESS) and (event.button == 'btnBack')):
+			task.cancel()
+			lcdPrint(0, 1, 'Cancelling...'.ljust(16))
 			
-		checkScreenSaver(InfoMenu)
-		sleep(MICRO_DELAY)
+		elif ((event.kind == PROGRESS) and (event.task == task) and (task.cancelled() == False)):
+			# a list of lines replaces the whole screen, text replaces the second line
+			if (isinstance(event.text, list)):
+				screen.render(event.text)
+			else:
+				lcdPrint(0, 1, event.text[:16].ljust(16))
+	
+	return task
+
+# run shell commands as a job: a spinner while it runs with the latest output line
+# under it, Back cancels. then report how it went and the address 'nic' got
+def runJob(label, commands, nic=None, timeout=None):
+	task = runtime.shell(*commands, timeout=timeout or jobTimeout)
+	start = monotonic()
+	line = commands[0]
+	
+	while task.running():
+		frame = int((monotonic() - start) / spinnerDelay) % 4
+		screen.render([label[:15].ljust(15) + glyphs.char('spin%d' % frame), line])
+		
+		event = events.wait(spinnerDelay)
+		
+		if (event == None):
+			continue
+		
+		if ((event.kind == PRESS) and (event.button == 'btnBack')):
+			task.cancel()
+			line = 'Cancelling...'
 			
-def networkMenu():
-	global ssaverTime
-	global networkAnimation
+		elif ((event.kind == PROGRESS) and (event.task == task) and (task.cancelled() == False)):
+			line = event.text
+	
+	elapsed = '%ds' % (monotonic() - start)
 	
-	ssaverTime = 0
-	NetworkMenu = ['Start Wired', 'Stop Wired', 'Start Wireless', 'Stop Wireless']
+	if (task.cancelled()):
+		result = ['Cancelled', '']
+	elif (task.timedOut):
+		result = ['Timed out ' + elapsed, task.lastLine]
+	elif ((task.error != None) or (task.returncode != 0)):
+		result = ['Failed ' + elapsed, task.lastLine or 'exit %s' % task.returncode]
+	else:
+		result = ['Done ' + elapsed, '']
+	
+	if (nic != None):
+		# the info pages should not wait for the next refresh to show it either
+		status.update(status.byName['interfaces'])
+		
+		for name, addr, netmask in status.get('interfaces') or []:
+			if (name == nic):
+				result[1] = addr
 	
-	printMenu(NetworkMenu)
-	sleep(MICRO_DELAY)
+	screen.render(result)
+	waitForButton()
 	
+	return task
+
+# run a screen. if it crashes, show the error and go back to the menu that opened it
+# instead of taking the whole menu down
+def runScreen(function, *args):
+	global handling
+	
+	# the press that started a screen is not timed, it would measure the whole screen
+	handling = None
+	
+	try:
+		return function(*args)
+	except Reload:
+		raise
+	except Exception, err:
+		traceback.print_exc()
+		
+		lcdPrint(0, 0, 'Screen crashed', True)
+		lcdPrint(0, 1, err.__class__.__name__[:16])
+		waitForButton()
+
+# wait until any button is pressed, eg to dismiss a result
+def waitForButton():
 	while 1:
-		readButtons()
+		event = events.wait()
+		
+		if (event.kind == PRESS):
+			return event
+
+# run a shell command and return output
+def runShell(cmd):
+        from subprocess import Popen, PIPE
+        
+        p = Popen(cmd, shell=True, stdout=PIPE)
+        output = stats.timed('shell', p.communicate)[0]
+        
+        return output.rstrip()
+        
+def checkScreenSaver():
+	# if weve been idle for 10 minutes, start screen saver
+	if (events.idleTime() > ssaverTimeout):
+		screenSaver()
 
-		# up button
-		if ( buttons['btnUp'] == False ):
-			CursorPrevious(NetworkMenu)
+# clear lcd and turn off ledBacklight then wait for input to "wake up"
+def screenSaver():
+	screen.clear()
+	screen.command(lcd.noDisplay)
+	GPIO.output(ledBacklight, True)
+	
+	import gc
+	
+	collected = gc.collect()
 	
-		# down button
-		if ( buttons['btnDown'] == False ):
-			CursorNext(NetworkMenu)
+	while 1:
+		event = events.wait()
 		
-		# back button (unused in main menu)
-		if ( buttons['btnBack'] == False ):
-			return
-			
-		# select button
-		if ( buttons['btnSelect'] == False ):
-			lcd.clear()
-			
-			if (CurrentMenuItem == 0):
-				lcdPrint(0, 0, 'Starting')
-				lcdPrint(0, 1, 'wired network')
-				
-				nothing = runShell('ifconfig eth0 up')
-				nothing = runShell('dhclient eth0')
-				
-			if (CurrentMenuItem == 1):
-				lcdPrint(0, 0, 'Stopping')
-				lcdPrint(0, 1, 'wired network')
-				
-				nothing = runShell('ifconfig eth0 down')
-				nothing = runShell('ifconfig eth0 0.0.0.0')
-			
-			if (CurrentMenuItem == 2):
-				lcdPrint(0, 0, 'Starting')
-				lcdPrint(0, 1, 'wireless network')
-				
-				nothing = runShell('modprobe r8712u')
-				nothing = runShell('/usr/local/bin/startwifi.sh')
-			
-			if (CurrentMenuItem == 3):
-				lcdPrint(0, 0, 'Stopping')
-				lcdPrint(0, 1, 'wireless network')
-				
-				nothing = runShell('ifconfig wlan0 down')
-				nothing = runShell('ifconfig wlan0 0.0.0.0')
-				nothing = runShell('rmmod r8712u')
+		if (event.kind == PRESS):
+			screen.command(lcd.display)
+			GPIO.output(ledBacklight, False)
 			
-			sleep(SHORT_DELAY)
 			return
-				
-		checkScreenSaver(NetworkMenu)
-			
-		sleep(MICRO_DELAY)
-	
 
-# display system menu
-def systemMenu():
-	global ssaverTime
+# wait for the next button press and set button states. False is pressed, True is not pressed
+# gives up without a press when the screen saver is due so menus can start it.
+# returns the event that woke us up, which may also be a task event
+def readButtons():
+	for name in buttons:
+		buttons[name] = True
 	
-	ssaverTime = 0
-	SystemMenu = ['Reload', 'Reboot', 'Shutdown']
+	# already due, eg after a long job nobody pressed a button during
+	timeout = ssaverTimeout - events.idleTime()
+	if (timeout <= 0):
+		return None
 	
-	printMenu(SystemMenu)
-	sleep(MICRO_DELAY)
+	event = events.wait(timeout)
 	
-	while 1:
-		readButtons()
+	if (event == None):
+		return None
+	
+	# holding up or down keeps scrolling, other buttons only act once per press
+	if ((event.kind == PRESS) or ((event.kind == REPEAT) and (event.button in ('btnUp', 'btnDown')))):
+		buttons[event.button] = False
+	
+	return event
 
-		# up button
-		if ( buttons['btnUp'] == False ):
-			CursorPrevious(SystemMenu)
+# input for the menu engine, the button that was pressed (None if the event was
+# not a press) and the event itself
+def menuInput():
+	global handling
 	
-		# down button
-		if ( buttons['btnDown'] == False ):
-			CursorNext(SystemMenu)
-		
-		# back button (unused in main menu)
-		if ( buttons['btnBack'] == False ):
-			return
-			
-		# select button
-		if ( buttons['btnSelect'] == False ):
-			lcd.clear()
-			
-			if (CurrentMenuItem == 0):
-				lcd.clear()
-				lcdPrint(0, 0, 'Reloading')
-				lcdPrint(0, 1, 'menu...')
-				
-				sys.exit(0)
-			
-			if (CurrentMenuItem == 1):
-				lcd.clear()
-				lcdPrint(0, 0, 'Rebooting...')
-				
-				nothing = runShell("reboot")
-			
-			if (CurrentMenuItem == 2):
-				lcd.clear()
-				lcdPrint(0, 0, 'Shutting down...')
-				
-				nothing = runShell("shutdown -h now")
+	# the previous press has been handled and its page drawn by now
+	if (handling != None):
+		stats.observe('button', monotonic() - handling.time)
+		handling = None
+	
+	event = readButtons()
+	
+	# holding Back opens the hidden stats screen, so in menus Back goes back when it
+	# is let go of before it counts as held, not as soon as it is pressed
+	if ((event != None) and (event.kind in (PRESS, RELEASE, LONGPRESS)) and (event.button == 'btnBack')):
+		if (event.kind == LONGPRESS):
+			runScreen(statsScreen)
+			return (None, event)
 		
-		checkScreenSaver(SystemMenu)
+		buttons['btnBack'] = ((event.kind == PRESS) or (event.duration >= events.longPress))
+	
+	for name in buttons:
+		if (buttons[name] == False):
+			handling = event
+			return (name, event)
+	
+	return (None, event)
+
+# counters and latencies, one per page
+def statsScreen():
+	engine.run(Menu('Stats', lambda: [MenuItem(name, value=value) for name, value in stats.summary()], prompt=False))
+
+# interface addresses for the info page as a list of (name, address, netmask)
+def interfaceAddresses():
+	import netifaces as ni
+	
+	addresses = []
+	
+	for nic in ni.interfaces():
+		if (nic != "lo"):
+			item = ni.ifaddresses(nic).get(2, 0)
 			
-		sleep(MICRO_DELAY)
-		
-# display main menu and respond to a selection
-def mainMenu():
-	global ssaverTime
+			if (item != 0):
+				addresses.append((nic, item[0]['addr'], item[0]['netmask']))
 	
-	ledBlink(ledStatus1, 5)
+	return addresses
+
+# first nameserver from resolv.conf
+def dnsServer():
+	dns_servers = sysinfo.nameservers()
 	
-	ssaverTime = 0
-	MainMenu = ['Information', 'Diagnostics', 'Tools', 'Network', 'System', 'About']
+	if (len(dns_servers) > 0):
+		return dns_servers[0]
 	
-	printMenu(MainMenu)
-	sleep(MICRO_DELAY)
+	return ''
 
-	while 1:
-		readButtons()
+# free and total memory in MB
+def memoryUsage():
+	memory = sysinfo.meminfo()
+	
+	return (memory['MemFree'] / 1024, memory['MemTotal'] / 1024)
+
+# set up the status cache the info page reads from, with how often each value is refreshed
+def statusFields():
+	# netifaces is slow to import, load it when a screen first needs the addresses
+	status.add('interfaces', interfaceAddresses, 2, lazy=True)
+	status.add('gateway', sysinfo.defaultGateway, 5)
+	status.add('dns', dnsServer, 30)
+	status.add('memory', memoryUsage, 5)
+	status.add('disk', lambda: avail_bytes('/'), 60)
 
-		# up button
-		if ( buttons['btnUp'] == False ):
-			CursorPrevious(MainMenu)
+# build the information pages from the status cache
+def infoItems():
+	InfoMenu = []
+	
+	for nic, addr, netmask in status.get('interfaces') or []:
+		InfoMenu.append(MenuItem(nic, value=addr))
+		InfoMenu.append(MenuItem('Subnet Mask', value=netmask))
+	
+	InfoMenu.append(MenuItem('Gateway', value=status.get('gateway') or ''))
+	InfoMenu.append(MenuItem('DNS', value=status.get('dns') or ''))
 	
-		# down button
-		if ( buttons['btnDown'] == False ):
-			CursorNext(MainMenu)
+	free_mem, total_mem = status.get('memory') or (0, 0)
+	
+	InfoMenu.append(MenuItem('Free Memory', value=str(free_mem)+'/'+str(total_mem)+' MB'))
+	InfoMenu.append(MenuItem('Free Space on /', value=str(format((status.get('disk') or 0) / 1024, ',d'))+' MB'))
+	
+	return InfoMenu
 
-		# select button
-		if ( buttons['btnSelect'] == False ):
-			lcd.clear()
-			
-			if (CurrentMenuItem == 0):
-				infoMenu()
-			
-				sleep(SHORT_DELAY)
-				printMenu(MainMenu)
-				
-			elif (CurrentMenuItem == 3):
-				networkMenu()
-				
-				sleep(MICRO_DELAY)
-				printMenu(MainMenu)
-				
-			elif (CurrentMenuItem == 4):
-				systemMenu()
-				
-				sleep(SHORT_DELAY)
-				printMenu(MainMenu)
-				
-			else:
-				printMenu(MainMenu)
+# the status cache refreshed something, the info pages have to be rebuilt
+def statusChanged(event):
+	return ((event.kind == PROGRESS) and (event.task == statusTask))
 
-		checkScreenSaver(MainMenu)
-		
-		sleep(MICRO_DELAY)
+def startWired():
+	runJob('Starting wired', ['ifconfig eth0 up', 'dhclient eth0'], 'eth0')
+
+def stopWired():
+	runJob('Stopping wired', ['ifconfig eth0 down', 'ifconfig eth0 0.0.0.0'])
+
+def startWireless():
+	runJob('Starting wifi', ['modprobe r8712u', '/usr/local/bin/startwifi.sh'], 'wlan0')
+
+def stopWireless():
+	runJob('Stopping wifi', ['ifconfig wlan0 down', 'ifconfig wlan0 0.0.0.0', 'rmmod r8712u'])
+
+def reloadMenu():
+	lcdPrint(0, 0, 'Reloading', True)
+	lcdPrint(0, 1, 'menu...')
+	screen.sync()
+	
+	raise Reload()
+
+def reboot():
+	lcdPrint(0, 0, 'Rebooting...', True)
+	
+	nothing = runShell("reboot")
+
+def shutdown():
+	lcdPrint(0, 0, 'Shutting down...', True)
+	
+	nothing = runShell("shutdown -h now")
+
+# the menus. an item opens a submenu, runs a screen or, on the info pages, shows a value
+InfoMenu = Menu('Information', infoItems, prompt=False, refresh=statusChanged)
+
+LatencyMenu = Menu('Latency', [
+	MenuItem('Gateway & DNS', latencyDefaults),
+	MenuItem('Other Host', latencyHost),
+])
 
-# setup inputs and signals
-def setup():
+BandwidthMenu = Menu('Bandwidth', [
+	MenuItem('Upload', bandwidthUpload),
+	MenuItem('Download', bandwidthDownload),
+	MenuItem('Server', bandwidthServer),
+])
+
+DiagnosticsMenu = Menu('Diagnostics', [
+	MenuItem('Discover Hosts', hostDiscovery),
+	MenuItem('Throughput', throughputMenu),
+	MenuItem('Latency', LatencyMenu),
+	MenuItem('DNS Benchmark', dnsBenchmark),
+	MenuItem('Bandwidth', BandwidthMenu),
+])
+
+ToolsMenu = Menu('Tools', [
+	MenuItem('Port Scanner', portScanner),
+])
+
+NetworkMenu = Menu('Network', [
+	MenuItem('Start Wired', startWired),
+	MenuItem('Stop Wired', stopWired),
+	MenuItem('Start Wireless', startWireless),
+	MenuItem('Stop Wireless', stopWireless),
+])
+
+SystemMenu = Menu('System', [
+	MenuItem('Reload', reloadMenu),
+	MenuItem('Reboot', reboot),
+	MenuItem('Shutdown', shutdown),
+])
+
+MainMenu = Menu('Main', [
+	MenuItem('Information', InfoMenu),
+	MenuItem('Diagnostics', DiagnosticsMenu),
+	MenuItem('Tools', ToolsMenu),
+	MenuItem('Network', NetworkMenu),
+	MenuItem('System', SystemMenu),
+	MenuItem('About'),
+])
+
+# display main menu and respond to selections, back is unused in the main menu
+def mainMenu():
+	ledBlink(ledStatus1, 5)
+	
+	engine.draw(MainMenu, MainMenu.resolveItems(), 0)
+	benchFirstFrame()
+	
+	engine.run(MainMenu, True)
+
+# hardware state that survives a reload, see menud.py
+def hardware():
+	return {'gpio': GPIO, 'lcd': lcd, 'screen': screen, 'glyphs': glyphs, 'events': events, 'runtime': runtime}
+
+# stop the background tasks this module started, before it is reloaded
+def suspend():
+	runtime.shutdown()
+	events.flush()
+
+# setup inputs and signals. when 'hardware' from a previous load is given the
+# already initialised lcd and GPIO are taken over instead of being set up again
+def setup(hardware=None):
+	global GPIO
+	global lcd
+	global screen
+	global events
+	global runtime
+	global engine
+	global glyphs
+	global statusTask
+	
 	signal.signal(signal.SIGINT, signal_handler)
 	
-	GPIO.setmode(GPIO.BCM)
-	GPIO.setup(btnUp, GPIO.IN)
-	GPIO.setup(btnDown, GPIO.IN)
-	GPIO.setup(btnBack, GPIO.IN)
-	GPIO.setup(btnSelect, GPIO.IN)
-	GPIO.setup(ledBacklight, GPIO.OUT)
-	GPIO.setup(ledStatus1, GPIO.OUT)
-	GPIO.setup(lesStatus2, GPIO.OUT)
+	if (hardware != None):
+		# the simulated GPIO is created at import, keep the one the pins were set up on
+		GPIO = hardware['gpio']
+		lcd = hardware['lcd']
+		screen = hardware['screen']
+		glyphs = hardware['glyphs']
+		events = hardware['events']
+		runtime = hardware['runtime']
+	else:
+		GPIO.setmode(GPIO.BCM)
+		GPIO.setup(btnUp, GPIO.IN)
+		GPIO.setup(btnDown, GPIO.IN)
+		GPIO.setup(btnBack, GPIO.IN)
+		GPIO.setup(btnSelect, GPIO.IN)
+		
+		events = ButtonEvents(GPIO, {'btnUp': btnUp, 'btnDown': btnDown, 'btnBack': btnBack, 'btnSelect': btnSelect})
+		runtime = Runtime(events.queue)
+		
+		GPIO.setup(ledBacklight, GPIO.OUT)
+		GPIO.setup(ledStatus1, GPIO.OUT)
+		GPIO.setup(lesStatus2, GPIO.OUT)
+		
+		GPIO.output(ledBacklight, False)
+		GPIO.output(ledStatus1, GPIO.LOW)
+		GPIO.output(lesStatus2, GPIO.LOW)
+		
+		if (SIMULATED):
+			simulator()
+		
+		if (lcdI2CAddress != None):
+			from Adafruit_I2C_CharLCD import Adafruit_I2C_CharLCD
+			
+			lcd = Adafruit_I2C_CharLCD(lcdI2CAddress, lcdExpander)
+		else:
+			lcd = Adafruit_CharLCD(GPIO=stats.CountingGPIO(GPIO))
+		
+		lcd.begin(16,2)
+		
+		screen = LCDFrameBuffer(lcd, threaded=True)
+		glyphs = GlyphManager(screen)
 	
-	GPIO.output(ledBacklight, False)
-	GPIO.output(ledStatus1, GPIO.LOW)
-	GPIO.output(lesStatus2, GPIO.LOW)
+	engine = MenuEngine(screen, menuInput, runScreen, checkScreenSaver)
 	
-	lcd.begin(16,2)
+	statusFields()
+	statusTask = runtime.spawn(status.run)
+	runtime.spawn(stats.writer)
+
+# emulate the lcd on the simulated GPIO and run it in the terminal. it has to be
+# watching the pins before the lcd is initialised
+def simulator():
+	from hd44780sim import HD44780, console
+	
+	keys = {'w': ('up', btnUp), 's': ('down', btnDown), 'a': ('back', btnBack), 'd': ('select', btnSelect)}
+	
+	display = HD44780(GPIO)
+	
+	# the startup benchmark only needs the lcd, not the terminal
+	if (os.environ.get('PORTABLEPI_BENCH') == None):
+		console(GPIO, display, keys)
+	
+	return display
+
+# print startup times and exit when started by bench.py
+def benchFirstFrame():
+	if (os.environ.get('PORTABLEPI_BENCH') == None):
+		return
+	
+	screen.sync()
+	now = monotonic()
+	
+	print 'imports %.1f ms' % ((IMPORTED - STARTED) * 1000)
+	print 'first_frame %.1f ms' % ((now - STARTED) * 1000)
+	
+	runtime.shutdown()
+	sys.exit(0)
 
 # get this party started
-setup()
-mainMenu()
+if __name__ == '__main__':
+	setup()
+	
+	try:
+		mainMenu()
+	except Reload:
+		sys.exit(0)
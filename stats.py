@@ -0,0 +1,165 @@
+#!/usr/bin/python
+#
+# Runtime instrumentation
+#
+# Counters and latency histograms that the lcd framebuffer, the task runtime
+# and the menu update as they go. Recording is a dict update under a lock, so
+# it stays on all the time. The numbers are written to a stats file as
+# 'name value unit' lines, the same format bench.py prints, and can be looked
+# at on the device by holding Back.
+
+import os, threading
+from bisect import bisect_left
+from clock import monotonic
+
+# where the menu writes the numbers and how often, in seconds
+STATS_FILE = os.environ.get('PORTABLEPI_STATS', '/tmp/portablepi.stats')
+WRITE_INTERVAL = 10
+
+# histogram bucket upper bounds in seconds, 0.1ms doubling up to about 100s
+BOUNDS = [.0001 * 2 ** i for i in range(21)]
+
+class Histogram:
+
+	def __init__(self):
+		self.buckets = [0] * (len(BOUNDS) + 1)
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def observe(self, seconds):
+		self.buckets[bisect_left(BOUNDS, seconds)] += 1
+		self.count += 1
+		self.total += seconds
+		self.max = max(self.max, seconds)
+
+	# upper bound of the bucket holding the p'th fraction of the samples
+	def percentile(self, p):
+		wanted = p * self.count
+		seen = 0
+
+		for i, n in enumerate(self.buckets):
+			seen += n
+
+			if ((seen >= wanted) and (n > 0)):
+				if (i == len(BOUNDS)):
+					return self.max
+
+				return min(BOUNDS[i], self.max)
+
+		return 0.0
+
+	def mean(self):
+		if (self.count == 0):
+			return 0.0
+
+		return self.total / self.count
+
+lock = threading.Lock()
+counters = {}
+units = {}
+histograms = {}
+
+# add to a counter
+def add(name, value=1, unit='count'):
+	with lock:
+		counters[name] = counters.get(name, 0) + value
+		units[name] = unit
+
+# record how long something took
+def observe(name, seconds):
+	with lock:
+		histogram = histograms.get(name)
+
+		if (histogram == None):
+			histogram = histograms[name] = Histogram()
+
+		histogram.observe(seconds)
+
+# call function(*args), recording how long it took under 'name'
+def timed(name, function, *args):
+	start = monotonic()
+
+	try:
+		return function(*args)
+	finally:
+		observe(name, monotonic() - start)
+
+def reset():
+	with lock:
+		counters.clear()
+		units.clear()
+		histograms.clear()
+
+# everything recorded so far as 'name value unit' lines, sorted by name
+def report():
+	lines = []
+
+	with lock:
+		for name in counters:
+			lines.append('%s %.1f %s' % (name, counters[name], units[name]))
+
+		for name, histogram in histograms.items():
+			lines.append('%s.count %d count' % (name, histogram.count))
+			lines.append('%s.mean %.2f ms' % (name, histogram.mean() * 1000))
+			lines.append('%s.p50 %.2f ms' % (name, histogram.percentile(.5) * 1000))
+			lines.append('%s.p95 %.2f ms' % (name, histogram.percentile(.95) * 1000))
+			lines.append('%s.max %.2f ms' % (name, histogram.max * 1000))
+
+	return sorted(lines)
+
+# write the report, replacing the file in one go so a reader never sees half of it
+def write(path=STATS_FILE):
+	temp = path + '.tmp'
+
+	with open(temp, 'w') as f:
+		f.write('\n'.join(report()) + '\n')
+
+	os.rename(temp, path)
+
+# runtime task that rewrites the stats file every 'interval' seconds until cancelled
+def writer(task, path=STATS_FILE, interval=WRITE_INTERVAL):
+	while True:
+		try:
+			write(path)
+		except (IOError, OSError):
+			pass
+
+		if (task.sleep(interval)):
+			return
+
+# (name, value) pairs short enough for the lcd, latencies as p50/p95/max in ms
+def summary():
+	items = []
+
+	with lock:
+		for name in sorted(histograms):
+			histogram = histograms[name]
+			values = [histogram.percentile(.5), histogram.percentile(.95), histogram.max]
+
+			items.append((name, '/'.join(['%.3g' % (value * 1000) for value in values]) + 'ms'))
+
+		for name in sorted(counters):
+			items.append((name, '%d' % counters[name]))
+
+	return items
+
+class CountingGPIO:
+
+	# wraps a GPIO module and counts output and input calls, everything else
+	# goes straight to the module
+	def __init__(self, GPIO):
+		self.GPIO = GPIO
+		self.outputs = 0
+		self.inputs = 0
+
+	def output(self, channel, value):
+		self.outputs += 1
+		self.GPIO.output(channel, value)
+
+	def input(self, channel):
+		self.inputs += 1
+		return self.GPIO.input(channel)
+
+	def __getattr__(self, name):
+		return getattr(self.GPIO, name)
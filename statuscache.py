@@ -0,0 +1,111 @@
+#!/usr/bin/python
+#
+# Cached system status
+#
+# Each field has its own time to live. A background task refreshes only the
+# fields that went stale and reports the ones whose value actually changed,
+# so screens can show cached values straight away and redraw only what moved.
+# A lazy field is left alone until something first asks for it, eg one that
+# needs a slow import nothing at startup should wait for.
+
+import threading
+from clock import monotonic
+
+class StatusField:
+
+	def __init__(self, name, function, ttl, lazy=False):
+		self.name = name
+		self.function = function
+		self.ttl = ttl
+		self.value = None
+		self.updated = None
+
+		# refreshed in the background, from the start or since the first get()
+		self.wanted = (lazy == False)
+
+	def stale(self, now):
+		return ((self.updated == None) or ((now - self.updated) >= self.ttl))
+
+class StatusCache:
+
+	def __init__(self):
+		self.fields = []
+		self.byName = {}
+		self.lock = threading.Lock()
+
+	# add a field, function() is called to get a fresh value every ttl seconds.
+	# a lazy field is not loaded until the first get()
+	def add(self, name, function, ttl, lazy=False):
+		field = StatusField(name, function, ttl, lazy)
+
+		self.fields.append(field)
+		self.byName[name] = field
+
+	# return a field's value, loading it first if it was never loaded
+	def get(self, name):
+		field = self.byName[name]
+		field.wanted = True
+
+		if (field.updated == None):
+			self.update(field)
+
+		return field.value
+
+	# load a fresh value for a field, returns True if it changed
+	def update(self, field):
+		try:
+			value = field.function()
+		except Exception:
+			value = None
+
+		with self.lock:
+			changed = (value != field.value)
+			field.value = value
+			field.updated = monotonic()
+
+		return changed
+
+	# refresh all stale fields and return the names of those that changed
+	def refresh(self):
+		now = monotonic()
+		changed = []
+
+		for field in self.fields:
+			if (field.wanted and field.stale(now) and self.update(field)):
+				changed.append(field.name)
+
+		return changed
+
+	# seconds until the next field goes stale
+	def nextDue(self):
+		now = monotonic()
+		due = None
+
+		for field in self.fields:
+			if (field.wanted == False):
+				continue
+
+			if (field.updated == None):
+				return 0
+
+			remaining = field.updated + field.ttl - now
+
+			if ((due == None) or (remaining < due)):
+				due = remaining
+
+		if (due == None):
+			return 60
+
+		return max(due, 0)
+
+	# runtime task body, refreshes fields as they go stale until cancelled
+	# and reports the names of changed fields as task progress
+	def run(self, task):
+		while (task.cancelled() == False):
+			changed = self.refresh()
+
+			if (len(changed) > 0):
+				task.progress(changed)
+
+			if (task.sleep(self.nextDue())):
+				break
@@ -0,0 +1,124 @@
+#!/usr/bin/python
+#
+# System information read straight from /proc, /sys and /etc
+#
+# Replaces the route/grep/awk pipelines the info page used to fork. Every
+# function takes the path it reads as an argument so it can be pointed at a
+# copy of the file from another machine.
+
+import os, socket, struct
+
+# route flags from linux/route.h
+RTF_UP = 0x0001
+RTF_GATEWAY = 0x0002
+
+# convert the little endian hex addresses used in /proc/net/route to a dotted quad
+def hexToIP(value):
+	return socket.inet_ntoa(struct.pack('<L', int(value, 16)))
+
+# return the ipv4 routing table as a list of dicts
+def routes(path='/proc/net/route'):
+	table = []
+
+	with open(path) as f:
+		header = f.readline().split()
+
+		for line in f:
+			fields = dict(zip(header, line.split()))
+
+			if (len(fields) < len(header)):
+				continue
+
+			table.append({
+				'interface': fields['Iface'],
+				'destination': hexToIP(fields['Destination']),
+				'gateway': hexToIP(fields['Gateway']),
+				'mask': hexToIP(fields['Mask']),
+				'flags': int(fields['Flags'], 16),
+				'metric': int(fields['Metric']),
+			})
+
+	return table
+
+# return the default gateway with the lowest metric, or None
+def defaultGateway(path='/proc/net/route'):
+	best = None
+
+	for route in routes(path):
+		if ((route['destination'] != '0.0.0.0') or (route['mask'] != '0.0.0.0')):
+			continue
+
+		if ((route['flags'] & (RTF_UP | RTF_GATEWAY)) != (RTF_UP | RTF_GATEWAY)):
+			continue
+
+		if ((best == None) or (route['metric'] < best['metric'])):
+			best = route
+
+	if (best == None):
+		return None
+
+	return best['gateway']
+
+# return the nameservers from resolv.conf in the order they are listed
+def nameservers(path='/etc/resolv.conf'):
+	servers = []
+
+	try:
+		f = open(path)
+	except IOError:
+		return servers
+
+	with f:
+		for line in f:
+			fields = line.split()
+
+			if ((len(fields) >= 2) and (fields[0] == 'nameserver')):
+				servers.append(fields[1])
+
+	return servers
+
+# return /proc/meminfo as a dict of name to kB
+def meminfo(path='/proc/meminfo'):
+	info = {}
+
+	with open(path) as f:
+		for line in f:
+			name, sep, value = line.partition(':')
+			fields = value.split()
+
+			if (len(fields) > 0):
+				info[name] = int(fields[0])
+
+	return info
+
+# read a single value file from sysfs, None if it is missing or unreadable
+def readSysValue(path):
+	try:
+		with open(path) as f:
+			return f.read().strip()
+	except (IOError, OSError):
+		return None
+
+# return the network interfaces under /sys/class/net as a list of dicts, sorted by name
+def interfaces(root='/sys/class/net'):
+	nics = []
+
+	for name in sorted(os.listdir(root)):
+		path = os.path.join(root, name)
+
+		carrier = readSysValue(os.path.join(path, 'carrier'))
+		mtu = readSysValue(os.path.join(path, 'mtu'))
+
+		if (mtu != None):
+			mtu = int(mtu)
+
+		nics.append({
+			'name': name,
+			'mac': readSysValue(os.path.join(path, 'address')),
+			'operstate': readSysValue(os.path.join(path, 'operstate')),
+			# carrier can only be read while the interface is up
+			'carrier': carrier == '1',
+			'mtu': mtu,
+		})
+
+	return nics
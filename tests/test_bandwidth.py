@@ -0,0 +1,97 @@
+#!/usr/bin/python
+#
+# Bandwidth client against the server on loopback
+
+import socket, threading, time, unittest
+import bandwidth
+
+# bandwidth.serve() on a free localhost port in a thread, keeping the meter of
+# every client it finished with
+class Server:
+
+	def __init__(self):
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		sock.bind(('127.0.0.1', 0))
+		self.port = sock.getsockname()[1]
+		sock.close()
+
+		self.running = True
+		self.finished = []
+		self.done = threading.Event()
+		self.thread = threading.Thread(target=bandwidth.serve, kwargs={
+			'port': self.port,
+			'address': '127.0.0.1',
+			'cancelled': lambda: (self.running == False),
+			'finished': self.clientFinished,
+		})
+		self.thread.daemon = True
+		self.thread.start()
+
+		# the listener is up once a connect works
+		for i in range(50):
+			try:
+				socket.create_connection(('127.0.0.1', self.port), 1).close()
+				break
+			except socket.error:
+				time.sleep(.05)
+
+	def clientFinished(self, address, direction, meter):
+		self.finished.append((direction, meter))
+		self.done.set()
+
+	def close(self):
+		self.running = False
+		self.thread.join()
+
+class LoopbackTest(unittest.TestCase):
+
+	def setUp(self):
+		self.server = Server()
+
+	def tearDown(self):
+		self.server.close()
+
+	def test_upload(self):
+		reports = []
+		meter = bandwidth.client('127.0.0.1', self.server.port, bandwidth.UPLOAD, 1, lambda bps, total, elapsed: reports.append((bps, total)))
+
+		self.assertTrue(self.server.done.wait(5))
+		direction, received = self.server.finished[0]
+
+		# the result is what arrived, not what send() took
+		self.assertEqual(direction, bandwidth.UPLOAD)
+		self.assertTrue(received.total > 0)
+		self.assertEqual(meter.total, received.total)
+		self.assertTrue(meter.average() > 0)
+
+		self.assertTrue(len(reports) > 0)
+		for bps, total in reports:
+			self.assertTrue(total <= meter.total)
+
+	def test_download(self):
+		meter = bandwidth.client('127.0.0.1', self.server.port, bandwidth.DOWNLOAD, 1)
+
+		self.assertTrue(self.server.done.wait(5))
+		direction, sent = self.server.finished[0]
+
+		self.assertEqual(direction, bandwidth.DOWNLOAD)
+		self.assertTrue(meter.total > 0)
+		self.assertTrue(meter.total <= sent.total)
+		self.assertTrue(meter.average() > 0)
+
+	def test_cancel(self):
+		start = time.time()
+		meter = bandwidth.client('127.0.0.1', self.server.port, bandwidth.UPLOAD, 30, cancelled=lambda: ((time.time() - start) > .5))
+
+		self.assertTrue(meter.elapsed() < 5)
+		self.assertTrue(meter.total > 0)
+
+class FormatTest(unittest.TestCase):
+
+	def test_format(self):
+		self.assertEqual(bandwidth.formatMbps(94.3e6), '94.3')
+		self.assertEqual(bandwidth.formatMbps(0), '0.0')
+		self.assertEqual(bandwidth.formatMbps(2345e6), '2345')
+
+if __name__ == '__main__':
+	unittest.main()
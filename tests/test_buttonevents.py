@@ -0,0 +1,110 @@
+#!/usr/bin/python
+#
+# Button events from edges on simulated GPIO pins
+
+import time, unittest
+from simgpio import SimGPIO
+from buttonevents import ButtonEvents, PRESS, RELEASE, LONGPRESS, REPEAT
+
+PIN = 7
+OTHER = 8
+
+class ButtonEventsTest(unittest.TestCase):
+
+	def setUp(self):
+		self.gpio = SimGPIO(log=False)
+		self.gpio.setup(PIN, self.gpio.IN, pull_up_down=self.gpio.PUD_UP)
+		self.gpio.setup(OTHER, self.gpio.IN, pull_up_down=self.gpio.PUD_UP)
+		self.events = ButtonEvents(self.gpio, {'btnSelect': PIN, 'btnBack': OTHER}, debounce=.03, longPress=.2, repeat=.05)
+
+	def tearDown(self):
+		self.events.close()
+
+	# everything posted so far, waiting up to 'wait' seconds for more
+	def collect(self, wait=.1):
+		collected = []
+
+		while True:
+			event = self.events.wait(wait)
+
+			if (event == None):
+				return collected
+
+			collected.append(event)
+
+	def test_press_release(self):
+		self.gpio.press(PIN)
+		time.sleep(.05)
+		self.gpio.release(PIN)
+
+		events = self.collect()
+
+		self.assertEqual([(event.button, event.kind) for event in events], [('btnSelect', PRESS), ('btnSelect', RELEASE)])
+		self.assertTrue(events[1].duration >= .05)
+		self.assertTrue(events[1].duration < .2)
+
+	def test_long_press_repeats(self):
+		self.gpio.press(PIN)
+		time.sleep(.33)
+		self.gpio.release(PIN)
+
+		kinds = [event.kind for event in self.collect()]
+
+		self.assertEqual(kinds[:2], [PRESS, LONGPRESS])
+		self.assertEqual(kinds[-1], RELEASE)
+		self.assertTrue(kinds.count(REPEAT) >= 1)
+		self.assertEqual(set(kinds[2:-1]), set([REPEAT]))
+
+		# nothing more once it is let go of
+		self.assertEqual(self.collect(.2), [])
+
+	# edges closer together than the debounce time are one press
+	def test_bounce(self):
+		for i in range(3):
+			self.gpio.press(PIN)
+			self.gpio.release(PIN)
+
+		self.gpio.press(PIN)
+		time.sleep(.08)
+
+		self.assertEqual([event.kind for event in self.collect(0)], [PRESS])
+
+		self.gpio.release(PIN)
+		self.assertEqual([event.kind for event in self.collect()], [RELEASE])
+
+	# a bounce that settles released is picked up when the pin has settled
+	def test_bounce_settles_released(self):
+		self.gpio.press(PIN)
+		self.gpio.release(PIN)
+
+		self.assertEqual([event.kind for event in self.collect()], [PRESS, RELEASE])
+
+	def test_buttons_apart(self):
+		self.gpio.press(PIN)
+		self.gpio.press(OTHER)
+		self.gpio.release(OTHER)
+		time.sleep(.05)
+		self.gpio.release(PIN)
+
+		events = [(event.button, event.kind) for event in self.collect()]
+
+		# Back bounced, its release comes once the pin has settled
+		self.assertEqual(events, [('btnSelect', PRESS), ('btnBack', PRESS), ('btnBack', RELEASE), ('btnSelect', RELEASE)])
+
+	def test_idle_time(self):
+		time.sleep(.1)
+		self.assertTrue(self.events.idleTime() >= .1)
+
+		self.gpio.press(PIN)
+		self.assertTrue(self.events.idleTime() < .1)
+
+	def test_flush(self):
+		self.gpio.press(PIN)
+		self.gpio.release(PIN)
+		time.sleep(.05)
+		self.events.flush()
+
+		self.assertEqual(self.collect(0), [])
+
+if __name__ == '__main__':
+	unittest.main()
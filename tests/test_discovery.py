@@ -0,0 +1,133 @@
+#!/usr/bin/python
+#
+# Host discovery: subnet arithmetic and a sweep of loopback addresses
+
+import socket, unittest
+import discovery
+
+class SubnetTest(unittest.TestCase):
+
+	def bounds(self, ip, netmask):
+		first, last = discovery.hostBounds(ip, netmask)
+
+		return (discovery.intToIP(first), discovery.intToIP(last))
+
+	def test_bounds(self):
+		self.assertEqual(self.bounds('192.168.1.77', '255.255.255.0'), ('192.168.1.1', '192.168.1.254'))
+		self.assertEqual(self.bounds('10.1.2.3', '255.255.0.0'), ('10.1.0.1', '10.1.255.254'))
+		self.assertEqual(self.bounds('192.168.1.6', '255.255.255.252'), ('192.168.1.5', '192.168.1.6'))
+
+	# point to point prefixes have no network and broadcast address
+	def test_edge_prefixes(self):
+		self.assertEqual(self.bounds('10.0.0.1', '255.255.255.254'), ('10.0.0.0', '10.0.0.1'))
+		self.assertEqual(self.bounds('10.0.0.1', '255.255.255.255'), ('10.0.0.1', '10.0.0.1'))
+
+	# the count matches what is generated, with and without our own address
+	def test_count_matches_hosts(self):
+		for ip, netmask in [('192.168.1.77', '255.255.255.0'), ('192.168.1.6', '255.255.255.252'),
+				('10.0.0.1', '255.255.255.254'), ('10.0.0.1', '255.255.255.255')]:
+			for skip in [(), (ip,), (ip, ip, '172.16.0.1')]:
+				hosts = list(discovery.subnetHosts(ip, netmask, skip))
+
+				self.assertEqual(discovery.hostCount(ip, netmask, skip), len(hosts))
+
+		self.assertEqual(list(discovery.subnetHosts('10.0.0.1', '255.255.255.254', ('10.0.0.1',))), ['10.0.0.0'])
+		self.assertEqual(discovery.hostCount('10.0.0.1', '255.255.255.255', ('10.0.0.1',)), 0)
+
+	def test_large_prefix(self):
+		self.assertEqual(discovery.hostCount('10.0.0.1', '255.0.0.0'), 2 ** 24 - 2)
+
+		hosts = discovery.subnetHosts('10.0.0.1', '255.0.0.0')
+		self.assertEqual([hosts.next() for i in range(2)], ['10.0.0.1', '10.0.0.2'])
+
+	def test_checksum(self):
+		# the RFC 1071 example, the checksum of data with its checksum in is 0
+		data = '\x00\x01\xf2\x03\xf4\xf5\xf6\xf7'
+		self.assertEqual(discovery.checksum(data), 0x220D)
+		self.assertEqual(discovery.checksum(data + '\x22\x0d'), 0)
+
+		# odd lengths are padded with a zero byte
+		self.assertEqual(discovery.checksum('\x01'), discovery.checksum('\x01\x00'))
+
+	def test_echo_request(self):
+		packet = discovery.echoRequest(0x1234, 7)
+
+		self.assertEqual(discovery.checksum(packet), 0)
+		self.assertEqual(packet[4:8], '\x12\x34\x00\x07')
+
+# every 127/8 address is this host, so a sweep of a loopback /29 finds all of
+# them up, with an open port and one that refuses
+class SweepTest(unittest.TestCase):
+
+	ip = '127.0.0.9'
+	netmask = '255.255.255.248'
+	hosts = ['127.0.0.10', '127.0.0.11', '127.0.0.12', '127.0.0.13', '127.0.0.14']
+
+	def setUp(self):
+		self.listener = socket.socket()
+		self.listener.bind(('0.0.0.0', 0))
+		self.listener.listen(16)
+
+		closed = socket.socket()
+		closed.bind(('127.0.0.1', 0))
+		self.ports = [self.listener.getsockname()[1], closed.getsockname()[1]]
+		closed.close()
+
+		self.icmpSocket = discovery.icmpSocket
+
+	def tearDown(self):
+		discovery.icmpSocket = self.icmpSocket
+		self.listener.close()
+
+	def sweep(self, **options):
+		found = []
+		progress = []
+
+		alive = discovery.discover(self.ip, self.netmask, self.ports, window=4, timeout=1.0,
+			found=found.append, progress=lambda done, total: progress.append((done, total)), **options)
+
+		return (alive, found, progress)
+
+	def checkProgress(self, progress):
+		total = len(self.hosts) * len(self.ports)
+
+		self.assertEqual(progress[-1], (total, total))
+		self.assertEqual(progress, sorted(set(progress)))
+
+	def test_tcp(self):
+		discovery.icmpSocket = lambda: None
+		alive, found, progress = self.sweep()
+
+		self.assertEqual(alive, self.hosts)
+		self.assertEqual(sorted(found), self.hosts)
+		self.checkProgress(progress)
+
+	# icmp where we may open a raw socket, tcp for the rest
+	def test_sweep(self):
+		alive, found, progress = self.sweep()
+
+		self.assertEqual(alive, self.hosts)
+		self.assertEqual(sorted(found), self.hosts)
+		self.checkProgress(progress)
+
+	# a /32 holds only our own address, there is nothing to probe or report
+	def test_own_host_only(self):
+		self.ip = '127.0.0.1'
+		self.netmask = '255.255.255.255'
+		alive, found, progress = self.sweep()
+
+		self.assertEqual(alive, [])
+		self.assertEqual(progress, [])
+
+	def test_cancel(self):
+		discovery.icmpSocket = lambda: None
+		progress = []
+
+		discovery.discover(self.ip, self.netmask, self.ports, window=1, progress=lambda done, total: progress.append((done, total)),
+			cancelled=lambda: len(progress) >= 3)
+
+		self.assertTrue(len(progress) <= 4)
+		self.assertTrue(progress[-1][0] < progress[-1][1])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+#
+# DNS benchmark against a local stub server, and the query encoder/decoder
+
+import socket, struct, threading, unittest
+import dnsbench
+
+# a DNS server on localhost that answers A queries by name: drop.test gets no
+# answer, fail.test gets SERVFAIL and everything else an address
+class StubServer:
+
+	def __init__(self):
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.bind(('127.0.0.1', 0))
+		self.sock.settimeout(.1)
+		self.port = self.sock.getsockname()[1]
+		self.queries = 0
+		self.running = True
+		self.thread = threading.Thread(target=self.serve)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def serve(self):
+		while self.running:
+			try:
+				data, address = self.sock.recvfrom(512)
+			except socket.timeout:
+				continue
+
+			self.queries += 1
+
+			# a runt datagram too short to carry an id, it has to be skipped
+			if (self.queries == 1):
+				self.sock.sendto('\x00', address)
+
+			query = dnsbench.decodeResponse(data)
+			name = query['questions'][0][0]
+
+			if (name == 'drop.test'):
+				continue
+
+			if (name == 'fail.test'):
+				self.sock.sendto(reply(data, dnsbench.SERVFAIL), address)
+			else:
+				self.sock.sendto(reply(data, dnsbench.NOERROR, '10.1.2.3'), address)
+
+	def close(self):
+		self.running = False
+		self.thread.join()
+		self.sock.close()
+
+# a reply to 'query' with the question copied and an A record pointing back at it
+def reply(query, rcode, address=None):
+	ident = struct.unpack('!H', query[:2])[0]
+	flags = dnsbench.FLAG_QR | dnsbench.FLAG_RD | 0x0080 | rcode
+
+	if (address == None):
+		return struct.pack('!HHHHHH', ident, flags, 1, 0, 0, 0) + query[12:]
+
+	# the answer's name is a pointer to the question name at offset 12
+	answer = '\xc0\x0c' + struct.pack('!HHLH', dnsbench.TYPE_A, dnsbench.CLASS_IN, 300, 4) + socket.inet_aton(address)
+
+	return struct.pack('!HHHHHH', ident, flags, 1, 1, 0, 0) + query[12:] + answer
+
+class BenchmarkTest(unittest.TestCase):
+
+	def test_against_stub(self):
+		server = StubServer()
+		names = ['ok.test', 'fail.test', 'drop.test', 'other.test']
+		progress = []
+
+		try:
+			bench = dnsbench.run('127.0.0.1', names, count=40, window=8, timeout=.2, port=server.port, callback=lambda bench: progress.append(bench.finished()))
+		finally:
+			server.close()
+
+		self.assertEqual(bench.sent, 40)
+		self.assertEqual(bench.latency.received, 30)
+		self.assertEqual(bench.latency.lost, 10)
+		self.assertEqual(bench.errors, 0)
+		self.assertEqual(bench.rcodes, {dnsbench.NOERROR: 20, dnsbench.SERVFAIL: 10})
+		self.assertEqual(bench.rate(dnsbench.SERVFAIL), .25)
+		self.assertEqual(bench.timeoutRate(), .25)
+		self.assertEqual(progress, range(1, 41))
+
+		# answers per second up to the last answer, not the wait for the lost ones
+		self.assertTrue(0 < bench.answering < bench.elapsed)
+		self.assertAlmostEqual(bench.qps(), 30 / bench.answering)
+		self.assertTrue(bench.latency.minimum <= bench.latency.quantile(.5) <= bench.latency.maximum)
+
+	def test_no_server(self):
+		sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		sock.bind(('127.0.0.1', 0))
+		port = sock.getsockname()[1]
+		sock.close()
+
+		bench = dnsbench.run('127.0.0.1', count=10, window=4, timeout=.2, port=port)
+
+		self.assertEqual(bench.sent, 10)
+		self.assertEqual(bench.latency.received, 0)
+		self.assertEqual(bench.finished(), 10)
+		self.assertEqual(bench.qps(), 0.0)
+
+class CodecTest(unittest.TestCase):
+
+	def test_query(self):
+		query = dnsbench.encodeQuery(0x1234, 'www.example.com')
+
+		self.assertEqual(query, '\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x03www\x07example\x03com\x00\x00\x01\x00\x01')
+
+	def test_compressed_reply(self):
+		decoded = dnsbench.decodeResponse(reply(dnsbench.encodeQuery(7, 'a.example.org'), dnsbench.NOERROR, '192.0.2.1'))
+
+		self.assertEqual(decoded['id'], 7)
+		self.assertEqual(decoded['rcode'], dnsbench.NOERROR)
+		self.assertEqual(decoded['truncated'], False)
+		self.assertEqual(decoded['questions'], [('a.example.org', dnsbench.TYPE_A)])
+		self.assertEqual(decoded['answers'], [('a.example.org', dnsbench.TYPE_A, 300, '192.0.2.1')])
+
+	def test_pointer_into_a_name(self):
+		# the second name is 'mail' followed by a pointer to 'example.org' inside the first
+		data = struct.pack('!HHHHHH', 1, 0x8180, 2, 0, 0, 0)
+		data += '\x03www\x07example\x03org\x00' + struct.pack('!HH', 1, 1)
+		data += '\x04mail\xc0\x10' + struct.pack('!HH', 1, 1)
+
+		self.assertEqual(dnsbench.decodeResponse(data)['questions'], [('www.example.org', 1), ('mail.example.org', 1)])
+
+	def test_malformed(self):
+		header = struct.pack('!HHHHHH', 1, 0x8180, 1, 0, 0, 0)
+
+		self.assertRaises(dnsbench.DNSError, dnsbench.decodeResponse, '\x00' * 11)
+		self.assertRaises(dnsbench.DNSError, dnsbench.decodeResponse, header + '\xc0\x0c')
+		self.assertRaises(dnsbench.DNSError, dnsbench.decodeResponse, header + '\x05ab')
+
+	def test_bad_name(self):
+		self.assertRaises(ValueError, dnsbench.encodeName, 'a..b')
+		self.assertRaises(ValueError, dnsbench.encodeName, 'x' * 64 + '.com')
+
+if __name__ == '__main__':
+	unittest.main()
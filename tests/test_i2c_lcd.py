@@ -0,0 +1,123 @@
+#!/usr/bin/python
+#
+# I2C backpack lcd driver on a fake smbus bus
+#
+# The fake bus replays every port state the driver writes onto the simulated
+# GPIO pins of an emulated HD44780, so the tests see what the controller
+# would have in DDRAM and how many bus transactions it took.
+
+import unittest
+from simgpio import SimGPIO
+from hd44780sim import HD44780
+from lcdframe import LCDFrameBuffer
+import Adafruit_I2C_CharLCD
+from Adafruit_I2C_CharLCD import Adafruit_I2C_CharLCD as I2CLCD, BLOCK_SIZE
+
+# simulated GPIO pins the expander's port bits are wired to
+PIN_RS = 1
+PIN_RW = 2
+PIN_E = 3
+PINS_DB = [10, 11, 12, 13]
+
+class FakeBus:
+
+	# an smbus.SMBus that drives the lcd pins with every port state written to it
+	def __init__(self, expander, gpio):
+		self.expander = expander
+		self.gpio = gpio
+		self.blocks = []
+		self.pins = {expander.rs: PIN_RS, expander.rw: PIN_RW, expander.e: PIN_E}
+
+		for bit, pin in zip(expander.data, PINS_DB):
+			self.pins[bit] = pin
+
+		for pin in self.pins.values():
+			gpio.setup(pin, gpio.OUT)
+
+	def apply(self, states):
+		for state in states:
+			for bit, pin in sorted(self.pins.items()):
+				self.gpio.output(pin, bool(state & bit))
+
+	def write_byte(self, address, value):
+		self.blocks.append([value])
+		self.apply([value])
+
+	# MCP23017 register setup, not port states
+	def write_byte_data(self, address, register, value):
+		pass
+
+	def write_i2c_block_data(self, address, register, values):
+		# the PCF8574 has no registers, the 'register' byte is the first state
+		if (self.expander == Adafruit_I2C_CharLCD.PCF8574):
+			states = [register] + list(values)
+		else:
+			# sequential addressing is off, every byte goes to the port
+			if (register != Adafruit_I2C_CharLCD.MCP23017.GPIOB):
+				raise AssertionError('block write to register 0x%02X' % register)
+
+			states = list(values)
+
+		self.blocks.append(states)
+		self.apply(states)
+
+class I2CLCDTest:
+
+	expander = None
+
+	def setUp(self):
+		self.gpio = SimGPIO(log=False)
+		self.display = HD44780(self.gpio, pin_rs=PIN_RS, pin_e=PIN_E, pins_db=PINS_DB)
+		self.bus = FakeBus(Adafruit_I2C_CharLCD.EXPANDERS[self.expander], self.gpio)
+		self.lcd = I2CLCD(expander=self.expander, bus=self.bus)
+		self.lcd.begin(16, 2)
+		self.screen = LCDFrameBuffer(self.lcd)
+
+	def test_frame(self):
+		before = self.lcd.transactions
+		blocks = len(self.bus.blocks)
+
+		self.screen.render(['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+
+		self.assertEqual(self.display.lines(), ['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+		self.assertEqual(self.display.counters()['violations'], 0)
+
+		# 32 characters are 128 port states plus a cursor move and RS changes, in
+		# blocks of at most 32 states
+		self.assertEqual(self.lcd.transactions - before, 8)
+		self.assertEqual(len(self.bus.blocks) - blocks, 8)
+
+		for states in self.bus.blocks:
+			self.assertTrue(len(states) <= BLOCK_SIZE)
+
+	def test_changed_cells_only(self):
+		self.screen.render(['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+		before = self.lcd.transactions
+
+		self.screen.render(['0123456789abcdeX', 'ABCDEFGHIJKLMNOP'])
+
+		self.assertEqual(self.display.lines(), ['0123456789abcdeX', 'ABCDEFGHIJKLMNOP'])
+
+		# a cursor move and one character
+		self.assertEqual(self.lcd.transactions - before, 2)
+
+	def test_custom_character(self):
+		rows = [0x1F, 0x11, 0x11, 0x11, 0x11, 0x11, 0x1F, 0x00]
+		before = self.lcd.transactions
+
+		self.lcd.createChar(3, rows)
+
+		# address and 8 rows in one flush, 2 blocks of at most 32 states
+		self.assertEqual(self.lcd.transactions - before, 2)
+		self.assertEqual(self.display.glyph(3), rows)
+
+class PCF8574Test(I2CLCDTest, unittest.TestCase):
+
+	expander = 'pcf8574'
+
+class MCP23017Test(I2CLCDTest, unittest.TestCase):
+
+	expander = 'mcp23017'
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,182 @@
+#!/usr/bin/python
+#
+# Latency probes against local echo listeners, and the streaming summary
+
+import random, socket, threading, unittest
+import latency
+
+# a UDP echo service on localhost that answers every datagram unless drop(n)
+# says to drop the n-th one
+class EchoServer:
+
+	def __init__(self, drop=None):
+		self.drop = drop
+		self.received = 0
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.bind(('127.0.0.1', 0))
+		self.sock.settimeout(.1)
+		self.port = self.sock.getsockname()[1]
+		self.running = True
+		self.thread = threading.Thread(target=self.serve)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def serve(self):
+		while self.running:
+			try:
+				data, address = self.sock.recvfrom(512)
+			except socket.timeout:
+				continue
+
+			self.received += 1
+
+			if ((self.drop != None) and self.drop(self.received)):
+				continue
+
+			# something that is not our payload first, it has to be ignored
+			self.sock.sendto('stray', address)
+			self.sock.sendto(data, address)
+
+	def close(self):
+		self.running = False
+		self.thread.join()
+		self.sock.close()
+
+# a port nothing listens on
+def closedPort(kind=socket.SOCK_STREAM):
+	sock = socket.socket(socket.AF_INET, kind)
+	sock.bind(('127.0.0.1', 0))
+	port = sock.getsockname()[1]
+	sock.close()
+
+	return port
+
+class ProbeTest(unittest.TestCase):
+
+	def test_udp_echo(self):
+		server = EchoServer()
+		target = latency.Target('echo', '127.0.0.1', server.port, latency.UDP)
+		results = []
+
+		try:
+			latency.probe([target], interval=.01, timeout=1.0, count=10, callback=lambda target, rtt: results.append(rtt))
+		finally:
+			server.close()
+
+		summary = target.stats
+
+		self.assertEqual(len(results), 10)
+		self.assertEqual(summary.received, 10)
+		self.assertEqual(summary.lost, 0)
+		self.assertEqual(summary.loss(), 0.0)
+		self.assertTrue(0 < summary.minimum <= summary.average() <= summary.maximum < 1000)
+		self.assertTrue(summary.minimum <= summary.quantile(.5) <= summary.maximum)
+
+	def test_refused_tcp_port_is_an_answer(self):
+		target = latency.Target('closed', '127.0.0.1', closedPort())
+
+		latency.probe([target], interval=.01, timeout=1.0, count=5)
+
+		self.assertEqual(target.stats.received, 5)
+		self.assertEqual(target.stats.lost, 0)
+
+	def test_tcp_listener(self):
+		listener = socket.socket()
+		listener.bind(('127.0.0.1', 0))
+		listener.listen(10)
+
+		target = latency.Target('open', '127.0.0.1', listener.getsockname()[1])
+
+		try:
+			latency.probe([target], interval=.01, timeout=1.0, count=5)
+		finally:
+			listener.close()
+
+		self.assertEqual(target.stats.received, 5)
+
+	def test_dropped_probe(self):
+		# every other datagram gets no answer
+		server = EchoServer(drop=lambda n: n % 2 == 0)
+		target = latency.Target('lossy', '127.0.0.1', server.port, latency.UDP)
+		results = []
+
+		try:
+			# a target still waiting for an answer sits the round out, so every
+			# round only gets a probe when the interval is longer than the timeout
+			latency.probe([target], interval=.25, timeout=.2, count=6, callback=lambda target, rtt: results.append(rtt))
+		finally:
+			server.close()
+
+		self.assertEqual(results.count(None), 3)
+		self.assertEqual(target.stats.received, 3)
+		self.assertEqual(target.stats.lost, 3)
+		self.assertEqual(target.stats.loss(), .5)
+
+	def test_targets_in_parallel(self):
+		# a silent target must not hold up the others
+		silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		silent.bind(('127.0.0.1', 0))
+		server = EchoServer()
+
+		targets = [
+			latency.Target('silent', '127.0.0.1', silent.getsockname()[1], latency.UDP),
+			latency.Target('echo', '127.0.0.1', server.port, latency.UDP),
+			latency.Target('closed', '127.0.0.1', closedPort()),
+		]
+
+		try:
+			latency.probe(targets, interval=.5, timeout=.3, count=2)
+		finally:
+			server.close()
+			silent.close()
+
+		self.assertEqual([target.stats.lost for target in targets], [2, 0, 0])
+		self.assertEqual([target.stats.received for target in targets], [0, 2, 2])
+
+class SummaryTest(unittest.TestCase):
+
+	def test_p2_against_sorted_sample(self):
+		generator = random.Random(23)
+		values = [generator.expovariate(1) for i in range(20000)]
+		ordered = sorted(values)
+
+		for p in (.5, .9, .99):
+			estimate = latency.P2Quantile(p)
+
+			for value in values:
+				estimate.add(value)
+
+			exact = ordered[int(p * len(ordered))]
+
+			self.assertTrue(abs(estimate.value() - exact) < exact * .02, (p, estimate.value(), exact))
+
+	def test_p2_few_values(self):
+		estimate = latency.P2Quantile(.5)
+		self.assertEqual(estimate.value(), None)
+
+		for value in (3, 1, 2):
+			estimate.add(value)
+
+		self.assertEqual(estimate.value(), 2)
+
+	def test_stats(self):
+		summary = latency.LatencyStats()
+
+		for rtt in (10.0, 12.0, 11.0):
+			summary.reply(rtt)
+
+		summary.timeout()
+
+		self.assertEqual(summary.minimum, 10.0)
+		self.assertEqual(summary.maximum, 12.0)
+		self.assertEqual(summary.average(), 11.0)
+		self.assertEqual(summary.loss(), .25)
+
+		# |12-10| then |11-12|, each moving the jitter 1/16 of the way
+		self.assertAlmostEqual(summary.jitter, 2.0 / 16 + (1 - 2.0 / 16) / 16)
+
+	def test_format(self):
+		self.assertEqual([latency.formatMs(ms) for ms in (None, .123, 9.996, 45.67, 99.96, 250.4, 123456)], ['-', '0.12', '10.0', '45.7', '100', '250', '9999'])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,258 @@
+#!/usr/bin/python
+#
+# Shadow framebuffer on the parallel lcd driver and an emulated HD44780
+#
+# The driver talks to simulated GPIO pins that the emulator decodes, so the
+# tests see what the controller would have in DDRAM and what it cost.
+
+import threading, time, unittest
+from simgpio import SimGPIO
+from hd44780sim import HD44780
+from lcdframe import LCDFrameBuffer, DDRAM_COLS, MARQUEE_GAP
+from Adafruit_CharLCD import Adafruit_CharLCD
+import lcdframe
+
+LONG = 'a line that is too long to fit'
+BLANK = ' ' * 16
+
+# what a scrolling line shows after 'steps' steps
+def scrolled(text, steps):
+	loop = text + ' ' * MARQUEE_GAP
+
+	return (loop * 3)[steps % len(loop):steps % len(loop) + 16]
+
+class FrameBufferTest:
+
+	threaded = False
+
+	def setUp(self):
+		self.gpio = SimGPIO(log=False)
+		self.display = HD44780(self.gpio)
+		self.lcd = Adafruit_CharLCD(GPIO=self.gpio)
+		self.lcd.begin(16, 2)
+		self.screen = LCDFrameBuffer(self.lcd, threaded=self.threaded)
+
+	def shown(self):
+		self.screen.sync()
+
+		return self.display.lines()
+
+	# instructions and data writes the lcd got since the last call
+	def cost(self):
+		self.screen.sync()
+		counters = self.display.counters()
+		self.display.resetCounters()
+
+		return (counters['instructions'], counters['writes'])
+
+	def test_render(self):
+		self.screen.render(['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+
+		self.assertEqual(self.shown(), ['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+		self.assertEqual(self.screen.lines(), ['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+		self.assertEqual(self.display.counters()['violations'], 0)
+
+		# short lines are padded, long ones on the second row cut off
+		self.screen.render(['short', 'x' * 20])
+		self.assertEqual(self.shown(), ['short'.ljust(16), 'x' * 16])
+
+	# only cells that differ from the shadow are sent
+	def test_changed_cells_only(self):
+		self.screen.render(['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+		self.cost()
+
+		self.screen.render(['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+		self.assertEqual(self.cost(), (0, 0))
+
+		# a cursor move and one character
+		self.screen.render(['0123456789abcdeX', 'ABCDEFGHIJKLMNOP'])
+		self.assertEqual(self.cost(), (1, 1))
+
+		# a single unchanged cell between two changes is resent, not skipped
+		self.screen.render(['0123456789abcdeX', 'AxCxEFGHIJKLMNOP'])
+		self.assertEqual(self.cost(), (1, 3))
+
+		# two changes further apart each get a cursor move
+		self.screen.render(['y123456789abcdeX', 'AxCxEFGHIJKLMNOz'])
+		self.assertEqual(self.cost(), (2, 2))
+
+		self.assertEqual(self.shown(), ['y123456789abcdeX', 'AxCxEFGHIJKLMNOz'])
+
+	def test_write(self):
+		self.screen.render(['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+		self.cost()
+
+		self.screen.write(3, 1, 'xy')
+		self.assertEqual(self.cost(), (1, 2))
+
+		# cut off at the edge, rows past the last are the last
+		self.screen.write(14, 5, 'tail')
+
+		self.assertEqual(self.shown(), ['0123456789abcdef', 'ABCxyFGHIJKLMNta'])
+		self.assertEqual(self.screen.lines(), ['0123456789abcdef', 'ABCxyFGHIJKLMNta'])
+
+	# after invalidate() every cell of DDRAM is sent again
+	def test_invalidate(self):
+		self.screen.render(['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+
+		# something behind the framebuffer's back, once the writer is done
+		self.screen.sync()
+		self.lcd.setCursor(0, 0)
+		self.lcd.message('garbage')
+		self.screen.invalidate()
+
+		self.cost()
+		self.screen.render(['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+
+		self.assertEqual(self.shown(), ['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+		self.assertEqual(self.cost()[1], 2 * DDRAM_COLS)
+
+	# a marquee step with nothing else on screen is a shift and one character
+	def test_marquee_step(self):
+		self.screen.render([LONG, ''])
+		self.assertEqual(self.shown(), [LONG[:16], BLANK])
+		self.cost()
+
+		for steps in range(1, 2 * len(LONG)):
+			self.screen.step()
+
+			self.assertEqual(self.shown(), [scrolled(LONG, steps), BLANK])
+			self.assertEqual(self.screen.lines()[0], scrolled(LONG, steps))
+
+			instructions, writes = self.cost()
+			self.assertTrue(writes <= 1)
+			self.assertTrue(instructions <= 2)
+
+		self.assertEqual(self.display.counters()['violations'], 0)
+
+	# the other row is put back at the new window position, or the scrolling
+	# line is rewritten in place when that is cheaper
+	def test_marquee_other_row(self):
+		for other in ['second', '0123456789abcdef']:
+			self.screen.render([LONG, other])
+			self.screen.step()
+			self.cost()
+
+			for steps in range(2, 10):
+				self.screen.step()
+
+				self.assertEqual(self.shown(), [scrolled(LONG, steps), other.ljust(16)])
+				self.assertTrue(sum(self.cost()) <= 17)
+
+			self.screen.render(['still', 'here'])
+			self.assertEqual(self.shown(), ['still'.ljust(16), 'here'.ljust(16)])
+
+	# rendering the same long line again keeps it scrolling where it was
+	def test_marquee_keeps_position(self):
+		self.screen.render([LONG, ''])
+		self.screen.step()
+		self.screen.step()
+		self.screen.render([LONG, 'more'])
+
+		self.assertEqual(self.shown(), [scrolled(LONG, 2), 'more'.ljust(16)])
+
+		# writing over the scrolling line stops it
+		self.screen.write(0, 0, '>')
+		self.screen.step()
+
+		self.assertEqual(self.shown(), ['>' + scrolled(LONG, 2)[1:], 'more'.ljust(16)])
+
+	def test_clear_display(self):
+		self.screen.render(['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+		self.screen.clearDisplay()
+
+		self.assertEqual(self.shown(), [' ' * 16, ' ' * 16])
+		self.assertEqual(self.screen.lines(), [' ' * 16, ' ' * 16])
+
+		# the shadow knows the lcd is blank, so the same frame is drawn again
+		self.screen.render(['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+
+		self.assertEqual(self.shown(), ['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+		self.assertEqual(self.display.counters()['violations'], 0)
+
+	# the clear undoes display shifts, later frames land in the window
+	def test_clear_display_after_marquee(self):
+		self.screen.render(['a line that is too long to fit', 'second'])
+
+		for i in range(3):
+			self.screen.step()
+
+		self.screen.clearDisplay()
+		self.screen.render(['first', 'second'])
+
+		self.assertEqual(self.shown(), ['first'.ljust(16), 'second'.ljust(16)])
+
+class UnthreadedTest(FrameBufferTest, unittest.TestCase):
+
+	threaded = False
+
+class ThreadedTest(FrameBufferTest, unittest.TestCase):
+
+	threaded = True
+
+	def tearDown(self):
+		self.screen.sync()
+		lcdframe.MARQUEE_PAUSE = self.pause
+		lcdframe.MARQUEE_STEP = self.step
+
+	def setUp(self):
+		FrameBufferTest.setUp(self)
+		self.pause = lcdframe.MARQUEE_PAUSE
+		self.step = lcdframe.MARQUEE_STEP
+
+	# frames that pile up while the writer is busy are dropped, only the last is drawn
+	def test_coalescing(self):
+		hold = threading.Event()
+		self.screen.render(['0123456789abcdef', 'ABCDEFGHIJKLMNOP'])
+		self.cost()
+
+		self.screen.command(hold.wait, 5)
+
+		for i in range(20):
+			self.screen.render(['frame %d' % i, 'ABCDEFGHIJKLMNOP'])
+
+		hold.set()
+
+		self.assertEqual(self.shown(), ['frame 19'.ljust(16), 'ABCDEFGHIJKLMNOP'])
+
+		# one frame's worth, a cursor move and the first row
+		self.assertEqual(self.cost(), (1, 16))
+
+	# the writer thread runs the marquee by itself
+	def test_marquee_runs(self):
+		lcdframe.MARQUEE_PAUSE = .05
+		lcdframe.MARQUEE_STEP = .05
+
+		self.screen.render([LONG, ''])
+
+		for i in range(100):
+			if (self.display.lines()[0] == scrolled(LONG, 3)):
+				break
+
+			time.sleep(.01)
+
+		self.assertEqual(self.display.lines()[0], scrolled(LONG, 3))
+
+	# a command queued between two frames sees the first one drawn
+	def test_command_order(self):
+		hold = threading.Event()
+		seen = []
+
+		def wait():
+			hold.wait(5)
+
+		def look():
+			seen.append(self.display.lines())
+
+		# keep the writer busy while the frames and commands queue up
+		self.screen.command(wait)
+		self.screen.render(['first', ''])
+		self.screen.command(look)
+		self.screen.render(['second', ''])
+		hold.set()
+
+		self.assertEqual(self.shown(), ['second'.ljust(16), ' ' * 16])
+		self.assertEqual(seen, [['first'.ljust(16), ' ' * 16]])
+
+if __name__ == '__main__':
+	unittest.main()
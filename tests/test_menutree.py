@@ -0,0 +1,136 @@
+#!/usr/bin/python
+#
+# Menu engine driving the framebuffer on an emulated HD44780
+#
+# Button presses are scripted, and every time the engine asks for input the
+# test records what the emulated display shows.
+
+import unittest
+from simgpio import SimGPIO
+from hd44780sim import HD44780
+from lcdframe import LCDFrameBuffer
+from Adafruit_CharLCD import Adafruit_CharLCD
+from menutree import Menu, MenuItem, MenuEngine, UP, DOWN, BACK, SELECT
+
+# stops the engine once the script has run out
+class Done(Exception):
+	pass
+
+class MenuEngineTest(unittest.TestCase):
+
+	def setUp(self):
+		self.gpio = SimGPIO(log=False)
+		self.display = HD44780(self.gpio)
+		self.lcd = Adafruit_CharLCD(GPIO=self.gpio)
+		self.lcd.begin(16, 2)
+		self.screen = LCDFrameBuffer(self.lcd)
+
+		self.script = []
+		self.shown = []
+		self.actions = []
+		self.idled = 0
+
+		self.engine = MenuEngine(self.screen, self.readInput, self.actions.append, self.idle)
+
+	# inputs are button names, None for a read that timed out or (None, event)
+	# for an event that is not a press
+	def readInput(self):
+		self.shown.append(self.display.lines())
+
+		if (len(self.script) == 0):
+			raise Done()
+
+		step = self.script.pop(0)
+
+		if (isinstance(step, tuple)):
+			return step
+
+		return (step, step)
+
+	def idle(self):
+		self.idled += 1
+
+	def drive(self, menu, script, root=False):
+		self.script = list(script)
+		self.shown = []
+
+		try:
+			self.engine.run(menu, root)
+		except Done:
+			pass
+
+		return [[line.rstrip() for line in lines] for lines in self.shown]
+
+	def test_navigation(self):
+		action = lambda: None
+		sub = Menu('Sub', [MenuItem('one'), MenuItem('two')])
+		menu = Menu('Top', [MenuItem('alpha'), MenuItem('beta', sub), MenuItem('gamma', action)])
+
+		shown = self.drive(menu, [UP, DOWN, SELECT, DOWN, DOWN, BACK, DOWN, SELECT, DOWN], root=True)
+
+		self.assertEqual(shown, [
+			['> alpha', '  beta'],
+			['> alpha', '  beta'],		# up at the top stays
+			['  alpha', '> beta'],
+			['> one', '  two'],		# submenu
+			['  one', '> two'],
+			['  one', '> two'],		# down at the bottom stays
+			['  alpha', '> beta'],		# back where we left
+			['> gamma', ''],		# second page
+			['> gamma', ''],		# the action ran
+			['> gamma', ''],
+		])
+		self.assertEqual(self.actions, [action])
+		self.assertEqual(self.display.counters()['violations'], 0)
+
+	# a menu remembers its position, Back leaves it unless it is the root
+	def test_positions(self):
+		sub = Menu('Sub', [MenuItem('one'), MenuItem('two'), MenuItem('three')])
+		menu = Menu('Top', [MenuItem('sub', sub)])
+
+		self.drive(menu, [SELECT, DOWN, DOWN, BACK, SELECT])
+		self.assertEqual(self.shown[-1], ['> three'.ljust(16), ' ' * 16])
+
+		self.assertEqual(self.drive(sub, [BACK, DOWN]), [['> three', '']])
+		self.assertEqual(self.drive(menu, [BACK, BACK, SELECT], root=True)[-1], ['> three', ''])
+
+	# one item per page with its value under it, values can be functions
+	def test_pages(self):
+		counter = {'value': 0}
+
+		def value():
+			counter['value'] += 1
+			return str(counter['value'])
+
+		menu = Menu('Info', [MenuItem('Static', value='fixed'), MenuItem('Live', value=value)], prompt=False)
+
+		shown = self.drive(menu, [DOWN, DOWN, None, UP])
+
+		self.assertEqual(shown, [['Static', 'fixed'], ['Live', '1'], ['Live', '2'], ['Live', '3'], ['Static', 'fixed']])
+		self.assertEqual(self.idled, 1)
+
+	# items given as a function are fetched again when refresh says so, and the
+	# position stays in range when the list shrinks
+	def test_refresh(self):
+		items = [MenuItem('a'), MenuItem('b'), MenuItem('c')]
+
+		def refresh(event):
+			if (event == 'shrink'):
+				del items[1:]
+				return True
+
+			return False
+
+		menu = Menu('List', lambda: items, refresh=refresh)
+		shown = self.drive(menu, [DOWN, DOWN, (None, 'other'), (None, 'shrink')])
+
+		self.assertEqual(shown[-3:], [['> c', ''], ['> c', ''], ['> a', '']])
+
+	def test_empty(self):
+		menu = Menu('Nothing', lambda: None)
+
+		self.assertEqual(self.drive(menu, [DOWN, SELECT, UP]), [['', '']] * 4)
+		self.assertEqual(self.actions, [])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/python
+#
+# Port scanner against listeners on localhost
+
+import socket, unittest
+import portscan
+
+# a port nothing listens on, bound and closed again so it was free a moment ago
+def closedPort():
+	sock = socket.socket()
+	sock.bind(('127.0.0.1', 0))
+	port = sock.getsockname()[1]
+	sock.close()
+
+	return port
+
+class ScanTest(unittest.TestCase):
+
+	def setUp(self):
+		self.listeners = []
+
+		for i in range(3):
+			sock = socket.socket()
+			sock.bind(('127.0.0.1', 0))
+			sock.listen(5)
+			self.listeners.append(sock)
+
+		self.open = sorted([sock.getsockname()[1] for sock in self.listeners])
+		self.closed = [closedPort() for i in range(5)]
+
+	def tearDown(self):
+		for sock in self.listeners:
+			sock.close()
+
+	def test_open_and_closed(self):
+		ports = self.open + self.closed
+		progress = []
+
+		def callback(port, state, done, total):
+			progress.append((done, total))
+
+		# a window smaller than the number of ports has to be refilled as ports finish
+		results = portscan.scan('127.0.0.1', ports, window=2, timeout=1.0, callback=callback)
+
+		self.assertEqual(sorted(results.keys()), sorted(ports))
+		self.assertEqual(portscan.openPorts(results), self.open)
+
+		for port in self.closed:
+			self.assertEqual(results[port], portscan.CLOSED)
+
+		self.assertEqual(progress, [(done, len(ports)) for done in range(1, len(ports) + 1)])
+
+	def test_cancel(self):
+		ports = self.closed * 20
+		seen = []
+
+		def callback(port, state, done, total):
+			seen.append(port)
+
+		portscan.scan('127.0.0.1', ports, window=2, callback=callback, cancelled=lambda: len(seen) >= 5)
+
+		# loopback can refuse in connect() itself, that must not get past cancel either
+		self.assertTrue(len(seen) >= 5)
+		self.assertTrue(len(seen) <= 5 + 2)
+
+	def test_connect_many_generator(self):
+		found = []
+
+		def targets():
+			for port in self.open:
+				yield ('127.0.0.1', port)
+
+		portscan.connectMany(targets(), window=1, callback=lambda host, port, state: found.append((port, state)))
+
+		self.assertEqual(sorted(found), [(port, portscan.OPEN) for port in self.open])
+
+class ParsePortsTest(unittest.TestCase):
+
+	def test_list_and_ranges(self):
+		self.assertEqual(portscan.parsePorts('22, 80,8000-8002,'), [22, 80, 8000, 8001, 8002])
+
+	def test_single_port_range(self):
+		self.assertEqual(portscan.parsePorts('443-443'), [443])
+
+	def test_port_zero(self):
+		self.assertRaises(ValueError, portscan.parsePorts, '0-2')
+
+	def test_out_of_range(self):
+		self.assertRaises(ValueError, portscan.parsePorts, '65535-65536')
+
+	def test_reversed_range(self):
+		self.assertRaises(ValueError, portscan.parsePorts, '100-90')
+
+	def test_not_a_number(self):
+		self.assertRaises(ValueError, portscan.parsePorts, 'http')
+
+	def test_top_ports(self):
+		self.assertEqual(portscan.topPorts(3), [80, 23, 443])
+		self.assertEqual(len(portscan.topPorts()), 100)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,49 @@
+#!/usr/bin/python
+#
+# Shell tasks: exit status, cancel and timeout
+
+import Queue, time, unittest
+import runtime
+
+class ShellTaskTest(unittest.TestCase):
+
+	def setUp(self):
+		self.runtime = runtime.Runtime(Queue.Queue())
+
+	def tearDown(self):
+		self.runtime.shutdown()
+
+	def test_output_and_status(self):
+		task = self.runtime.shell('echo one', 'echo two; exit 3', 'echo never')
+		self.assertTrue(task.join(5))
+
+		self.assertEqual(task.returncode, 3)
+		self.assertEqual(task.lastLine, 'two')
+		self.assertEqual(task.result, 'one\ntwo')
+
+	def test_output_closed_before_exit(self):
+		task = self.runtime.shell('exec 1>&-; sleep .3; exit 4')
+		self.assertTrue(task.join(5))
+
+		self.assertEqual(task.returncode, 4)
+
+	# a killed command never reads as a success, however the threads race
+	def test_cancel(self):
+		for i in range(5):
+			task = self.runtime.shell('sleep 10')
+			time.sleep(.1)
+			task.cancel()
+
+			self.assertTrue(task.join(5))
+			self.assertFalse(task.returncode in (0, None))
+
+	def test_timeout(self):
+		for i in range(5):
+			task = self.runtime.shell('sleep 10', timeout=.2)
+
+			self.assertTrue(task.join(5))
+			self.assertTrue(task.timedOut)
+			self.assertFalse(task.returncode in (0, None))
+
+if __name__ == '__main__':
+	unittest.main()
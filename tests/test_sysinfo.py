@@ -0,0 +1,76 @@
+#!/usr/bin/python
+#
+# sysinfo parsers against saved copies of the files they read
+#
+# Run from the top of the tree with: python -m unittest discover -s tests -t .
+
+import os, unittest
+import sysinfo
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def fixture(*names):
+	return os.path.join(FIXTURES, *names)
+
+class RoutesTest(unittest.TestCase):
+
+	def test_routes(self):
+		table = sysinfo.routes(fixture('route'))
+
+		self.assertEqual(len(table), 5)
+		self.assertEqual(table[0], {
+			'interface': 'eth0',
+			'destination': '0.0.0.0',
+			'gateway': '192.168.1.1',
+			'mask': '0.0.0.0',
+			'flags': sysinfo.RTF_UP | sysinfo.RTF_GATEWAY,
+			'metric': 202,
+		})
+		self.assertEqual(table[3]['destination'], '192.168.1.0')
+		self.assertEqual(table[3]['mask'], '255.255.255.0')
+		self.assertEqual(table[3]['gateway'], '0.0.0.0')
+
+	def test_default_gateway_lowest_metric_that_is_up(self):
+		# usb0 has the lowest metric but is not up, eth0 beats wlan0
+		self.assertEqual(sysinfo.defaultGateway(fixture('route')), '192.168.1.1')
+
+	def test_no_default_gateway(self):
+		# only the subnet routes
+		self.assertEqual(sysinfo.defaultGateway(fixture('route.nodefault')), None)
+
+	def test_hex_to_ip(self):
+		self.assertEqual(sysinfo.hexToIP('0100000A'), '10.0.0.1')
+
+class ResolvConfTest(unittest.TestCase):
+
+	def test_nameservers_in_order(self):
+		self.assertEqual(sysinfo.nameservers(fixture('resolv.conf')), ['192.168.1.1', '8.8.8.8'])
+
+	def test_missing_file(self):
+		self.assertEqual(sysinfo.nameservers(fixture('missing.conf')), [])
+
+class MeminfoTest(unittest.TestCase):
+
+	def test_meminfo(self):
+		info = sysinfo.meminfo(fixture('meminfo'))
+
+		self.assertEqual(info['MemTotal'], 443504)
+		self.assertEqual(info['MemFree'], 181264)
+		self.assertEqual(info['HugePages_Total'], 0)
+		self.assertEqual(len(info), 8)
+
+class InterfacesTest(unittest.TestCase):
+
+	def test_interfaces(self):
+		self.assertEqual(sysinfo.interfaces(fixture('net')), [
+			{'name': 'eth0', 'mac': 'b8:27:eb:12:34:56', 'operstate': 'up', 'carrier': True, 'mtu': 1500},
+			{'name': 'lo', 'mac': '00:00:00:00:00:00', 'operstate': 'unknown', 'carrier': True, 'mtu': 65536},
+			# down, so it has no carrier file
+			{'name': 'wlan0', 'mac': '00:e0:4c:81:92:a3', 'operstate': 'down', 'carrier': False, 'mtu': 1500},
+		])
+
+	def test_read_missing_value(self):
+		self.assertEqual(sysinfo.readSysValue(fixture('net', 'wlan0', 'carrier')), None)
+
+if __name__ == '__main__':
+	unittest.main()
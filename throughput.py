@@ -0,0 +1,151 @@
+#!/usr/bin/python
+#
+# Interface throughput
+#
+# Samples the rx/tx byte counters under /sys/class/net/<if>/statistics and
+# turns them into smoothed bits per second. The counter files stay open and
+# are re-read from the start, so a sample is two lseek/read pairs and no
+# open(), cheap enough for 10 samples a second on a pi. Per second averages
+# go into a fixed size ring buffer for the sparkline.
+
+import os
+from clock import monotonic
+
+# samples per second, weight of a new sample in the smoothed rate, seconds per
+# history entry and how many entries are kept
+SAMPLE_RATE = 10
+ALPHA = .3
+HISTORY_INTERVAL = 1.0
+HISTORY = 60
+
+class Ring:
+
+	# the last 'size' values appended, in a list that is never resized
+	def __init__(self, size):
+		self.items = [0.0] * size
+		self.next = 0
+		self.count = 0
+
+	def append(self, value):
+		self.items[self.next] = value
+		self.next = (self.next + 1) % len(self.items)
+		self.count = min(self.count + 1, len(self.items))
+
+	# the newest 'n' values (all by default), oldest first
+	def values(self, n=None):
+		if ((n == None) or (n > self.count)):
+			n = self.count
+
+		start = self.next - n
+
+		if (start >= 0):
+			return self.items[start:self.next]
+
+		return self.items[start:] + self.items[:self.next]
+
+class CounterFile:
+
+	# a sysfs counter that is kept open and re-read
+	def __init__(self, path):
+		self.fd = os.open(path, os.O_RDONLY)
+
+	def read(self):
+		os.lseek(self.fd, 0, os.SEEK_SET)
+
+		return int(os.read(self.fd, 32))
+
+	def close(self):
+		os.close(self.fd)
+
+class RateMonitor:
+
+	def __init__(self, interface, root='/sys/class/net', alpha=ALPHA, history=HISTORY, interval=HISTORY_INTERVAL):
+		path = os.path.join(root, interface, 'statistics')
+
+		self.interface = interface
+		self.alpha = alpha
+		self.interval = interval
+		self.counters = {'rx': CounterFile(os.path.join(path, 'rx_bytes')), 'tx': CounterFile(os.path.join(path, 'tx_bytes'))}
+
+		# smoothed bits per second, and per interval averages for the sparkline
+		self.rates = {'rx': 0.0, 'tx': 0.0}
+		self.history = {'rx': Ring(history), 'tx': Ring(history)}
+
+		self.last = None
+		self.totals = {'rx': 0, 'tx': 0}
+		self.intervalStart = None
+
+	# read the counters and update the rates, returns the smoothed rates
+	def sample(self, now=None):
+		if (now == None):
+			now = monotonic()
+
+		values = {}
+		for name in self.counters:
+			values[name] = self.counters[name].read()
+
+		if (self.last == None):
+			self.last = (now, values)
+			self.intervalStart = (now, values)
+			return self.rates
+
+		then, previous = self.last
+		self.last = (now, values)
+
+		elapsed = now - then
+		if (elapsed <= 0):
+			return self.rates
+
+		for name in values:
+			delta = values[name] - previous[name]
+
+			# the counter was reset, eg the interface went down and up
+			if (delta < 0):
+				continue
+
+			rate = delta * 8 / elapsed
+			self.rates[name] += self.alpha * (rate - self.rates[name])
+
+		start, startValues = self.intervalStart
+
+		if ((now - start) >= self.interval):
+			for name in values:
+				self.history[name].append(max(values[name] - startValues[name], 0) * 8 / (now - start))
+
+			self.intervalStart = (now, values)
+
+		return self.rates
+
+	def close(self):
+		for counter in self.counters.values():
+			counter.close()
+
+# interfaces with statistics to sample, loopback last
+def rateInterfaces(root='/sys/class/net'):
+	names = [name for name in sorted(os.listdir(root)) if os.path.isdir(os.path.join(root, name, 'statistics'))]
+
+	return sorted(names, key=lambda name: name == 'lo')
+
+# a rate in at most 4 characters, eg 999, 1.2k, 45M
+def formatRate(bps):
+	for suffix, scale in (('G', 1e9), ('M', 1e6), ('k', 1e3)):
+		# anything that rounds to 1000 of the next smaller unit
+		if (bps >= scale * .9995):
+			value = bps / scale
+
+			if (value < 9.95):
+				return '%.1f%s' % (value, suffix)
+
+			return '%.0f%s' % (min(value, 999), suffix)
+
+	return '%d' % bps
+
+# values scaled to bar heights 0 to 'height', relative to the largest of them
+def levels(values, height=8):
+	top = max(values or [0])
+
+	if (top <= 0):
+		return [0] * len(values)
+
+	# anything above zero gets at least the lowest bar
+	return [max(int(round(value * height / top)), int(value > 0)) for value in values]